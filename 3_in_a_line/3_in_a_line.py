@@ -1,11 +1,28 @@
 import copy
+import os
+import random
 import sys
 import time
-from typing import Optional
+from typing import List, Optional
 
 import pygame
 import numpy as np
 
+import book
+import cache
+import endgame
+import mcts
+import solution
+import tracing
+
+# modules shared by the front-ends live in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import assets  # noqa: E402
+import hud  # noqa: E402
+import metrics  # noqa: E402
+import records  # noqa: E402
+import search  # noqa: E402
+
 
 class GameBoard:
     # difficulty
@@ -20,6 +37,8 @@ class GameBoard:
 
     # cell dimension
     CELL_SIZE = 80
+    # the cells of big boards are shrunk so that the canvas fits in this many pixels
+    MAX_CANVAS_SIZE = 800
 
     # canvas
     CANVAS = None
@@ -42,6 +61,24 @@ class GameBoard:
     CROSS_SPACE = 15
     CROSS_COLOR = pygame.color.Color(66, 66, 66)
 
+    # color for the available moves which would form 3 in a line
+    DANGER_COLOR = pygame.color.Color(200, 90, 80)
+
+    # rendering
+    # background with the grid, drawn once by init
+    BACKGROUND = None
+    # codes of the highlighted squares in the rendered cells
+    MOVE_HIGHLIGHT = 3
+    DANGER_HIGHLIGHT = 4
+    # pre-rendered sprite for each code
+    SPRITES = {}
+    # codes currently drawn on the canvas, by square
+    SHOWN = None
+    # rects of the canvas which changed since the last present
+    DIRTY_RECTS = []
+    # performance overlay, toggled with hud.KEY
+    HUD = hud.PerformanceHud()
+
     # player details
     MIN_P = None
     MAX_P = None
@@ -53,6 +90,27 @@ class GameBoard:
     # font
     GUI_FONT = None
 
+    # monte carlo tree search budget: number of playouts by difficulty (MAX_DEPTH)
+    # and maximum number of seconds for one move
+    MCTS_ITERATIONS = {1: 500, 3: 3000, 5: 12000}
+    MCTS_TIME_LIMIT = 10
+
+    # the exact endgame solver replaces the search when
+    # there are at most this many empty squares left
+    ENDGAME_EMPTY_SQUARES = 12
+
+    # the alpha_beta of this difficulty (MAX_DEPTH) searches SELECTIVE_DEPTH plies deep with
+    # SELECTIVITY (late move reductions, see search.Selectivity) when that environment
+    # variable is set: 8 wins 2 games out of 3 against the full width depth 5 but takes about
+    # 4 times longer, and within the time of depth 5 it's no stronger, so every difficulty
+    # searches full width by default
+    SELECTIVE_DIFFICULTY = 5
+    SELECTIVITY = search.Selectivity(search.reduction_table())
+
+    # zobrist keys by board dimensions, see position_hash
+    ZOBRIST = {}
+    ZOBRIST_SEED = 0x3141
+
     def __init__(self, matrix=None):
         """
         :param matrix: existing game_matrix
@@ -62,8 +120,14 @@ class GameBoard:
         else:
             self.matrix = matrix
 
+        # moves made by the search: whether each one formed 3 in a line
+        self.history = []
+        # zobrist hash of the board, updated by make / unmake
+        self.zobrist = None
+
     def available_square(self, row, col, player):
-        print(GameBoard.TURN)
+        if tracing.UI.debug:
+            tracing.UI.log(tracing.DEBUG, 'turn: %d', GameBoard.TURN)
         if self.__class__.TURN > 1:
             return self.matrix[row, col] == 0 and (row, col) in self.available_moves(player)
         else:
@@ -71,6 +135,7 @@ class GameBoard:
 
     def mark_square(self, row, col, player):
         self.matrix[row, col] = player
+        self.zobrist = None
 
     @classmethod
     def init(cls):
@@ -78,6 +143,13 @@ class GameBoard:
         cls.MIN_P = 2
 
         pygame.init()
+        # shrink the cells, and the symbols drawn in them, of big boards
+        if cls.CELL_SIZE * max(cls.BOARD_ROWS, cls.BOARD_COLS) > cls.MAX_CANVAS_SIZE:
+            cell_size = cls.MAX_CANVAS_SIZE // max(cls.BOARD_ROWS, cls.BOARD_COLS)
+            for name in ('LINE_WIDTH', 'CIRCLE_RADIUS', 'CIRCLE_WIDTH', 'CROSS_WIDTH', 'CROSS_SPACE'):
+                setattr(cls, name, max(1, getattr(cls, name) * cell_size // cls.CELL_SIZE))
+            cls.CELL_SIZE = cell_size
+
         cls.WIDTH = cls.CELL_SIZE * cls.BOARD_COLS
         cls.HEIGHT = cls.CELL_SIZE * cls.BOARD_ROWS
 
@@ -85,58 +157,124 @@ class GameBoard:
         cls.CANVAS = pygame.display.set_mode((cls.WIDTH, cls.HEIGHT))
 
         # fill the canvas with color and draw the lines
-        cls.CANVAS.fill(cls.GOOGLE_BG_COLOR)
-        cls.draw_lines()
+        cls.build_sprites()
+        cls.CANVAS.blit(cls.BACKGROUND, (0, 0))
+        cls.SHOWN = np.zeros((cls.BOARD_ROWS, cls.BOARD_COLS), dtype=np.int8)
+        cls.DIRTY_RECTS = [cls.CANVAS.get_rect()]
 
         # font details
         # TODO - GET AN ARCADE FONT
-        cls.GUI_FONT = pygame.font.Font(None, 30)
+        cls.GUI_FONT = assets.font(30)
 
         pygame.display.set_caption('NOT 3 in a line!')
 
     @classmethod
-    def draw_lines(cls):
+    def build_sprites(cls):
+        # background and grid are drawn once, a square is cleared by blitting
+        # the same area of the background over it
+        cls.BACKGROUND = pygame.Surface((cls.WIDTH, cls.HEIGHT))
+        cls.BACKGROUND.fill(cls.GOOGLE_BG_COLOR)
+        cls.draw_lines(cls.BACKGROUND)
+
+        cell = (cls.CELL_SIZE, cls.CELL_SIZE)
+        cross = pygame.Surface(cell, pygame.SRCALPHA)
+        cls.draw_cross(cross, 0, 0)
+
+        circle = pygame.Surface(cell, pygame.SRCALPHA)
+        cls.draw_circle(circle, 0, 0)
+
+        highlights = []
+        for color in (cls.LINE_COLOR, cls.DANGER_COLOR):
+            highlight = pygame.Surface(cell, pygame.SRCALPHA)
+            pygame.draw.rect(highlight, color, pygame.rect.Rect((10, 10), (cls.CELL_SIZE - 20, cls.CELL_SIZE - 20)),
+                             border_radius=10)
+            highlights.append(highlight)
+
+        cls.SPRITES = {1: cross, 2: circle, cls.MOVE_HIGHLIGHT: highlights[0], cls.DANGER_HIGHLIGHT: highlights[1]}
+
+    @classmethod
+    def draw_lines(cls, surface=None):
+        surface = surface or cls.CANVAS
         # draw lines for rows i.e. horizontal lines
         for index in range(cls.BOARD_ROWS + 1):
-            pygame.draw.line(cls.CANVAS, cls.LINE_COLOR,
+            pygame.draw.line(surface, cls.LINE_COLOR,
                              (0, index * cls.CELL_SIZE), (cls.WIDTH, index * cls.CELL_SIZE), cls.LINE_WIDTH)
 
         # draw lines for cols i.e. vertical lines
         for index in range(cls.BOARD_COLS + 1):
-            pygame.draw.line(cls.CANVAS, cls.LINE_COLOR,
+            pygame.draw.line(surface, cls.LINE_COLOR,
                              (index * cls.CELL_SIZE, 0), (index * cls.CELL_SIZE, cls.HEIGHT), cls.LINE_WIDTH)
 
+    @classmethod
+    def draw_cross(cls, surface, x, y):
+        pygame.draw.line(surface, cls.CROSS_COLOR,
+                         (x + cls.CROSS_SPACE, y + cls.CROSS_SPACE),
+                         (x + cls.CELL_SIZE - cls.CROSS_SPACE, y + cls.CELL_SIZE - cls.CROSS_SPACE),
+                         cls.CROSS_WIDTH)
+        pygame.draw.line(surface, cls.CROSS_COLOR,
+                         (x + cls.CELL_SIZE - cls.CROSS_SPACE, y + cls.CROSS_SPACE),
+                         (x + cls.CROSS_SPACE, y + cls.CELL_SIZE - cls.CROSS_SPACE),
+                         cls.CROSS_WIDTH)
+
+    @classmethod
+    def draw_circle(cls, surface, x, y):
+        pygame.draw.circle(surface, cls.CIRCLE_COLOR,
+                           (x + cls.CELL_SIZE // 2, y + cls.CELL_SIZE // 2),
+                           cls.CIRCLE_RADIUS,
+                           cls.CIRCLE_WIDTH)
+
+    @classmethod
+    def render_cells(cls, cells):
+        """
+        :param cells: array with the sprite wanted on each square (0 - nothing, 1 - X, 2 - O,
+        MOVE_HIGHLIGHT / DANGER_HIGHLIGHT); only the squares which changed are redrawn
+        """
+        for (row, col) in np.argwhere(cells != cls.SHOWN):
+            rect = pygame.Rect(col * cls.CELL_SIZE, row * cls.CELL_SIZE, cls.CELL_SIZE, cls.CELL_SIZE)
+            cls.CANVAS.blit(cls.BACKGROUND, rect, rect)
+            sprite = cls.SPRITES.get(cells[row, col])
+            if sprite is not None:
+                cls.CANVAS.blit(sprite, rect)
+            cls.DIRTY_RECTS.append(rect)
+        cls.SHOWN = cells
+
+    @classmethod
+    def present(cls):
+        # push only the squares redrawn since the last call to the screen
+        if cls.DIRTY_RECTS:
+            t_before = time.perf_counter()
+            hud_rect = cls.HUD.draw(cls.CANVAS)
+            if hud_rect:
+                cls.DIRTY_RECTS.append(hud_rect)
+            pygame.display.update(cls.DIRTY_RECTS)
+            cls.DIRTY_RECTS = []
+            cls.HUD.record_frame(time.perf_counter() - t_before)
+
+    @classmethod
+    def invalidate(cls):
+        # the canvas was drawn over, every square has to be redrawn by the next render
+        cls.SHOWN = np.full((cls.BOARD_ROWS, cls.BOARD_COLS), -1, dtype=np.int8)
+
+    @classmethod
+    def toggle_hud(cls):
+        if not cls.HUD.toggle():
+            # draw the squares under the overlay again
+            cells = cls.SHOWN
+            cls.invalidate()
+            cls.render_cells(cells)
+        cls.DIRTY_RECTS.append(cls.CANVAS.get_rect())
+        cls.present()
+
     def draw_figure(self):
-        # REDRAW THE ENTIRE GRID
-        # --------------------------------------------------------
-        self.__class__.CANVAS.fill(self.__class__.GOOGLE_BG_COLOR)
-        self.__class__.draw_lines()
-        # --------------------------------------------------------
-        for row in range(self.__class__.BOARD_ROWS):
-            for col in range(self.__class__.BOARD_COLS):
-                (x, y) = (col * self.__class__.CELL_SIZE, row * self.__class__.CELL_SIZE)
-                if self.matrix[row, col] == 1:
-                    pygame.draw.line(self.__class__.CANVAS, self.__class__.CROSS_COLOR,
-                                     (x + self.__class__.CROSS_SPACE, y + self.__class__.CROSS_SPACE),
-                                     (x + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE,
-                                      y + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE),
-                                     self.CROSS_WIDTH)
-                    pygame.draw.line(self.__class__.CANVAS, self.__class__.CROSS_COLOR,
-                                     (x + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE,
-                                      y + self.__class__.CROSS_SPACE), (x + self.__class__.CROSS_SPACE,
-                                            y + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE),
-                                     self.__class__.CROSS_WIDTH)
-                elif self.matrix[row, col] == 2:
-                    pygame.draw.circle(self.__class__.CANVAS, self.__class__.CIRCLE_COLOR,
-                                       (x + self.__class__.CELL_SIZE // 2, y + self.__class__.CELL_SIZE // 2),
-                                       self.__class__.CIRCLE_RADIUS,
-                                       self.__class__.CIRCLE_WIDTH)
+        # draw the symbols of the board, clearing any highlighted move
+        self.render_cells(self.matrix.astype(np.int8))
 
     def draw_winning_screen(self, player):
         self.__class__.CANVAS.fill(self.__class__.GOOGLE_BG_COLOR)
+        self.__class__.invalidate()
 
-        winner_label = self.__class__.GUI_FONT.render('WINNER: ', True, Menu.DEFAULT_FONT_COLOR)
-        draw_label = self.__class__.GUI_FONT.render('DRAW', True, Menu.DEFAULT_FONT_COLOR)
+        winner_label = assets.text('WINNER: ', 30, Menu.DEFAULT_FONT_COLOR)
+        draw_label = assets.text('DRAW', 30, Menu.DEFAULT_FONT_COLOR)
 
         screen_center = (self.__class__.BOARD_COLS * self.__class__.CELL_SIZE / 2,
                          self.__class__.BOARD_ROWS * self.__class__.CELL_SIZE / 2)
@@ -145,22 +283,10 @@ class GameBoard:
         (x, y) = (screen_center[0] - 45, screen_center[1] + 10)
         if player == 1:
             self.CANVAS.blit(winner_label, text_rect)
-            pygame.draw.line(self.__class__.CANVAS, self.__class__.CROSS_COLOR,
-                             (x + self.__class__.CROSS_SPACE, y + self.__class__.CROSS_SPACE),
-                             (x + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE,
-                              y + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE),
-                             self.CROSS_WIDTH)
-            pygame.draw.line(self.__class__.CANVAS, self.__class__.CROSS_COLOR,
-                             (x + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE,
-                              y + self.__class__.CROSS_SPACE), (x + self.__class__.CROSS_SPACE,
-                                                                y + self.__class__.CELL_SIZE - self.__class__.CROSS_SPACE),
-                             self.__class__.CROSS_WIDTH)
+            self.__class__.draw_cross(self.__class__.CANVAS, x, y)
         elif player == 2:
             self.CANVAS.blit(winner_label, text_rect)
-            pygame.draw.circle(self.__class__.CANVAS, self.__class__.CIRCLE_COLOR,
-                               (x + self.__class__.CELL_SIZE // 2, y + self.__class__.CELL_SIZE // 2),
-                               self.__class__.CIRCLE_RADIUS,
-                               self.__class__.CIRCLE_WIDTH)
+            self.__class__.draw_circle(self.__class__.CANVAS, x, y)
         else:
             self.CANVAS.blit(draw_label, text_rect)
 
@@ -168,6 +294,30 @@ class GameBoard:
     def adverse_player(cls, current_player):
         return cls.MIN_P if current_player == cls.MAX_P else cls.MAX_P
 
+    @classmethod
+    def zobrist_keys(cls, rows: int, cols: int):
+        """
+        :return: (squares, sides) - a random 64 bit key for each (square, symbol) pair,
+        the key of an empty square being 0, and a key for each player to move;
+        the keys are the same for every run so the hashes can be stored on disk
+        """
+        if (rows, cols) not in cls.ZOBRIST:
+            rng = np.random.default_rng([cls.ZOBRIST_SEED, rows, cols])
+            keys = rng.integers(0, np.iinfo(np.uint64).max, size=(rows * cols + 1, 3), dtype=np.uint64,
+                                endpoint=True)
+            keys[:, 0] = 0
+            cls.ZOBRIST[(rows, cols)] = (keys[:-1], keys[-1])
+        return cls.ZOBRIST[(rows, cols)]
+
+    def position_hash(self, player) -> int:
+        """
+        :param player: player to move
+        :return: 64 bit zobrist hash of the board and of the player to move
+        """
+        (squares, sides) = self.zobrist_keys(*self.matrix.shape)
+        cells = self.matrix.ravel().astype(np.intp)
+        return int(np.bitwise_xor.reduce(squares[np.arange(cells.size), cells]) ^ sides[int(player)])
+
     def is_board_full(self):
         for row in self.matrix:
             if 0 in row:
@@ -179,31 +329,57 @@ class GameBoard:
         :param player: player for whom available moves are computed
         :return: set containing all positions which can be marked by the current player
         """
-        l_moves = set()
-        for row in range(self.BOARD_ROWS):
-            for col in range(self.BOARD_COLS):
-                if self.matrix[row, col] == player:
-                    # check if generated neighbors are inside the grid
-                    l_moves.update([(x, y) for (x, y) in neighbors(row, col) if
-                                    0 <= x < GameBoard.BOARD_ROWS and 0 <= y < GameBoard.BOARD_COLS and self.matrix[
-                                        x, y] == 0])
-        # if l_moves is empty it means that the current player has never
-        # placed a symbol on a square, thus all squares are available for him
-        if not l_moves:
-            for row in range(self.BOARD_ROWS):
-                for col in range(self.BOARD_COLS):
-                    if not self.matrix[row, col]:
-                        l_moves.add((row, col))
-        print(f'[DEBUG] Current board:\n{self.matrix}')
-        print(f'[DEBUG] Possible moves:\n{l_moves} // len: {len(l_moves)} for player: {player}')
+        (moves, _) = self.move_masks(player)
+        l_moves = set(map(tuple, np.argwhere(moves).tolist()))
+        if tracing.MOVEGEN.debug:
+            tracing.MOVEGEN.log(tracing.DEBUG, 'current board:\n%s\npossible moves: %s // len: %d for player: %s',
+                                self.matrix.copy(), l_moves, len(l_moves), player)
         return l_moves
 
+    def move_masks(self, player):
+        """
+        :param player: player for whom the masks are computed
+        :return: (moves, danger) boolean arrays shaped like the board
+            moves - squares which can be marked by the player i.e. empty squares next to
+            one of his symbols, or every empty square if there is no such square
+            danger - empty squares which would complete 3 of his symbols in a line
+        """
+        empty = self.matrix == 0
+        own = self.matrix == player
+
+        if not own.any():
+            return empty, np.zeros_like(empty)
+
+        # pad the board so that every shifted view has the shape of the board
+        # (np.pad is several times slower than filling a new array)
+        padded = np.zeros((own.shape[0] + 4, own.shape[1] + 4), dtype=bool)
+        padded[2:-2, 2:-2] = own
+        own = padded
+
+        # binary dilation of the player's squares with a 3x3 kernel
+        dilated = np.zeros_like(empty)
+        for (x, y) in neighbors(0, 0):
+            dilated |= shifted(own, x, y)
+
+        danger = np.zeros_like(empty)
+        for (x, y) in LINE_DIRECTIONS:
+            before, after = shifted(own, -x, -y), shifted(own, x, y)
+            # the new symbol ends, continues or fills the gap of a pair
+            danger |= (before & shifted(own, -2 * x, -2 * y)) | (before & after) | (after & shifted(own, 2 * x, 2 * y))
+
+        moves = dilated & empty
+        # if the player can't play next to one of his symbols all squares are available for him
+        if not moves.any():
+            moves = empty
+        return moves, danger & empty
+
     def draw_available_moves(self, player):
-        available_moves = self.available_moves(player)
-        for move in available_moves:
-            pygame.draw.rect(self.__class__.CANVAS, self.__class__.LINE_COLOR,
-                             pygame.rect.Rect((move[1] * self.__class__.CELL_SIZE + 10,
-                                               move[0] * self.__class__.CELL_SIZE + 10), (60, 60)), border_radius=10)
+        (available_moves, danger) = self.move_masks(player)
+        cells = self.matrix.astype(np.int8)
+        cells[available_moves] = self.__class__.MOVE_HIGHLIGHT
+        # moves which lose on the spot are highlighted with a different color
+        cells[available_moves & danger] = self.__class__.DANGER_HIGHLIGHT
+        self.render_cells(cells)
 
     def boards_from_available_moves(self, player) -> dict:
         """
@@ -226,6 +402,19 @@ class GameBoard:
             boards[(x, y)] = GameBoard(board_copy)
         return boards
 
+    def classified_moves(self, player):
+        """
+        :param player: player for whom the moves are classified
+        :return: (safe, losing) - lists of the available moves which don't / do
+        form 3 of his symbols in a line i.e. lose on the spot
+        """
+        (moves, danger) = self.move_masks(player)
+        safe = list(map(tuple, np.argwhere(moves & ~danger).tolist()))
+        losing = list(map(tuple, np.argwhere(moves & danger).tolist()))
+        if tracing.MOVEGEN.debug:
+            tracing.MOVEGEN.log(tracing.DEBUG, 'safe moves: %s, losing moves: %s for player: %s', safe, losing, player)
+        return safe, losing
+
     def check_loss_condition(self, row: int, col: int) -> bool:
         """
         :param row:
@@ -265,7 +454,8 @@ class GameBoard:
             pass
 
         if vertical >= 3:
-            print(f'[DEBUG] Vertical - 3_IN_A_LINE _ from {(v_x_up, col)}: -> {(v_x_dw, col)}')
+            if tracing.EVAL.debug:
+                tracing.EVAL.log(tracing.DEBUG, 'vertical - 3_IN_A_LINE _ from %s: -> %s', (v_x_up, col), (v_x_dw, col))
             return True
 
         # check horizontal
@@ -292,7 +482,8 @@ class GameBoard:
             pass
 
         if horizontal >= 3:
-            print(f'[DEBUG] Horizontal - 3_IN_A_LINE _ from {(row, h_y_l)}: -> {(row, h_y_r)}')
+            if tracing.EVAL.debug:
+                tracing.EVAL.log(tracing.DEBUG, 'horizontal - 3_IN_A_LINE _ from %s: -> %s', (row, h_y_l), (row, h_y_r))
             return True
 
         # check first diagonal
@@ -330,7 +521,9 @@ class GameBoard:
             pass
 
         if first_diag >= 3:
-            print(f'[DEBUG] First diagonal - 3_IN_A_LINE _ from {(f_d_x_a, f_d_y_a)}: -> {(f_d_x_d, f_d_y_d)}')
+            if tracing.EVAL.debug:
+                tracing.EVAL.log(tracing.DEBUG, 'first diagonal - 3_IN_A_LINE _ from %s: -> %s',
+                                 (f_d_x_a, f_d_y_a), (f_d_x_d, f_d_y_d))
             return True
 
         # check second diagonal
@@ -366,21 +559,95 @@ class GameBoard:
             pass
 
         if second_diag >= 3:
-            print(f'[DEBUG] First diagonal - 3_IN_A_LINE _ from {(s_d_x_a, s_d_y_a)}: -> {(s_d_x_d, s_d_y_d)}')
+            if tracing.EVAL.debug:
+                tracing.EVAL.log(tracing.DEBUG, 'second diagonal - 3_IN_A_LINE _ from %s: -> %s',
+                                 (s_d_x_a, s_d_y_a), (s_d_x_d, s_d_y_d))
             return True
 
         return False
 
-    def estimate_score(self, depth):
-        t_final = self.final()
-        if t_final == self.__class__.MAX_P:
+    @classmethod
+    def final_estimation(cls, winner, depth):
+        """
+        :param winner: player who won, None for a draw
+        :return: estimation of a final board
+        """
+        if winner == cls.MAX_P:
             return 99 + depth
-        elif t_final == self.__class__.MIN_P:
+        elif winner == cls.MIN_P:
             return -99 + depth
-        elif t_final == 'DRAW':
-            return 0
-        else:
-            return 1
+        return 0
+
+    def mobility(self) -> float:
+        """
+        :return: estimation of a board which isn't final, in (-1, 1): the difference
+        between the numbers of moves of MAX_P and of MIN_P which don't lose on the spot
+        """
+        (moves, danger) = self.move_masks(self.MAX_P)
+        max_moves = np.count_nonzero(moves & ~danger)
+        (moves, danger) = self.move_masks(self.MIN_P)
+        min_moves = np.count_nonzero(moves & ~danger)
+        return (max_moves - min_moves) / (max_moves + min_moves + 1)
+
+    # search.Game protocol, a move is a (row, col) pair
+    def begin_search(self):
+        """
+        Forgets the moves made by a previous search and the hash, the matrix may have changed since
+        """
+        self.history = []
+        self.zobrist = None
+
+    def legal_moves(self, player) -> list:
+        # the losing moves all end the game with the same estimation so only
+        # one of them is searched, after the other moves
+        (safe, losing) = self.classified_moves(player)
+        return safe + losing[:1]
+
+    def forced_estimation(self, player, depth: int):
+        # a player whose every move forms 3 in a line has lost, the estimation is
+        # the one of the board after any of his moves
+        (moves, danger) = self.move_masks(player)
+        if (moves & ~danger).any():
+            return None
+        return self.final_estimation(self.adverse_player(player), depth - 1)
+
+    def make(self, move, player):
+        self.matrix[move] = player
+        self.history.append(self.check_loss_condition(*move))
+        if self.zobrist is not None:
+            (squares, _) = self.zobrist_keys(*self.matrix.shape)
+            self.zobrist ^= int(squares[move[0] * self.matrix.shape[1] + move[1], int(player)])
+
+    def unmake(self, move, player):
+        if self.zobrist is not None:
+            (squares, _) = self.zobrist_keys(*self.matrix.shape)
+            self.zobrist ^= int(squares[move[0] * self.matrix.shape[1] + move[1], int(player)])
+        self.matrix[move] = 0
+        self.history.pop()
+
+    def lost(self) -> bool:
+        """
+        :return: if the last move formed 3 in a line
+        """
+        return self.history[-1] if self.history else self.final() is True
+
+    def terminal(self) -> bool:
+        return self.lost() or self.matrix.all()
+
+    def evaluate(self, player, depth: int):
+        # the player to move wins when his opponent formed 3 in a line
+        if self.lost():
+            return self.final_estimation(player, depth)
+        elif self.matrix.all():
+            return self.final_estimation(None, depth)
+        return self.mobility()
+
+    def position_key(self, player) -> int:
+        if self.zobrist is None:
+            # the key of the player 0 is 0
+            self.zobrist = self.position_hash(0)
+        (_, sides) = self.zobrist_keys(*self.matrix.shape)
+        return self.zobrist ^ int(sides[int(player)])
 
     # KEEP CHECKING THIS METHOD
     def final(self):
@@ -416,17 +683,25 @@ def neighbors(x, y):
             (x + 1, y + 1)]  # (+1, +1)
 
 
+# one direction for each line through a square: horizontal, vertical and both diagonals
+LINE_DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+def shifted(mask, x, y):
+    """
+    :return: view of mask (padded with 2 rows/cols of False on each side) where
+    element [row, col] is the original element [row + x, col + y]
+    """
+    (rows, cols) = mask.shape
+    return mask[2 + x:rows - 2 + x, 2 + y:cols - 2 + y]
+
+
 class GameState:
     """
-        Class used by minimax and alpha-beta algorithms;
-        one instance of this class represents a node from the minmax/alpha-beta tree;
-        It stores the state of the game matrix
+        One node of the game: the game board and the player to move;
+        min_max and alpha_beta (run by the search module on the board itself)
+        set the estimation of the node and the state reached by the best move
         Its condition to be run is for the Game Class to have MIN_P & MAX_P initialized
-        it also requires Game Class to implement a function which returns a list
-        # of all the possible configurations after ones turn
-
-        Note to self - available_squares returns a list of tuples which contains
-        all the possible moves of the current player
     """
 
     def __init__(self, game_board: GameBoard, current_player: int, depth: int, parent=None, estimation=None):
@@ -443,20 +718,16 @@ class GameState:
         # if it's a final state i.e. one of the players lost or the best child move for the current player
         self.estimation = estimation
 
-        # list of possible moves from the current state
-        self.possible_moves: dict
-
         self.chosen_state: Optional[GameState] = None
 
-    def moves(self):
-        # dict of possible moves and corresponding game board
-        d_moves = self.game_board.boards_from_available_moves(self.current_player)
-        adverse_player = GameBoard.adverse_player(self.current_player)
-
-        # create a new possible game state object from each possible move
-        # d_state_moves = [GameState(move, adverse_player, self.depth - 1, self) for move in d_moves]
-        d_state_moves = {key: GameState(value, adverse_player, self.depth - 1, self) for key, value in d_moves.items()}
-        return d_state_moves
+    def choose(self, result: search.SearchResult):
+        """
+        Sets the estimation and the chosen state from the result of a search
+        """
+        if result.move is None:
+            self.estimation = result.estimation
+            return self
+        return choose_move(self, result.move, result.estimation)
 
 
 class Menu:
@@ -481,9 +752,9 @@ class Menu:
     @classmethod
     def init(cls):
         cls.WIDTH = 300
-        cls.HEIGHT = 400
+        cls.HEIGHT = 530
 
-        cls.GUI_FONT = pygame.font.Font(None, 30)
+        cls.GUI_FONT = assets.font(30)
         cls.DEFAULT_FONT_COLOR = pygame.color.Color(pygame.color.Color(239, 231, 200))
 
         cls.DEFAULT_BUTTON_COLOR = pygame.color.Color(23, 145, 135)
@@ -515,7 +786,7 @@ class Button:
         self.bottom_color = Menu.DEFAULT_BUTTON_COLOR_UNDER
 
         # text
-        self.text_surf = Menu.GUI_FONT.render(text, True, Menu.DEFAULT_FONT_COLOR)
+        self.text_surf = assets.text(text, 30, Menu.DEFAULT_FONT_COLOR)
         self.text_rect = self.text_surf.get_rect(center=self.top_rect.center)
 
     def draw(self):
@@ -572,88 +843,193 @@ class PlayerButton(Button):
         self.top_color = Menu.DEFAULT_BUTTON_COLOR
 
 
-def min_max(game_state: GameState) -> GameState:
+def solution_move(state: GameState, board_solution: Optional[solution.Solution]) -> Optional[GameState]:
+    """
+    :return: state with chosen_state set to the perfect move stored in the solution of
+    the board, None if the board hasn't been solved
+    """
+    if board_solution is None:
+        return None
+    entry = board_solution.probe(state.game_board.matrix, state.current_player)
+    if entry is None:
+        return None
+
+    (result, plies, move, score) = entry
+    if tracing.SEARCH.info:
+        tracing.SEARCH.log(tracing.INFO, 'solved position: %s in %d plies with %s', result, plies, move)
+    # the estimation of a state is from the point of view of MAX_P
+    return choose_move(state, move, score if state.current_player == GameBoard.MAX_P else -score)
+
+
+def opening_book_move(state: GameState, opening_book: Optional[book.OpeningBook]) -> Optional[GameState]:
+    """
+    :return: state with chosen_state set to the move stored in the opening book,
+    None if there's no book or the position isn't in it
+    """
+    if opening_book is None:
+        return None
+    entry = opening_book.probe(state.game_board, state.current_player)
+    if entry is None:
+        return None
+
+    ((row, col), estimation) = entry
+    (moves, _) = state.game_board.move_masks(state.current_player)
+    if not moves[row, col]:
+        # a book built for other rules
+        return None
+    # the book is searched with MAX_P = 1
+    if GameBoard.MAX_P != 1:
+        estimation = -estimation
+
+    if tracing.SEARCH.info:
+        tracing.SEARCH.log(tracing.INFO, 'opening book move %s, estimation %s', (row, col), estimation)
+    return choose_move(state, (row, col), estimation)
+
+
+def endgame_move(state: GameState, solver: Optional[endgame.EndgameSolver]) -> Optional[GameState]:
+    """
+    :return: state with chosen_state set to the move of the exact solver, None if
+    there are more than GameBoard.ENDGAME_EMPTY_SQUARES empty squares left
+    """
+    if solver is None or np.count_nonzero(state.game_board.matrix == 0) > GameBoard.ENDGAME_EMPTY_SQUARES:
+        return None
+
+    (result, plies, move, score) = solver.solve(state.game_board.matrix, state.current_player)
+    if tracing.SEARCH.info:
+        tracing.SEARCH.log(tracing.INFO, 'endgame solved: %s in %d plies with %s (%d nodes)',
+                           result, plies, move, solver.nodes)
+    # the estimation of a state is from the point of view of MAX_P
+    return choose_move(state, move, score if state.current_player == GameBoard.MAX_P else -score)
+
+
+def monte_carlo(state: GameState) -> GameState:
+    """
+    :return: state with chosen_state set to the move found by the monte carlo tree search
+    """
+    iterations = GameBoard.MCTS_ITERATIONS.get(GameBoard.MAX_DEPTH, GameBoard.MCTS_ITERATIONS[3])
+    (move, win_rate, done) = mcts.search(state.game_board.matrix, state.current_player, iterations,
+                                         GameBoard.MCTS_TIME_LIMIT)
+    if tracing.SEARCH.info:
+        tracing.SEARCH.log(tracing.INFO, 'mcts move %s, win rate %.3f after %d playouts', move, win_rate, done)
+    return choose_move(state, move, win_rate)
+
+
+def choose_move(state: GameState, move, estimation) -> GameState:
     """
-    :param game_state: parent GameState from which child nodes are derived
-    :return: GameState with the most favorable game_board i.e. with the best move
-    for the current player
+    :return: state with chosen_state set to the board obtained by marking move
     """
-    # if leaf level has been reached or a final state has been met
-
-    if game_state.depth == 0 or game_state.game_board.final():
-        # TODO - complete function
-        # TODO - create GameState::GameMatrix::estimate_score function
-        game_state.estimation = game_state.game_board.estimate_score(game_state.depth)
-        return game_state
-
-    # compute all possible moves from the current state
-    # dictionary: key: (x, y): coordinates of the last move
-    #             value: GameState: build from modified game_board
-    game_state.possible_moves = game_state.moves()
-
-    # apply min_max algorithm on each of the possible
-    # moves in order to create every possible subtree
-    estimated_moves = [min_max(move) for move in game_state.possible_moves.values()]
-
-    if game_state.current_player == GameBoard.MAX_P:
-        # pick the state with the max estimation
-        # if the current player is MIN_P i.e. the player most of the times
-        # -- tries to maximize the outcome
-        game_state.chosen_state = min(estimated_moves, key=lambda x: x.estimation)
-    else:
-        # pick the state with the min estimation
-        # if the current player is MIN_P i.e. the player
-        # -- tries to minimize
-        game_state.chosen_state = max(estimated_moves, key=lambda x: x.estimation)
-
-    game_state.estimation = game_state.chosen_state.estimation
-    return game_state
-
-
-def alpha_beta(alpha: int, beta: int, state: GameState) -> GameState:
-    # if leaf level has been reached or a final state has been met
-    if state.depth == 0 or state.game_board.final():
-        state.estimation = state.game_board.estimate_score(state.depth)
-        return state
-
-    # if it is in a valid interval than processing is no longer needed
-    if alpha > beta:
-        return state
-
-    if state.current_player == GameBoard.MAX_P:
-        current_estimation = float('-inf')
-
-        for move in state.moves().values():
-
-            # compute the estimation for the new state
-            # by building the corresponding subtree
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation < new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if alpha < new_state.estimation:
-                alpha = new_state.estimation
-                # invalid interval since alpha should always be less than beta
-                if alpha >= beta:
-                    break
-    elif state.current_player == GameBoard.MIN_P:
-        current_estimation = float('inf')
-
-        for move in state.moves().values():
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation > new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if beta > new_state.estimation:
-                if alpha >= beta:
-                    break
-
-    state.estimation = state.chosen_state.estimation
+    board = GameBoard(state.game_board.matrix.copy())
+    board.mark_square(*move, state.current_player)
+    state.chosen_state = GameState(board, GameBoard.adverse_player(state.current_player), state.depth - 1, state,
+                                   estimation)
+    state.estimation = estimation
     return state
 
 
+def selective_depth(algorithm: str) -> Optional[int]:
+    """
+    :return: depth of the selective search from SELECTIVE_DEPTH, None for a full width search
+    (other algorithm or difficulty, not set or not deeper than MAX_DEPTH)
+    """
+    value = os.environ.get('SELECTIVE_DEPTH', '')
+    if not value or algorithm != 'alpha_beta' or GameBoard.MAX_DEPTH != GameBoard.SELECTIVE_DIFFICULTY:
+        return None
+    try:
+        depth = int(value)
+    except ValueError:
+        depth = None
+    if depth is None or depth <= GameBoard.MAX_DEPTH:
+        print(f'SELECTIVE_DEPTH ignored, not a depth deeper than {GameBoard.MAX_DEPTH}: {value!r}', file=sys.stderr)
+        return None
+    return depth
+
+
+def save_record(writer: Optional[records.GameRecordWriter], moves: bytearray, algorithm: str, depth: int, seed: int,
+                result: int):
+    """
+    Appends the finished game to the record file, if recording is enabled (see records.py)
+
+    :param moves: index of the square marked by each move
+    :param depth: depth searched by the engine, deeper than MAX_DEPTH for a selective search
+    :param result: records.DRAW or the player who won
+    """
+    if writer is None:
+        return
+    (human, engine) = (records.PLAYERS.index('human'), records.PLAYERS.index(algorithm))
+    writer.append(records.GameRecord(records.NOT_3_IN_A_LINE, GameBoard.BOARD_ROWS, GameBoard.BOARD_COLS, 3,
+                                     GameBoard.MIN_P, human if GameBoard.MIN_P == 1 else engine,
+                                     human if GameBoard.MIN_P == 2 else engine, depth, result, seed,
+                                     bytes(moves)))
+
+
+def hovered_button(buttons, pos) -> Optional[Button]:
+    return next((button for button in buttons if button.top_rect.collidepoint(pos)), None)
+
+
+def wait_events(timeout: int = 0) -> list:
+    """
+    Blocks (without using the CPU) until an event arrives or timeout milliseconds pass
+
+    :param timeout: 0 to wait forever
+    :return: all the pending events
+    """
+    event = pygame.event.wait(timeout)
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
+
+
+def min_max(game_state: GameState) -> GameState:
+    """
+    :param game_state: state from which the moves are searched
+    :return: game_state with the most favorable game_board i.e. with the best move
+    for the current player (MAX_P maximizes the estimation, MIN_P minimizes it)
+    """
+    game_state.game_board.begin_search()
+    return game_state.choose(search.min_max(game_state.game_board, game_state.current_player, game_state.depth,
+                                            GameBoard.MAX_P))
+
+
+# the persistent cache (see cache.py) never mixes the results of different rules or
+# evaluations, change this when the estimations of alpha_beta change
+CACHE_VARIANT = 'not 3 in a line, v3'
+
+
+def cache_variant(selectivity: Optional[search.Selectivity] = None) -> str:
+    """
+    :return: variant of the persistent cache for the current board and MAX_P (the estimations
+    are from its point of view); the reduced searches of a selective alpha_beta are never
+    mixed with the full width ones
+    """
+    variant = f'{CACHE_VARIANT}, {GameBoard.BOARD_ROWS}x{GameBoard.BOARD_COLS}, MAX_P {GameBoard.MAX_P}'
+    return variant if selectivity is None else f'{variant}, {selectivity.variant()}'
+
+
+def alpha_beta(alpha: int, beta: int, state: GameState, table: Optional[dict] = None,
+               selectivity: Optional[search.Selectivity] = None) -> GameState:
+    """
+    :param table: optional transposition table (dict) shared between searches;
+    the root state is never answered from the table so chosen_state is always set;
+    a search.SearchTree kept for the game is continued from the search of the previous move
+    :param selectivity: late move reductions and futility pruning, None for a full width search
+    """
+    state.game_board.begin_search()
+    if isinstance(table, search.SearchTree):
+        ply = int(np.count_nonzero(state.game_board.matrix))
+        return state.choose(search.deepening(state.game_board, state.current_player, state.depth, GameBoard.MAX_P,
+                                             ply, table, alpha, beta, selectivity))
+    return state.choose(search.alpha_beta(state.game_board, state.current_player, state.depth, GameBoard.MAX_P,
+                                          alpha, beta, table, selectivity=selectivity))
+
+
+def top_moves(k: int, state: GameState, table: Optional[dict] = None) -> List[search.Variation]:
+    """
+    :return: the k best moves of the current player (at most), each with its estimation and
+    principal variation of (row, col) moves, found by a single alpha-beta search
+    """
+    state.game_board.begin_search()
+    return search.multi_pv(state.game_board, state.current_player, state.depth, GameBoard.MAX_P, k, table)
+
+
 def main():
     pygame.init()
     menu_canvas = Menu()
@@ -663,8 +1039,8 @@ def main():
     default_button = Button('START GAME', 200, 40, (Menu.WIDTH // 2 - 100, Menu.HEIGHT - 80), elevation=5)
 
     # USEFUL LABELS
-    symbol_label = Menu.GUI_FONT.render('Choose your symbol: ', True, Menu.DEFAULT_FONT_COLOR)
-    difficulty_label = Menu.GUI_FONT.render('Choose difficulty: ', True, Menu.DEFAULT_FONT_COLOR)
+    symbol_label = assets.text('Choose your symbol: ', 30, Menu.DEFAULT_FONT_COLOR)
+    difficulty_label = assets.text('Choose difficulty: ', 30, Menu.DEFAULT_FONT_COLOR)
 
     # PLAYER BUTTONS
     x_button = PlayerButton('X', 100, 60, (30, 60), elevation=5)
@@ -673,22 +1049,56 @@ def main():
     easy_difficulty_button = PlayerButton('EASY', 200, 30, (Menu.WIDTH // 2 - 100, 175), elevation=5)
     medium_difficulty_button = PlayerButton('MEDIUM', 200, 30, (Menu.WIDTH // 2 - 100, 215), elevation=5)
     hard_difficulty_button = PlayerButton('HARD', 200, 30, (Menu.WIDTH // 2 - 100, 255), elevation=5)
-    clock = pygame.time.Clock()
+
+    algorithm_label = assets.text('Choose algorithm: ', 30, Menu.DEFAULT_FONT_COLOR)
+    algorithm_buttons = {
+        'min_max': PlayerButton('MIN-MAX', 200, 30, (Menu.WIDTH // 2 - 100, 330), elevation=5),
+        'alpha_beta': PlayerButton('ALPHA-BETA', 200, 30, (Menu.WIDTH // 2 - 100, 370), elevation=5),
+        'mcts': PlayerButton('MONTE CARLO', 200, 30, (Menu.WIDTH // 2 - 100, 410), elevation=5),
+    }
+
+    buttons = [default_button, x_button, o_button,
+               easy_difficulty_button, medium_difficulty_button, hard_difficulty_button,
+               *algorithm_buttons.values()]
+    # the menu is only redrawn after a click or when the mouse moves onto / off a button
+    hovered = hovered_button(buttons, pygame.mouse.get_pos())
+    redraw = True
 
     # GAME INPUTS:
     human_player = -1
     max_depth = -1
+    algorithm = 'min_max'
 
     while True:
         if pygame.display.get_init():
-            for event in pygame.event.get():
+            # don't block before a pending redraw (e.g. the first frame)
+            for event in pygame.event.get() if redraw else wait_events():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
+                elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.WINDOWEXPOSED):
+                    redraw = True
+                elif event.type == pygame.MOUSEMOTION:
+                    now_hovered = hovered_button(buttons, event.pos)
+                    if now_hovered is not hovered:
+                        hovered = now_hovered
+                        redraw = True
+
+            if not redraw:
+                continue
+            redraw = False
 
             menu_canvas.MENU_CANVAS.fill(Menu.BACKGROUND_COLOR)
             menu_canvas.MENU_CANVAS.blit(symbol_label, (45, 25))
             menu_canvas.MENU_CANVAS.blit(difficulty_label, (60, 140))
+            menu_canvas.MENU_CANVAS.blit(algorithm_label, (60, 295))
+
+            for (name, button) in algorithm_buttons.items():
+                if button.draw():
+                    algorithm = name
+                    for other_button in algorithm_buttons.values():
+                        if other_button is not button:
+                            other_button.reset()
 
             if easy_difficulty_button.draw():
                 max_depth = 1
@@ -716,7 +1126,6 @@ def main():
                 human_player = 2
 
             pygame.display.update()
-            clock.tick(60)
 
     # x = int(input('NO ROWS: '))
     # y = int(input('NO COLS: '))
@@ -744,30 +1153,67 @@ def main():
     # TODO #7
     # create a menu for inputting all data & select game difficulty
 
-    GameBoard.BOARD_ROWS = 6
-    GameBoard.BOARD_COLS = 6
+    # optional board dimensions, e.g. `python 3_in_a_line.py 10 10`
+    GameBoard.BOARD_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    GameBoard.BOARD_COLS = int(sys.argv[2]) if len(sys.argv) > 2 else GameBoard.BOARD_ROWS
 
     # initialize the game board
     game_board = GameBoard()
 
     GameBoard.init()
     game_board.draw_figure()
-    pygame.display.flip()
+    GameBoard.present()
 
     GameBoard.MIN_P = human_player
     GameBoard.MAX_P = 2 if human_player == 1 else 1
 
     GameBoard.MAX_DEPTH = max_depth
-
-    current_state = GameState(game_board=game_board, current_player=game_board.MIN_P, depth=GameBoard.MAX_DEPTH)
+    # alpha_beta searches deeper, selectively, if SELECTIVE_DEPTH is set
+    selective = selective_depth(algorithm)
+    selectivity = None if selective is None else GameBoard.SELECTIVITY
+    depth = GameBoard.MAX_DEPTH if selective is None else selective
+
+    current_state = GameState(game_board=game_board, current_player=game_board.MIN_P, depth=depth)
+
+    # transposition table kept for the whole game, so the tree searched under the reply of
+    # the player is reused (SEARCH_TREE_MB caps it), backed by the file named by TT_CACHE if
+    # there is one
+    table = cache.open_table(cache_variant(selectivity))
+    engines = {'min_max': min_max, 'alpha_beta': lambda state: alpha_beta(-500, 500, state, table, selectivity),
+               'mcts': monte_carlo}
+
+    # perfect play on the small boards which were solved offline (see solution.py)
+    board_solution = solution.load(GameBoard.BOARD_ROWS, GameBoard.BOARD_COLS)
+    # best moves of the first plies, computed offline (see book.py)
+    opening_book = book.load(GameBoard.BOARD_ROWS, GameBoard.BOARD_COLS)
+    # perfect play once few squares are left, its table is kept for the whole game
+    endgame_solver = endgame.EndgameSolver(GameBoard.BOARD_ROWS, GameBoard.BOARD_COLS)
+
+    # the game is appended to the file named by GAME_RECORDS when it ends, with the
+    # seed of the random moves of the monte carlo search
+    writer = records.writer_from_env()
+    moves = bytearray()
+    # latency of the moves and counters, for METRICS_FILE / METRICS_PORT
+    exporter = metrics.exporter_from_env()
+    seed = random.randrange(1 << 63)
+    random.seed(seed)
 
     while True:
         if pygame.display.get_init():
             if current_state.current_player == GameBoard.MIN_P:
-                for event in pygame.event.get():
+                # sleep until the player does something
+                for event in wait_events():
                     if event.type == pygame.QUIT:
+                        cache.close_table(table)
+                        metrics.close_exporter(exporter)
                         pygame.quit()
                         sys.exit(0)
+                    # F12 writes the collected traces to stderr
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+                        tracing.dump()
+                    # F3 shows / hides the performance overlay
+                    if event.type == pygame.KEYDOWN and event.key == hud.KEY:
+                        GameBoard.toggle_hud()
                     if event.type == pygame.MOUSEBUTTONDOWN:
 
                         (x, y) = map(lambda pos: pos // GameBoard.CELL_SIZE, event.pos)
@@ -776,11 +1222,15 @@ def main():
                             current_state.game_board.mark_square(*(y, x), current_state.current_player)
                         else:
                             # game_board square not available
+                            if tracing.UI.info:
+                                tracing.UI.log(tracing.INFO, 'square not available: %s', (y, x))
                             print('=== :-) ===')
                             # don't continue running the code and listen
                             # to the next event
                             continue
+                        moves.append(y * GameBoard.BOARD_COLS + x)
                         current_state.game_board.draw_figure()
+                        GameBoard.present()
 
                         # the move was valid
                         GameBoard.LAST_MOVE = (y, x)
@@ -790,19 +1240,32 @@ def main():
             # other players turn i.e. computer's turn
             elif current_state.current_player == GameBoard.MAX_P:
                 t_before = time.time()
-                actualised_state = min_max(current_state)
+                GameBoard.HUD.begin_move()
+                token = metrics.begin_move()
+                actualised_state = solution_move(current_state, board_solution) \
+                    or opening_book_move(current_state, opening_book) \
+                    or endgame_move(current_state, endgame_solver) \
+                    or engines[algorithm](current_state)
+                metrics.record_move(metrics.end_move(token, metrics.NOT_3_IN_A_LINE, GameBoard.BOARD_ROWS,
+                                                     GameBoard.BOARD_COLS, current_state.depth, algorithm))
+                GameBoard.HUD.end_move(current_state.depth)
 
                 '''
                     current_state.game_board = actualised_state.chosen_state.game_board
                     AttributeError: 'NoneType' has no attribute 'game_board'
                 '''
+                moves.extend(np.flatnonzero(actualised_state.chosen_state.game_board.matrix
+                                            != current_state.game_board.matrix))
                 current_state.game_board = actualised_state.chosen_state.game_board
                 current_state.game_board.draw_figure()
-                pygame.display.flip()
+                GameBoard.present()
                 # pygame.display.update()
                 print(current_state.game_board.matrix)
                 t_after = time.time()
                 print(f'=== Computing took: {t_after - t_before} ===')
+                if tracing.SEARCH.info:
+                    tracing.SEARCH.log(tracing.INFO, 'depth %d, estimation %s, took %.4f s',
+                                       current_state.depth, actualised_state.estimation, t_after - t_before)
 
                 if current_state.game_board.final():
                     print(current_state.game_board.matrix)
@@ -812,14 +1275,22 @@ def main():
 
                 current_state.current_player = GameBoard.adverse_player(current_state.current_player)
                 current_state.game_board.draw_available_moves(current_state.current_player)
-                pygame.display.flip()
+                GameBoard.present()
                 GameBoard.TURN += 1
 
-            if current_state.game_board.final():
+            final = current_state.game_board.final()
+            if final:
+                # the player who moved last formed 3 in a line or filled the board
+                save_record(writer, moves, algorithm, depth, seed,
+                            records.DRAW if final == 'DRAW' else current_state.current_player)
+                metrics.record_game(metrics.NOT_3_IN_A_LINE, GameBoard.BOARD_ROWS, GameBoard.BOARD_COLS,
+                                    'draw' if final == 'DRAW' else 'XO'[current_state.current_player - 1])
                 current_state.game_board.draw_winning_screen(current_state.current_player)
                 pygame.display.flip()
 
                 time.sleep(5)
+                cache.close_table(table)
+                metrics.close_exporter(exporter)
                 pygame.quit()
                 sys.exit(0)
 
@@ -827,8 +1298,11 @@ def main():
             if current_state.game_board.is_board_full():
                 print('=== BOARD FULL ===')
                 GameBoard.CANVAS.fill(GameBoard.GOOGLE_BG_COLOR)
+                GameBoard.invalidate()
                 pygame.display.flip()
                 time.sleep(3)
+                cache.close_table(table)
+                metrics.close_exporter(exporter)
                 pygame.quit()
                 sys.exit(0)
 
@@ -0,0 +1,66 @@
+"""
+    Compact representation of the NOT 3 in a line rules
+
+    A position is kept as two bitboards (python ints, bit row * cols + col): the squares of
+    the player to move and the squares of his opponent. The rules are the ones of
+    GameBoard.available_moves / check_loss_condition:
+        - a player marks an empty square next to one of his symbols, or any empty square
+          if there's no such square
+        - a player who forms 3 of his symbols in a line loses
+        - the game is a draw when the board is full
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+class BitboardRules:
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << rows * cols) - 1
+
+        # masks used to shift a bitboard one column without wrapping around
+        self.not_first_col = sum(1 << (row * cols + col) for row in range(rows) for col in range(1, cols))
+        self.not_last_col = sum(1 << (row * cols + col) for row in range(rows) for col in range(cols - 1))
+
+        # for every square, the pairs of squares which form 3 in a line with it
+        self.loss_pairs = []
+        for row in range(rows):
+            for col in range(cols):
+                pairs = []
+                for (x, y) in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                    for offsets in [(-2, -1), (-1, 1), (1, 2)]:
+                        squares = [(row + x * offset, col + y * offset) for offset in offsets]
+                        if all(0 <= r < rows and 0 <= c < cols for (r, c) in squares):
+                            pairs.append(sum(1 << (r * cols + c) for (r, c) in squares))
+                self.loss_pairs.append(pairs)
+
+    def from_matrix(self, matrix: np.ndarray, player) -> Tuple[int, int]:
+        """
+        :return: (own, other) bitboards of a GameBoard matrix for the player to move
+        """
+        bits = 1 << np.arange(self.rows * self.cols, dtype=object)
+        cells = matrix.ravel()
+        return int(bits[cells == player].sum()), int(bits[(cells != player) & (cells != 0)].sum())
+
+    def moves(self, own: int, empty: int) -> int:
+        # dilation of the player's squares by one square in every direction
+        spread = own | ((own << 1) & self.not_first_col) | ((own >> 1) & self.not_last_col)
+        spread |= (spread << self.cols) | (spread >> self.cols)
+        return (spread & empty) or empty
+
+    def loses(self, square: int, own: int) -> bool:
+        return any(own & pair == pair for pair in self.loss_pairs[square])
+
+
+def squares(bitboard: int) -> List[int]:
+    """
+    :return: indices of the set bits of bitboard, in increasing order
+    """
+    result = []
+    while bitboard:
+        bit = bitboard & -bitboard
+        bitboard ^= bit
+        result.append(bit.bit_length() - 1)
+    return result
@@ -0,0 +1,165 @@
+"""
+    Opening book for the NOT 3 in a line game
+
+    The book maps the zobrist hash of a position (board + player to move) to the best move
+    found by a deep search and its estimation, from the point of view of player 1 (the
+    book is searched with MAX_P = 1 whatever the player to move). The file is a small header followed by
+    fixed-size records sorted by hash, so probing it is a binary search over a memory map.
+
+    Building a book (offline, can take a long time for deep searches):
+        python 3_in_a_line/book.py --rows 6 --cols 6 --plies 3 --depth 7 --processes 4
+"""
+import argparse
+import importlib
+import os
+import struct
+import sys
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+BOOK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# magic, version, rows, cols, number of records
+HEADER = struct.Struct('<4sHHHI')
+MAGIC = b'N3BK'
+VERSION = 2
+
+# move is the index of the square i.e. row * cols + col, score is the estimation
+# for MAX_P = 1 (a fraction of the mobility before the end of the game)
+RECORD_DTYPE = np.dtype([('hash', '<u8'), ('move', '<u2'), ('score', '<f4')])
+
+
+def book_path(rows: int, cols: int) -> str:
+    return os.path.join(BOOK_DIR, f'opening_book_{rows}x{cols}.bin')
+
+
+class OpeningBook:
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            (magic, version, self.rows, self.cols, count) = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an opening book (version {VERSION})')
+
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.hashes = self.records['hash']
+
+    def __len__(self):
+        return len(self.records)
+
+    def probe(self, game_board, player) -> Optional[Tuple[Tuple[int, int], float]]:
+        """
+        :return: ((row, col), estimation for MAX_P = 1) of the best move for player,
+        None if the position isn't in the book
+        """
+        if game_board.matrix.shape != (self.rows, self.cols):
+            return None
+
+        key = np.uint64(game_board.position_hash(player))
+        index = int(np.searchsorted(self.hashes, key))
+        if index == len(self.hashes) or self.hashes[index] != key:
+            return None
+        record = self.records[index]
+        return divmod(int(record['move']), self.cols), float(record['score'])
+
+
+def load(rows: int, cols: int) -> Optional[OpeningBook]:
+    """
+    :return: the book for the given board dimensions, None if it hasn't been built
+    """
+    path = book_path(rows, cols)
+    return OpeningBook(path) if os.path.exists(path) else None
+
+
+def write(path: str, rows: int, cols: int, records: np.ndarray) -> int:
+    """
+    :return: number of records written, only the first record of a hash is kept
+    """
+    records = np.sort(records, order='hash', kind='stable')
+    records = records[np.r_[True, records['hash'][1:] != records['hash'][:-1]]]
+    with open(path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, rows, cols, len(records)))
+        file.write(records.tobytes())
+    os.replace(path + '.tmp', path)
+    return len(records)
+
+
+def opening_positions(rows: int, cols: int, plies: int, first_player: int = 1):
+    """
+    :return: list of (matrix, player to move) of every position reachable
+    in less than plies moves from the empty board, without duplicates
+    """
+    engine = importlib.import_module('3_in_a_line')
+    game_board = engine.GameBoard
+    (game_board.BOARD_ROWS, game_board.BOARD_COLS) = (rows, cols)
+    (game_board.MAX_P, game_board.MIN_P) = (1, 2)
+
+    level = {game_board().position_hash(first_player): (game_board(), first_player)}
+    positions = []
+    for _ in range(plies):
+        positions.extend((board.matrix, player) for (board, player) in level.values())
+        next_level = {}
+        for (board, player) in level.values():
+            for (row, col) in board.available_moves(player):
+                child = game_board(board.matrix.copy())
+                child.mark_square(row, col, player)
+                # a move which forms 3 in a line ends the game
+                if child.check_loss_condition(row, col):
+                    continue
+                next_level.setdefault(child.position_hash(game_board.adverse_player(player)),
+                                      (child, game_board.adverse_player(player)))
+        level = next_level
+    return positions
+
+
+def build(rows: int, cols: int, plies: int, depth: int, processes: Optional[int] = None,
+          path: Optional[str] = None) -> int:
+    """
+    Searches every opening position and writes the book
+
+    :return: number of positions in the book
+    """
+    # the batch search lives in the root of the repository
+    sys.path.append(os.path.dirname(BOOK_DIR))
+    analysis = importlib.import_module('analysis')
+    engine = importlib.import_module('3_in_a_line')
+
+    # the opening can be played by either symbol
+    positions = opening_positions(rows, cols, plies, 1) + opening_positions(rows, cols, plies, 2)
+    records = np.zeros(len(positions), dtype=RECORD_DTYPE)
+
+    count = 0
+    results = analysis.best_moves([matrix for (matrix, _) in positions], [player for (_, player) in positions],
+                                  depth=depth, processes=processes)
+    for result in results:
+        if result.move is None:
+            continue
+        (matrix, player) = positions[result.index]
+        records[count] = (engine.GameBoard(matrix).position_hash(player),
+                          result.move[0] * cols + result.move[1], result.estimation)
+        count += 1
+
+    return write(path or book_path(rows, cols), rows, cols, records[:count])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the opening book of the NOT 3 in a line game')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--plies', type=int, default=3, help='number of opening plies stored in the book')
+    parser.add_argument('--depth', type=int, default=7, help='depth of the search for every position')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    t_before = time.time()
+    count = build(args.rows, args.cols, args.plies, args.depth, args.processes, args.output)
+    print(f'=== {count} positions written in {time.time() - t_before:.1f} s ===')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+    Persistent transposition table of the alpha-beta search, shared across sessions
+
+    The file is a header followed by a fixed number of buckets of SLOTS entries, memory
+    mapped so that only the probed buckets are read. An entry is keyed by a 64 bit hash of
+    the rule variant (with the board dimensions) and of the position (with the player to
+    move), holds the depth of its search and carries a crc32 of its content: entries torn
+    by a crash or by two concurrent games are ignored.
+
+    Every session which opens the file starts a new generation; entries not written during
+    the last MAX_AGE generations are stale and are replaced first. The size of the file
+    (i.e. the number of entries) is fixed when it is created.
+
+    Enabled with the TT_CACHE environment variable, e.g.
+        TT_CACHE=tt_cache.bin TT_CACHE_SIZE=64 python 3_in_a_line/3_in_a_line.py
+    (TT_CACHE_SIZE in MB, a different size starts a new file)
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+from typing import Optional
+
+import numpy as np
+
+import tracing
+
+# the search lives in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import search  # noqa: E402
+
+# magic, version, number of buckets, generation
+HEADER = struct.Struct('<4sHIH')
+MAGIC = b'N3TT'
+VERSION = 3
+
+SLOTS = 4
+SLOT_DTYPE = np.dtype([('key', '<u8'), ('score', '<f8'), ('depth', 'u1'), ('flag', 'u1'),
+                       ('generation', '<u2'), ('checksum', '<u4')])
+# the checksum covers the bytes before it
+CHECKED_BYTES = SLOT_DTYPE.fields['checksum'][1]
+
+DEFAULT_SIZE_MB = 32
+MAX_AGE = 64
+
+# only the results of searches at least this deep are stored on disk, the shallow
+# ones are cheaper to recompute than to look up
+MIN_DEPTH = 2
+
+
+class TranspositionCache:
+    def __init__(self, path: str, size_mb: float = DEFAULT_SIZE_MB):
+        buckets = max(1, int(size_mb * (1 << 20)) // (SLOTS * SLOT_DTYPE.itemsize))
+        size = HEADER.size + buckets * SLOTS * SLOT_DTYPE.itemsize
+
+        generation = 0
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            with open(path, 'rb') as file:
+                (magic, version, old_buckets, generation) = HEADER.unpack(file.read(HEADER.size))
+            if (magic, version, old_buckets) != (MAGIC, VERSION, buckets):
+                generation = None
+        else:
+            generation = None
+
+        if generation is None:
+            if tracing.SEARCH.info:
+                tracing.SEARCH.log(tracing.INFO, 'new transposition cache %s (%d buckets)', path, buckets)
+            with open(path, 'wb') as file:
+                file.truncate(size)
+            generation = 0
+
+        self.file = open(path, 'r+b')
+        self.data = mmap.mmap(self.file.fileno(), size)
+        self.generation = (generation + 1) & 0xffff
+        self.data[:HEADER.size] = HEADER.pack(MAGIC, VERSION, buckets, self.generation)
+        self.buckets = buckets
+        self.slots = np.frombuffer(self.data, dtype=SLOT_DTYPE, offset=HEADER.size).reshape(buckets, SLOTS)
+        self.hits = 0
+        self.stores = 0
+
+    def age(self, generation) -> int:
+        return (self.generation - int(generation)) & 0xffff
+
+    def valid(self, slot) -> bool:
+        return slot['key'] != 0 and self.age(slot['generation']) < MAX_AGE \
+            and zlib.crc32(slot.tobytes()[:CHECKED_BYTES]) == slot['checksum']
+
+    def probe(self, key: int):
+        """
+        :return: (depth, flag, score) stored for key, None if it isn't in the cache
+        """
+        for slot in self.slots[key % self.buckets]:
+            if slot['key'] == key and self.valid(slot):
+                self.hits += 1
+                return int(slot['depth']), int(slot['flag']), float(slot['score'])
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: float):
+        bucket = self.slots[key % self.buckets]
+        # the entry of the same key, an empty or stale slot, otherwise the shallowest
+        # entry of the oldest generation
+        replaced = None
+        for (index, slot) in enumerate(bucket):
+            if slot['key'] == key:
+                if self.valid(slot) and slot['depth'] > depth:
+                    return
+                replaced = index
+                break
+        if replaced is None:
+            replaced = min(range(SLOTS), key=lambda index: (self.valid(bucket[index]),
+                                                           -self.age(bucket[index]['generation']),
+                                                           bucket[index]['depth']))
+
+        entry = np.array((key, score, min(depth, 255), flag, self.generation, 0), dtype=SLOT_DTYPE)
+        entry['checksum'] = zlib.crc32(entry.tobytes()[:CHECKED_BYTES])
+        bucket[replaced] = entry
+        self.stores += 1
+
+    def close(self):
+        del self.slots
+        self.data.flush()
+        self.data.close()
+        self.file.close()
+
+
+class PersistentTable(search.SearchTree):
+    """
+    In-memory transposition table of search.alpha_beta backed by a TranspositionCache:
+    entries missing in memory are looked up on disk, and the deep entries stored
+    in memory are written to disk too (without their best move)
+    """
+
+    def __init__(self, disk: TranspositionCache, variant: str, max_mb: Optional[float] = None):
+        super().__init__(max_mb)
+        self.disk = disk
+        self.variant = variant.encode()
+
+    def disk_key(self, key) -> int:
+        digest = hashlib.blake2b(self.variant + repr(key).encode(), digest_size=8).digest()
+        # 0 marks the empty slots
+        return int.from_bytes(digest, 'little') or 1
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            entry = self.disk.probe(self.disk_key(key))
+            if entry is not None:
+                entry = (*entry, None)
+                # kept in memory without being written back
+                super().__setitem__(key, entry)
+        return default if entry is None else entry
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        (depth, flag, estimation, _) = value
+        if depth >= MIN_DEPTH:
+            self.disk.store(self.disk_key(key), depth, flag, estimation)
+
+
+def open_table(variant: str) -> dict:
+    """
+    :param variant: rules and scoring of the search, the entries of other variants are never used
+    :return: table backed by the file named by TT_CACHE, a search.SearchTree if there isn't one
+    """
+    path = os.environ.get('TT_CACHE')
+    if not path:
+        return search.SearchTree()
+    size_mb = float(os.environ.get('TT_CACHE_SIZE', DEFAULT_SIZE_MB))
+    return PersistentTable(TranspositionCache(path, size_mb), variant)
+
+
+def close_table(table: dict) -> Optional[int]:
+    """
+    :return: number of entries written to disk during the session, None if table isn't persistent
+    """
+    if not isinstance(table, PersistentTable):
+        return None
+    table.disk.close()
+    return table.disk.stores
@@ -0,0 +1,110 @@
+"""
+    Exact solver for the end of a NOT 3 in a line game
+
+    Positions are kept as bitboards, see bitboard.py.
+
+    Scores are from the point of view of the player to move: WIN - n for a win when the
+    game ends with n symbols on the board, -(WIN - n) for a loss and 0 for a draw. Every path
+    to a position has the same number of moves, so the scores can be shared through the
+    transposition table and a faster win (or a slower loss) still scores better.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+from bitboard import BitboardRules, squares
+
+WIN = 1000
+
+# flags of the transposition table entries
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+RESULTS = {1: 'WIN', -1: 'LOSS', 0: 'DRAW'}
+
+
+def distance(score: int, symbols: int) -> int:
+    """
+    :param symbols: number of symbols on the board
+    :return: number of plies until the end of the game, 0 for a draw
+    """
+    return WIN - abs(score) - symbols if score else 0
+
+
+class EndgameSolver(BitboardRules):
+    def __init__(self, rows: int, cols: int):
+        super().__init__(rows, cols)
+
+        # (own, other) -> (flag, score, best move)
+        self.table = {}
+        self.nodes = 0
+
+    def negamax(self, own: int, other: int, alpha: int, beta: int) -> Tuple[int, int]:
+        """
+        :return: (score, best square) of the position, the player to move owns own
+        """
+        self.nodes += 1
+        entry = self.table.get((own, other))
+        original_alpha = alpha
+        if entry is not None:
+            (flag, score, square) = entry
+            if flag == EXACT:
+                return score, square
+            elif flag == LOWER_BOUND:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score, square
+
+        empty = self.full & ~(own | other)
+        moves = self.moves(own, empty)
+
+        # moves which form 3 in a line lose right away, they are only
+        # played when every available move loses
+        safe = []
+        losing = None
+        for square in squares(moves):
+            if self.loses(square, own):
+                losing = square
+            else:
+                safe.append(square)
+
+        if not safe:
+            return -(WIN - bin(own | other).count('1') - 1), losing
+
+        best_score, best_square = -WIN, safe[0]
+        for square in safe:
+            new_own = own | (1 << square)
+            if new_own | other == self.full:
+                score = 0
+            else:
+                (score, _) = self.negamax(other, new_own, -beta, -alpha)
+                score = -score
+            if score > best_score:
+                best_score, best_square = score, square
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table[(own, other)] = (flag, best_score, best_square)
+        return best_score, best_square
+
+    def solve(self, matrix: np.ndarray, player) -> Tuple[str, int, Optional[Tuple[int, int]], int]:
+        """
+        :param matrix: GameBoard matrix, which must not be final
+        :param player: player to move
+        :return: (result, distance, move, score) - 'WIN' / 'LOSS' / 'DRAW' for player,
+        number of plies until the end of the game with perfect play, best (row, col) and the raw score
+        """
+        (own, other) = self.from_matrix(matrix, player)
+        (score, square) = self.negamax(own, other, -WIN, WIN)
+        move = divmod(square, self.cols) if square is not None else None
+        return RESULTS[(score > 0) - (score < 0)], distance(score, bin(own | other).count('1')), move, score
@@ -0,0 +1,175 @@
+"""
+    Monte Carlo Tree Search engine for the NOT 3 in a line game
+
+    The tree is stored in preallocated numpy arrays indexed by node id instead of one python
+    object per node; the children of a node are allocated as one contiguous block when the
+    node is expanded. Boards aren't stored in the tree, they are rebuilt by replaying the
+    moves from the root during the selection (positions are bitboards, see bitboard.py).
+"""
+import math
+import random
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from bitboard import BitboardRules, squares
+
+# exploration constant of UCT
+EXPLORATION = math.sqrt(2)
+
+# states of a node
+OPEN = 0
+# the move leading to the node formed 3 in a line, the player who made it lost
+LOST = 1
+# the move leading to the node filled the board
+DRAW = 2
+
+
+class MonteCarloTree:
+    def __init__(self, rules: BitboardRules, capacity: int = 200000):
+        """
+        :param capacity: maximum number of nodes of the tree
+        """
+        self.rules = rules
+        self.capacity = capacity
+
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        # square marked by the move leading to the node
+        self.move = np.full(capacity, -1, dtype=np.int16)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.n_children = np.zeros(capacity, dtype=np.int16)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        # sum of the rewards for the player who made the move leading to the node
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.size = 1
+
+    def expand(self, node: int, own: int, other: int) -> bool:
+        """
+        Allocates one child for every available move of the player who owns own
+
+        :return: False if there is no room left in the tree
+        """
+        moves = squares(self.rules.moves(own, self.rules.full & ~(own | other)))
+        if self.size + len(moves) > self.capacity:
+            return False
+
+        first = self.size
+        self.size += len(moves)
+        self.first_child[node] = first
+        self.n_children[node] = len(moves)
+        for (child, square) in enumerate(moves, first):
+            self.parent[child] = node
+            self.move[child] = square
+            if self.rules.loses(square, own):
+                self.state[child] = LOST
+            elif own | other | (1 << square) == self.rules.full:
+                self.state[child] = DRAW
+        return True
+
+    def select(self, node: int) -> int:
+        """
+        :return: child of node maximizing the UCT value, unvisited children first
+        """
+        first = self.first_child[node]
+        visits = self.visits[first:first + self.n_children[node]]
+        unvisited = np.flatnonzero(visits == 0)
+        if len(unvisited):
+            return first + int(unvisited[random.randrange(len(unvisited))])
+
+        values = self.rewards[first:first + len(visits)] / visits \
+            + EXPLORATION * np.sqrt(math.log(self.visits[node]) / visits)
+        return first + int(np.argmax(values))
+
+    def backpropagate(self, node: int, reward: float):
+        """
+        :param reward: reward of the playout for the player who made the move leading to node
+        """
+        while node != -1:
+            self.visits[node] += 1
+            self.rewards[node] += reward
+            reward = 1 - reward
+            node = self.parent[node]
+
+    def best_move(self) -> Tuple[int, float]:
+        """
+        :return: (square, win rate) of the most visited child of the root
+        """
+        first = self.first_child[0]
+        visits = self.visits[first:first + self.n_children[0]]
+        child = first + int(np.argmax(visits))
+        return int(self.move[child]), float(self.rewards[child] / max(self.visits[child], 1))
+
+
+def playout(rules: BitboardRules, own: int, other: int, heuristic: bool = True) -> float:
+    """
+    Plays random moves until the end of the game
+
+    :param heuristic: avoid moves which form 3 in a line while there are other moves
+    :return: reward for the player who owns own i.e. the player to move (1 win, 0.5 draw, 0 loss)
+    """
+    reward = 1.0
+    while True:
+        moves = squares(rules.moves(own, rules.full & ~(own | other)))
+        if heuristic:
+            random.shuffle(moves)
+            square = next((square for square in moves if not rules.loses(square, own)), moves[0])
+        else:
+            square = random.choice(moves)
+
+        if rules.loses(square, own):
+            return 1 - reward
+        own |= 1 << square
+        if own | other == rules.full:
+            return 0.5
+        (own, other) = (other, own)
+        reward = 1 - reward
+
+
+def search(matrix: np.ndarray, player, iterations: int = 10000, time_limit: Optional[float] = None,
+           heuristic: bool = True, capacity: int = 200000) -> Tuple[Tuple[int, int], float, int]:
+    """
+    :param matrix: GameBoard matrix, which must not be final
+    :param player: player to move
+    :param iterations: node budget i.e. number of playouts
+    :param time_limit: time budget in seconds, None for no limit
+    :return: ((row, col) of the best move, its win rate, number of iterations done)
+    """
+    (rows, cols) = matrix.shape
+    rules = BitboardRules(rows, cols)
+    tree = MonteCarloTree(rules, capacity)
+    (root_own, root_other) = rules.from_matrix(matrix, player)
+
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    done = 0
+    while done < iterations and (deadline is None or time.perf_counter() < deadline):
+        node = 0
+        (own, other) = (root_own, root_other)
+
+        # selection: walk down the expanded nodes, replaying their moves
+        while tree.n_children[node] and tree.state[node] == OPEN:
+            node = tree.select(node)
+            (own, other) = (other, own | (1 << int(tree.move[node])))
+
+        if tree.state[node] == LOST:
+            # the player who moved into node lost
+            reward = 0.0
+        elif tree.state[node] == DRAW:
+            reward = 0.5
+        else:
+            # expansion, then a playout from one of the new children
+            if tree.expand(node, own, other):
+                node = tree.select(node)
+                (own, other) = (other, own | (1 << int(tree.move[node])))
+                if tree.state[node] != OPEN:
+                    tree.backpropagate(node, 0.0 if tree.state[node] == LOST else 0.5)
+                    done += 1
+                    continue
+            # the player to move at node is the opponent of the player who moved into it
+            reward = 1 - playout(rules, own, other, heuristic)
+        tree.backpropagate(node, reward)
+        done += 1
+
+    (square, win_rate) = tree.best_move()
+    return divmod(square, cols), win_rate, done
@@ -0,0 +1,212 @@
+"""
+    Perft: number of move sequences of a given length from a position of the NOT 3 in a line game
+
+    A sequence stops where the game ends: a move which forms 3 in a line is counted, but
+    nothing is played after it, and neither after the move which fills the board. The
+    counts depend only on the rules, so they check that a faster board representation
+    (e.g. bitboard.py) plays exactly the same game as GameBoard, and the time
+    they take measures the raw speed of the move generation.
+
+    Positions are written one row after another, separated by '/', with '.' for an empty
+    square, followed by the player to move, e.g. 'X.../.O../..../.... X'.
+
+        python 3_in_a_line/perft.py --rows 5 --cols 5 --depth 4 --divide
+        python 3_in_a_line/perft.py --position 'X.../.O../..../.... X' --depth 5 --reference
+        python 3_in_a_line/perft.py --check
+"""
+import argparse
+import importlib
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from bitboard import BitboardRules, squares
+
+SYMBOLS = {'.': 0, 'X': 1, 'O': 2}
+
+# known-good counts, (position, depth) -> number of leaves; computed with both
+# implementations, a change in move generation must not change any of them
+KNOWN = {
+    ('..../..../..../.... X', 1): 16,
+    ('..../..../..../.... X', 2): 240,
+    ('..../..../..../.... X', 3): 1176,
+    ('..../..../..../.... X', 4): 5256,
+    ('..../..../..../.... X', 5): 31392,
+    ('..../..../..../.... X', 6): 139040,
+    ('..../..../..../.... X', 7): 722640,
+    ('...../...../...../...../..... X', 1): 25,
+    ('...../...../...../...../..... X', 2): 600,
+    ('...../...../...../...../..... X', 3): 3312,
+    ('...../...../...../...../..... X', 4): 17376,
+    ('...../...../...../...../..... X', 5): 125808,
+    ('...../...../...../...../..... X', 6): 712272,
+    ('....../....../....../....../....../...... X', 1): 36,
+    ('....../....../....../....../....../...... X', 2): 1260,
+    ('....../....../....../....../....../...... X', 3): 7480,
+    ('....../....../....../....../....../...... X', 4): 43000,
+    ('....../....../....../....../....../...... X', 5): 344800,
+    # midgame positions
+    ('XO../.XO./..../.... X', 4): 366,
+    ('XO../.XO./..../.... X', 6): 3176,
+    ('X.O../.O.X./..X../O..../..... O', 4): 4973,
+    ('X.O../.O.X./..X../O..../..... O', 5): 28138,
+    ('XX.O../O..X../.O..../...XO./...... X', 4): 18225,
+    ('XX.O../O..X../.O..../...XO./...... X', 5): 171176,
+    # every sequence ends before the 4th move
+    ('XXOX/OO.X/X.O./.XO. O', 3): 7,
+    ('XXOX/OO.X/X.O./.XO. O', 4): 0,
+}
+
+
+def parse(position: str) -> Tuple[np.ndarray, int]:
+    """
+    :return: (matrix, player to move) of a position in the notation of the module
+    """
+    (board, player) = position.split()
+    matrix = np.array([[SYMBOLS[symbol] for symbol in row] for row in board.split('/')], dtype=float)
+    return matrix, SYMBOLS[player]
+
+
+def notation(matrix: np.ndarray, player: int) -> str:
+    names = {value: symbol for (symbol, value) in SYMBOLS.items()}
+    return '/'.join(''.join(names[int(cell)] for cell in row) for row in matrix) + ' ' + names[player]
+
+
+class BitboardPerft(BitboardRules):
+    def perft(self, own: int, other: int, depth: int) -> int:
+        """
+        :param own: squares of the player to move, the position must not be final
+        """
+        moves = self.moves(own, self.full & ~(own | other))
+        if depth == 1:
+            return bin(moves).count('1')
+
+        count = 0
+        for square in squares(moves):
+            new_own = own | (1 << square)
+            # nothing is played after the last move of the game
+            if self.loses(square, own) or new_own | other == self.full:
+                continue
+            count += self.perft(other, new_own, depth - 1)
+        return count
+
+    def divide(self, own: int, other: int, depth: int) -> Dict[Tuple[int, int], int]:
+        """
+        :return: perft of depth - 1 after each move, by (row, col)
+        """
+        counts = {}
+        for square in squares(self.moves(own, self.full & ~(own | other))):
+            new_own = own | (1 << square)
+            final = self.loses(square, own) or new_own | other == self.full
+            if depth == 1:
+                counts[divmod(square, self.cols)] = 1
+            else:
+                counts[divmod(square, self.cols)] = 0 if final else self.perft(other, new_own, depth - 1)
+        return counts
+
+
+def reference_perft(game_board, player, depth: int) -> int:
+    """
+    Perft with the GameBoard of the game itself, much slower than BitboardPerft
+    """
+    moves = game_board.available_moves(player)
+    if depth == 1:
+        return len(moves)
+
+    count = 0
+    for (row, col) in moves:
+        game_board.mark_square(row, col, player)
+        if not game_board.check_loss_condition(row, col) and not game_board.matrix.all():
+            count += reference_perft(game_board, game_board.adverse_player(player), depth - 1)
+        game_board.matrix[row, col] = 0
+    return count
+
+
+def reference_divide(game_board, player, depth: int) -> Dict[Tuple[int, int], int]:
+    counts = {}
+    for (row, col) in sorted(game_board.available_moves(player)):
+        if depth == 1:
+            counts[(row, col)] = 1
+            continue
+        game_board.mark_square(row, col, player)
+        final = game_board.check_loss_condition(row, col) or game_board.matrix.all()
+        counts[(row, col)] = 0 if final else reference_perft(game_board, game_board.adverse_player(player), depth - 1)
+        game_board.matrix[row, col] = 0
+    return counts
+
+
+def divide(matrix: np.ndarray, player: int, depth: int, reference: bool = False) -> Dict[Tuple[int, int], int]:
+    """
+    :param reference: count with GameBoard instead of the bitboards
+    :return: perft of depth - 1 after each move of player, by (row, col); their sum is the perft of depth
+    """
+    (rows, cols) = matrix.shape
+    if reference:
+        engine = importlib.import_module('3_in_a_line')
+        (engine.GameBoard.BOARD_ROWS, engine.GameBoard.BOARD_COLS) = (rows, cols)
+        (engine.GameBoard.MAX_P, engine.GameBoard.MIN_P) = (1, 2)
+        return reference_divide(engine.GameBoard(matrix.copy()), player, depth)
+
+    rules = BitboardPerft(rows, cols)
+    return rules.divide(*rules.from_matrix(matrix, player), depth)
+
+
+def perft(matrix: np.ndarray, player: int, depth: int, reference: bool = False) -> int:
+    return sum(divide(matrix, player, depth, reference).values())
+
+
+def check(reference: bool = False, max_leaves: Optional[int] = None) -> bool:
+    """
+    Recomputes the known counts
+
+    :param max_leaves: skips the counts above this, the reference implementation is slow
+    :return: if every count matches
+    """
+    passed = True
+    for ((position, depth), expected) in KNOWN.items():
+        if max_leaves is not None and expected > max_leaves:
+            continue
+        (matrix, player) = parse(position)
+        t_before = time.perf_counter()
+        count = perft(matrix, player, depth, reference)
+        elapsed = time.perf_counter() - t_before
+        status = 'ok' if count == expected else f'FAILED, expected {expected}'
+        passed &= count == expected
+        print(f'{position} depth {depth}: {count} ({elapsed:.2f} s) {status}')
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Count the move sequences of the NOT 3 in a line game')
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--cols', type=int, default=4)
+    parser.add_argument('--position', default=None, help="e.g. 'X.../.O../..../.... X', the empty board if not given")
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--divide', action='store_true', help='print the count after each first move')
+    parser.add_argument('--reference', action='store_true', help='count with GameBoard instead of the bitboards')
+    parser.add_argument('--check', action='store_true', help='recompute the known-good counts')
+    parser.add_argument('--max-leaves', type=int, default=None, help='skip the known counts above this')
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check(args.reference, args.max_leaves) else 1)
+
+    if args.position:
+        (matrix, player) = parse(args.position)
+    else:
+        (matrix, player) = (np.zeros((args.rows, args.cols)), 1)
+
+    t_before = time.perf_counter()
+    counts = divide(matrix, player, args.depth, args.reference)
+    elapsed = time.perf_counter() - t_before
+    if args.divide:
+        for ((row, col), count) in sorted(counts.items()):
+            print(f'{row} {col}: {count}')
+    total = sum(counts.values())
+    print(f'=== perft({args.depth}) of {notation(matrix, player)}: {total} '
+          f'in {elapsed:.2f} s ({total / max(elapsed, 1e-9):.0f} leaves/s) ===')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+    Measures the selective search of alpha_beta (search.Selectivity) on the NOT 3 in a line game
+
+    --positions N compares the selective search with the full width one on N random
+    positions: nodes, time and how often both play the same move, at the depth of the full
+    width search and at the deeper depth of the selective one.
+
+    --match N plays N games (N / 2 random openings, each played with both colors) of the
+    selective search against the full width alpha_beta, both with a table kept for the
+    game and the endgame solver near the end, like in the game; it prints the win rate of
+    the selective search (a draw counts half) and the time per move of each side. With
+    --seconds S the selective search deepens from the full width depth up to its own one
+    while it expects to end within S seconds (search.deepening), to compare at equal time.
+
+    --openings times the first reply of each search to every first move.
+
+        python 3_in_a_line/selective.py --positions 20 --depth 5 --selective-depth 8
+        python 3_in_a_line/selective.py --match 20 --depth 5 --selective-depth 8 --base 0.5 --divisor 2
+        python 3_in_a_line/selective.py --match 40 --selective-depth 8 --seconds 0.2 --openings
+"""
+import argparse
+import importlib
+import os
+import random
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+import endgame
+import perft
+from bitboard import BitboardRules, squares
+
+# the search lives in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import search  # noqa: E402
+
+
+def engine_module():
+    module = importlib.import_module('3_in_a_line')
+    (module.GameBoard.MAX_P, module.GameBoard.MIN_P) = (1, 2)
+    return module
+
+
+def random_positions(rows: int, cols: int, count: int, plies: range, seed: int = 0) -> List[str]:
+    """
+    :return: positions (in the notation of perft.py) reached by random moves which don't lose
+    """
+    rng = random.Random(seed)
+    rules = BitboardRules(rows, cols)
+    positions = []
+    while len(positions) < count:
+        (own, other) = (0, 0)
+        length = rng.choice(plies)
+        for _ in range(length):
+            safe = [square for square in squares(rules.moves(own, rules.full & ~(own | other)))
+                    if not rules.loses(square, own)]
+            if not safe:
+                break
+            (own, other) = (other, own | (1 << rng.choice(safe)))
+        else:
+            player = 1 if length % 2 == 0 else 2
+            matrix = np.zeros((rows, cols))
+            for square in squares(own):
+                matrix[divmod(square, cols)] = player
+            for square in squares(other):
+                matrix[divmod(square, cols)] = 2 if player == 1 else 1
+            positions.append(perft.notation(matrix, player))
+    return positions
+
+
+def searched(module, matrix: np.ndarray, player, depth: int, table: dict,
+             selectivity: Optional[search.Selectivity]):
+    """
+    :return: (search.SearchResult, nodes, seconds) of alpha_beta on the position
+    """
+    board = module.GameBoard(matrix.copy())
+    board.begin_search()
+    nodes = search.STATS.nodes
+    t_before = time.perf_counter()
+    result = search.alpha_beta(board, player, depth, module.GameBoard.MAX_P, -500, 500, table,
+                               selectivity=selectivity)
+    return result, search.STATS.nodes - nodes, time.perf_counter() - t_before
+
+
+def compare_positions(positions: List[str], depth: int, selective_depth: int, selectivity: search.Selectivity,
+                      full_width_deep: bool = True) -> List[str]:
+    """
+    :param full_width_deep: also search at selective_depth without selectivity, which can be very slow
+    :return: the lines of the report
+    """
+    module = engine_module()
+    searches = [('full width', depth, None), ('selective', depth, selectivity)]
+    if full_width_deep:
+        searches.append(('full width', selective_depth, None))
+    searches.append(('selective', selective_depth, selectivity))
+
+    (rows, reference) = ([], None)
+    for (label, search_depth, settings) in searches:
+        (nodes, seconds, moves) = (0, 0.0, [])
+        for position in positions:
+            (matrix, player) = perft.parse(position)
+            (module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS) = matrix.shape
+            (result, position_nodes, position_seconds) = searched(module, matrix, player, search_depth,
+                                                                  search.SearchTree(), settings)
+            (nodes, seconds) = (nodes + position_nodes, seconds + position_seconds)
+            moves.append(result.move)
+
+        row = f'{label:>10} depth {search_depth}: {nodes:>10,} nodes {seconds:8.2f} s'
+        if reference is None:
+            reference = moves
+        else:
+            same = sum(move == reference_move for (move, reference_move) in zip(moves, reference))
+            row += f'   same move as the full width depth {depth}: {same}/{len(positions)}'
+        rows.append(row)
+    return rows
+
+
+def deepened(module, matrix: np.ndarray, player, depth: int, deepest: int, seconds: Optional[float],
+             tree: search.SearchTree, selectivity: Optional[search.Selectivity]):
+    """
+    :return: (search.SearchResult, depth reached) of the search of the game, continuing tree
+    """
+    board = module.GameBoard(matrix.copy())
+    board.begin_search()
+    ply = int(np.count_nonzero(matrix))
+    result = search.deepening(board, player, depth, module.GameBoard.MAX_P, ply, tree, -500, 500, selectivity,
+                              deepest, seconds)
+    return result, tree.horizon - ply
+
+
+def play(module, opening: str, engines, solver: endgame.EndgameSolver):
+    """
+    :param engines: (depth, deepest, seconds, selectivity) of the search of players 1 and 2
+    :return: (winner, None for a draw, [seconds of the moves of player 1], [... of player 2])
+    """
+    (matrix, player) = perft.parse(opening)
+    trees = {1: search.SearchTree(), 2: search.SearchTree()}
+    times = {1: [], 2: []}
+    while True:
+        t_before = time.perf_counter()
+        if np.count_nonzero(matrix == 0) <= module.GameBoard.ENDGAME_EMPTY_SQUARES:
+            (_, _, move, _) = solver.solve(matrix, player)
+        else:
+            (depth, deepest, seconds, selectivity) = engines[player - 1]
+            (result, _) = deepened(module, matrix, player, depth, deepest, seconds, trees[player], selectivity)
+            move = result.move
+        times[player].append(time.perf_counter() - t_before)
+
+        board = module.GameBoard(matrix)
+        board.mark_square(*move, player)
+        other = 2 if player == 1 else 1
+        if board.check_loss_condition(*move):
+            return other, times[1], times[2]
+        if matrix.all():
+            return None, times[1], times[2]
+        player = other
+
+
+def timing(times: List[float]) -> str:
+    return (f'mean {np.mean(times) * 1000:.0f} ms, 90th percentile {np.percentile(times, 90) * 1000:.0f} ms, '
+            f'max {np.max(times) * 1000:.0f} ms')
+
+
+def match(rows: int, cols: int, games: int, depth: int, selective_depth: int, selectivity: search.Selectivity,
+          seconds: Optional[float] = None, seed: int = 0):
+    """
+    :param seconds: time budget of the selective search, which searches to depth and deeper up
+    to selective_depth within it; always to selective_depth if not given
+    """
+    module = engine_module()
+    (module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS) = (rows, cols)
+    solver = endgame.EndgameSolver(rows, cols)
+    openings = random_positions(rows, cols, max(1, games // 2), range(2, 5), seed)
+    if seconds is None:
+        selective = (selective_depth, selective_depth, None, selectivity)
+    else:
+        selective = (depth, selective_depth, seconds, selectivity)
+    full_width = (depth, depth, None, None)
+
+    (score, wins, draws, losses) = (0.0, 0, 0, 0)
+    (selective_times, full_width_times) = ([], [])
+    for game in range(games):
+        opening = openings[game // 2]
+        # the selective search plays player 1 in the even games, player 2 in the odd ones
+        selective_player = 1 if game % 2 == 0 else 2
+        engines = (selective, full_width) if selective_player == 1 else (full_width, selective)
+        (winner, times_1, times_2) = play(module, opening, engines, solver)
+
+        selective_times += times_1 if selective_player == 1 else times_2
+        full_width_times += times_2 if selective_player == 1 else times_1
+        if winner is None:
+            (score, draws) = (score + 0.5, draws + 1)
+        elif winner == selective_player:
+            (score, wins) = (score + 1, wins + 1)
+        else:
+            losses += 1
+        print(f'game {game + 1}: {opening}, selective plays {"X" if selective_player == 1 else "O"}: '
+              f'{"draw" if winner is None else "won" if winner == selective_player else "lost"}', flush=True)
+
+    budget = '' if seconds is None else f' within {seconds:.2f} s'
+    return [f'selective depth {selective_depth}{budget} against full width depth {depth}: '
+            f'+{wins} ={draws} -{losses}, win rate {score / games:.1%}',
+            f'time per move of the selective search: {timing(selective_times)}',
+            f'time per move of the full width search: {timing(full_width_times)} (endgame solver moves included)']
+
+
+def opening_moves(rows: int, cols: int, depth: int, selective_depth: int, selectivity: search.Selectivity,
+                  seconds: Optional[float] = None) -> List[str]:
+    """
+    :return: the lines of the report of the time of the first reply of each search, to every
+    first move (the slowest moves of a game, searched with an empty tree)
+    """
+    module = engine_module()
+    (module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS) = (rows, cols)
+    if seconds is None:
+        engines = [('full width', depth, depth, None, None), ('selective', selective_depth, selective_depth, None,
+                                                                selectivity)]
+    else:
+        engines = [('full width', depth, depth, None, None), ('selective', depth, selective_depth, seconds,
+                                                                selectivity)]
+    rows_report = []
+    for (label, search_depth, deepest, budget, settings) in engines:
+        (times, reached) = ([], [])
+        for square in range(rows * cols):
+            matrix = np.zeros((rows, cols))
+            matrix[divmod(square, cols)] = 1
+            t_before = time.perf_counter()
+            (_, depth_reached) = deepened(module, matrix, 2, search_depth, deepest, budget, search.SearchTree(),
+                                          settings)
+            times.append(time.perf_counter() - t_before)
+            reached.append(depth_reached)
+        rows_report.append(f'{label:>10} first replies: {timing(times)}, depth {min(reached)} to {max(reached)}')
+    return rows_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the selective alpha-beta search')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--depth', type=int, default=5, help='depth of the full width search')
+    parser.add_argument('--selective-depth', type=int, default=8, help='depth of the selective search')
+    parser.add_argument('--base', type=float, default=0.5, help='reductions: base + ln(depth) ln(move) / divisor')
+    parser.add_argument('--divisor', type=float, default=2.0)
+    parser.add_argument('--full-depth-moves', type=int, default=3, help='moves never reduced')
+    parser.add_argument('--margin', type=float, default=None,
+                        help='futility margin (experimental, off in every engine), none if not given')
+    parser.add_argument('--positions', type=int, default=0, help='compare the searches on this many random positions')
+    parser.add_argument('--skip-full-width-deep', action='store_true',
+                        help="don't search the positions at the selective depth without selectivity")
+    parser.add_argument('--match', type=int, default=0, help='play this many games between the searches')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='time budget of the selective search, which then searches to --depth and deeper up to '
+                             '--selective-depth within it')
+    parser.add_argument('--openings', action='store_true', help='time the first reply of each search to every move')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    selectivity = search.Selectivity(search.reduction_table(args.base, args.divisor), args.full_depth_moves,
+                                     futility_margin=args.margin)
+    print(f'=== {selectivity.reductions[args.selective_depth][:12]}... plies reduced at depth '
+          f'{args.selective_depth}, futility margin {args.margin} ===')
+    if args.positions:
+        positions = random_positions(args.rows, args.cols, args.positions,
+                                     range(4, args.rows * args.cols // 2), args.seed)
+        search.STATS.reset()
+        for row in compare_positions(positions, args.depth, args.selective_depth, selectivity,
+                                     not args.skip_full_width_deep):
+            print(row)
+        stats = search.STATS
+        print(f'{stats.reductions:,} reduced searches, {stats.re_searches:,} searched again, '
+              f'{stats.futility_prunes:,} moves pruned before the horizon')
+    if args.match:
+        for row in match(args.rows, args.cols, args.match, args.depth, args.selective_depth, selectivity,
+                         args.seconds, args.seed):
+            print(row)
+    if args.openings:
+        for row in opening_moves(args.rows, args.cols, args.depth, args.selective_depth, selectivity, args.seconds):
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+    Batched random playouts of the NOT 3 in a line game
+
+    All the games are advanced in lockstep: the boards are one (games, rows, cols) int8 array
+    and every step computes the adjacency masks, samples one move per game and checks the
+    loss condition for all the games still running with numpy operations.
+
+    Benchmark: python 3_in_a_line/simulator.py --rows 6 --cols 6
+    Self-play records (see records.py): python 3_in_a_line/simulator.py --record games.bin --games 100000
+"""
+import argparse
+import os
+import sys
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# one direction for each line through a square: horizontal, vertical and both diagonals
+LINE_DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+# constants of splitmix64, which scores the squares of the games played from their own seed
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+class Playouts(NamedTuple):
+    # 0 for a draw, otherwise the player who won (the other one formed 3 in a line)
+    outcomes: np.ndarray
+    # number of moves played in each game
+    lengths: np.ndarray
+    # final boards, (games, rows, cols)
+    boards: np.ndarray
+    # squares (row * cols + col) marked by each move, -1 after the end of the game
+    moves: np.ndarray
+
+
+def seeded_scores(seeds: np.ndarray, moves_played: np.ndarray, squares: int) -> np.ndarray:
+    """
+    :param seeds: seed of every game (uint64)
+    :param moves_played: number of moves already played in every game
+    :return: (games, squares) scores in [0, 1) which only depend on the seed of the game,
+    the number of the move and the square, so a game is replayed from its seed alone
+    """
+    counters = moves_played.astype(np.uint64)[:, None] * np.uint64(squares) + np.arange(1, squares + 1,
+                                                                                         dtype=np.uint64)
+    mixed = seeds[:, None] + counters * GOLDEN_GAMMA
+    mixed = (mixed ^ (mixed >> np.uint64(30))) * MIX_1
+    mixed = (mixed ^ (mixed >> np.uint64(27))) * MIX_2
+    mixed ^= mixed >> np.uint64(31)
+    return (mixed >> np.uint64(11)) * 2.0 ** -53
+
+
+def simulate(games: int, rows: int, cols: int, first_player: int = 1,
+             boards: Optional[np.ndarray] = None, rng: Optional[np.random.Generator] = None,
+             seeds: Optional[np.ndarray] = None) -> Playouts:
+    """
+    :param games: number of games played at once
+    :param first_player: player to move in every game
+    :param boards: optional starting boards (games, rows, cols), empty boards if not given
+    :param rng: numpy random generator, for reproducible playouts
+    :param seeds: optional seed of every game (instead of rng), the game played from a seed
+    is the same in any batch e.g. simulate(1, rows, cols, seeds=np.array([seed], dtype=np.uint64))
+    """
+    rng = rng or np.random.default_rng()
+    squares = rows * cols
+    # 2 squares of padding on each side, so that every neighbour up to 2 squares away
+    # can be read with a shifted slice or an offset index
+    padded = np.zeros((games, rows + 4, cols + 4), dtype=np.int8)
+    if boards is not None:
+        padded[:, 2:-2, 2:-2] = boards
+
+    outcomes = np.zeros(games, dtype=np.int8)
+    lengths = np.zeros(games, dtype=np.int16)
+    moves = np.full((games, squares), -1, dtype=np.int16)
+
+    # indices of the games still running and their player to move
+    active = np.arange(games)
+    # games whose board is already full are draws
+    active = active[(padded[active, 2:-2, 2:-2] == 0).reshape(len(active), -1).any(axis=1)]
+    player = np.full(len(active), first_player, dtype=np.int8)
+
+    while len(active):
+        board = padded[active]
+        own = board == player[:, None, None]
+        empty = board[:, 2:-2, 2:-2] == 0
+
+        # binary dilation of the player's squares, limited to the empty squares
+        available = np.zeros_like(empty)
+        for x in (-1, 0, 1):
+            for y in (-1, 0, 1):
+                available |= own[:, 2 + x:rows + 2 + x, 2 + y:cols + 2 + y]
+        available &= empty
+        # players who can't play next to one of their symbols can play anywhere
+        blocked = ~available.reshape(len(active), -1).any(axis=1)
+        available[blocked] = empty[blocked]
+
+        # uniform choice among the available squares
+        if seeds is None:
+            scores = rng.random((len(active), squares))
+        else:
+            scores = seeded_scores(seeds[active], lengths[active], squares)
+        scores[~available.reshape(len(active), -1)] = -1
+        square = scores.argmax(axis=1)
+        (row, col) = np.divmod(square, cols)
+
+        padded[active, row + 2, col + 2] = player
+        moves[active, lengths[active]] = square
+        lengths[active] += 1
+
+        # 3 in a line through the new symbol: it ends, continues or fills the gap of a pair
+        own = padded[active] == player[:, None, None]
+        index = np.arange(len(active))
+        lost = np.zeros(len(active), dtype=bool)
+        for (x, y) in LINE_DIRECTIONS:
+            (before_1, before_2, after_1, after_2) = (own[index, row + 2 + x * k, col + 2 + y * k]
+                                                      for k in (-1, -2, 1, 2))
+            lost |= (before_1 & before_2) | (before_1 & after_1) | (after_1 & after_2)
+
+        full = ~(padded[active, 2:-2, 2:-2] == 0).reshape(len(active), -1).any(axis=1)
+        outcomes[active[lost]] = 3 - player[lost]
+
+        running = ~(lost | full)
+        active = active[running]
+        player = 3 - player[running]
+
+    return Playouts(outcomes, lengths, padded[:, 2:-2, 2:-2].copy(), moves)
+
+
+def benchmark(rows: int, cols: int, batch_sizes=(1, 10, 100, 1000, 10000), seconds: float = 1.0):
+    """
+    Prints the number of playouts per second for every batch size
+    """
+    rng = np.random.default_rng(0)
+    print(f'{"batch":>8} {"playouts/s":>12} {"mean length":>12} {"draws":>8}')
+    for batch_size in batch_sizes:
+        played = 0
+        draws = 0
+        total_length = 0
+        t_before = time.perf_counter()
+        while time.perf_counter() - t_before < seconds:
+            result = simulate(batch_size, rows, cols, rng=rng)
+            played += batch_size
+            draws += int(np.count_nonzero(result.outcomes == 0))
+            total_length += int(result.lengths.sum())
+        elapsed = time.perf_counter() - t_before
+        print(f'{batch_size:>8} {played / elapsed:>12.0f} {total_length / played:>12.2f} {draws / played:>8.2%}')
+
+
+def record(path: str, games: int, rows: int, cols: int, seed: int, batch_size: int = 10000) -> int:
+    """
+    Appends random self-play games to a record file
+
+    :param seed: seed of the run, which draws the seed of every game: a record is
+    replayed with simulate(1, rows, cols, seeds=np.array([record.seed], dtype=np.uint64))
+    :return: number of games written
+    """
+    # the record format is shared with the other front-ends, in the root of the repository
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import records
+
+    rng = np.random.default_rng(seed)
+    written = 0
+    with records.GameRecordWriter(path) as writer:
+        while written < games:
+            seeds = rng.integers(1 << 63, size=min(batch_size, games - written), dtype=np.uint64)
+            result = simulate(len(seeds), rows, cols, seeds=seeds)
+            for (game_seed, outcome, length, moves) in zip(seeds, result.outcomes, result.lengths, result.moves):
+                writer.append(records.GameRecord(records.NOT_3_IN_A_LINE, rows, cols, 3, 1,
+                                                 records.PLAYERS.index('random'), records.PLAYERS.index('random'),
+                                                 0, int(outcome), int(game_seed),
+                                                 moves[:length].astype(np.uint8).tobytes()))
+            written += len(result.outcomes)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Random playouts of the NOT 3 in a line game')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent on every batch size')
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--record', default=None, help='append self-play games to this record file instead')
+    parser.add_argument('--games', type=int, default=10000, help='number of recorded games')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.record:
+        t_before = time.perf_counter()
+        count = record(args.record, args.games, args.rows, args.cols, args.seed)
+        print(f'=== {count} games written in {time.perf_counter() - t_before:.1f} s ===')
+    else:
+        benchmark(args.rows, args.cols, args.batches, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+"""
+    Strong solution of small NOT 3 in a line boards
+
+    Every position reachable from the empty board is solved by retrograde analysis: the
+    positions are enumerated layer by layer (a layer holds the positions with the same
+    number of symbols), then scored from the last layer back to the empty board, each
+    position taking the best score of its moves. Positions are kept as bitboards of the
+    player to move and of his opponent (see bitboard.py), so X and O share their positions,
+    and only the smallest of the symmetric images of a position is kept.
+
+    Scores are the ones of endgame.py: WIN - n for a win when the game ends with n symbols
+    on the board, -(WIN - n) for a loss and 0 for a draw, from the point of view of the
+    player to move. The stored scores are a proof of the solution: each of them follows
+    from the scores of the next layer (check it with --verify).
+
+    Every layer is saved in a work directory as soon as it is done, so an interrupted run
+    resumes where it stopped. The solution itself is a compressed .npz file probed by the
+    game for perfect play:
+        python 3_in_a_line/solution.py --rows 5 --cols 5
+        python 3_in_a_line/solution.py --rows 5 --cols 5 --verify 1000
+
+    The keys pack both bitboards in 64 bits, so boards have at most 32 squares
+    (4x4, 5x5, 4x8 ...); 6x6 doesn't fit, and its positions wouldn't fit in memory either.
+"""
+import argparse
+import os
+import random
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import endgame
+from bitboard import BitboardRules, squares
+
+SOLUTION_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSION = 1
+
+MAX_SQUARES = 32
+
+
+def solution_path(rows: int, cols: int) -> str:
+    return os.path.join(SOLUTION_DIR, f'solution_{rows}x{cols}.npz')
+
+
+def work_dir(rows: int, cols: int) -> str:
+    return os.path.join(SOLUTION_DIR, f'solution_{rows}x{cols}.work')
+
+
+class PositionSpace(BitboardRules):
+    """
+    The rules of bitboard.py applied to numpy arrays of positions at once
+    """
+
+    def __init__(self, rows: int, cols: int):
+        if rows * cols > MAX_SQUARES:
+            raise ValueError(f'only boards with at most {MAX_SQUARES} squares can be solved')
+        super().__init__(rows, cols)
+        self.size = rows * cols
+
+        # images of every square by the symmetries of the board, only
+        # the square boards can be transposed
+        images = [lambda row, col: (row, col),
+                  lambda row, col: (rows - 1 - row, col),
+                  lambda row, col: (row, cols - 1 - col),
+                  lambda row, col: (rows - 1 - row, cols - 1 - col)]
+        if rows == cols:
+            images += [lambda row, col: (col, row),
+                       lambda row, col: (cols - 1 - col, row),
+                       lambda row, col: (col, rows - 1 - row),
+                       lambda row, col: (cols - 1 - col, rows - 1 - row)]
+
+        # a bitboard is transformed one byte at a time, with a table of the images of every byte
+        self.byte_tables = []
+        for image in images:
+            target = [image(*divmod(square, cols)) for square in range(self.size)]
+            tables = np.zeros((-(-self.size // 8), 256), dtype=np.uint64)
+            for byte in range(len(tables)):
+                for value in range(256):
+                    for bit in range(8):
+                        square = byte * 8 + bit
+                        if value >> bit & 1 and square < self.size:
+                            (row, col) = target[square]
+                            tables[byte, value] |= np.uint64(1 << (row * cols + col))
+            self.byte_tables.append(tables)
+
+        self.array_full = np.uint64(self.full)
+        self.array_not_first_col = np.uint64(self.not_first_col)
+        self.array_not_last_col = np.uint64(self.not_last_col)
+        self.array_loss_pairs = [[np.uint64(pair) for pair in pairs] for pairs in self.loss_pairs]
+
+    def split(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (own, other) bitboards of the keys
+        """
+        return keys & self.array_full, keys >> np.uint64(self.size)
+
+    def canonical(self, own: np.ndarray, other: np.ndarray) -> np.ndarray:
+        """
+        :return: key of each position, the smallest key of its symmetric images
+        """
+        keys = None
+        for tables in self.byte_tables:
+            (new_own, new_other) = (np.zeros_like(own), np.zeros_like(other))
+            for (byte, table) in enumerate(tables):
+                shift = np.uint64(8 * byte)
+                new_own |= table[(own >> shift) & np.uint64(0xff)]
+                new_other |= table[(other >> shift) & np.uint64(0xff)]
+            image_keys = new_own | (new_other << np.uint64(self.size))
+            keys = image_keys if keys is None else np.minimum(keys, image_keys)
+        return keys
+
+    def array_moves(self, own: np.ndarray, other: np.ndarray) -> np.ndarray:
+        """
+        :return: bitboards of the available moves, see BitboardRules.moves
+        """
+        one = np.uint64(1)
+        cols = np.uint64(self.cols)
+        empty = self.array_full & ~(own | other)
+        spread = own | ((own << one) & self.array_not_first_col) | ((own >> one) & self.array_not_last_col)
+        spread |= (spread << cols) | (spread >> cols)
+        moves = spread & empty
+        return np.where(moves == 0, empty, moves)
+
+    def array_loses(self, square: int, own: np.ndarray) -> np.ndarray:
+        loses = np.zeros(own.shape, dtype=bool)
+        for pair in self.array_loss_pairs[square]:
+            loses |= (own & pair) == pair
+        return loses
+
+    def children(self, keys: np.ndarray, square: int):
+        """
+        :return: (index, child keys, losing, filling) for the positions of keys where square is
+        an available move: the index of the position, the key of the position after the move
+        (its player to move owns the other bitboard), if the move forms 3 in a line and if it
+        fills the board
+        """
+        (own, other) = self.split(keys)
+        bit = np.uint64(1 << square)
+        index = np.flatnonzero(self.array_moves(own, other) & bit)
+        (own, other) = (own[index], other[index])
+        losing = self.array_loses(square, own)
+        own |= bit
+        filling = (own | other) == self.array_full
+        return index, self.canonical(other, own), losing, filling
+
+
+class Solver:
+    def __init__(self, rows: int, cols: int, directory: Optional[str] = None):
+        self.space = PositionSpace(rows, cols)
+        self.directory = directory or work_dir(rows, cols)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def checkpoint(self, name: str, array: np.ndarray):
+        path = os.path.join(self.directory, name)
+        # np.save adds the extension to names without it
+        np.save(path + '.tmp.npy', array)
+        os.replace(path + '.tmp.npy', path)
+
+    def saved(self, name: str) -> Optional[np.ndarray]:
+        path = os.path.join(self.directory, name)
+        return np.load(path) if os.path.exists(path) else None
+
+    def layers(self) -> List[np.ndarray]:
+        """
+        :return: sorted keys of the positions reachable from the empty board, by number of symbols
+        """
+        layers = []
+        for symbols in range(self.space.size):
+            keys = self.saved(f'layer_{symbols:02d}.npy')
+            if keys is None:
+                t_before = time.time()
+                keys = self.next_layer(layers[-1]) if layers else np.zeros(1, dtype=np.uint64)
+                self.checkpoint(f'layer_{symbols:02d}.npy', keys)
+                print(f'layer {symbols}: {len(keys)} positions ({time.time() - t_before:.1f} s)')
+            if not len(keys):
+                break
+            layers.append(keys)
+        return layers
+
+    def next_layer(self, keys: np.ndarray) -> np.ndarray:
+        # the game goes on after the moves which neither lose nor fill the board
+        next_keys = [np.zeros(0, dtype=np.uint64)]
+        for square in range(self.space.size):
+            (_, child_keys, losing, filling) = self.space.children(keys, square)
+            next_keys.append(np.unique(child_keys[~losing & ~filling]))
+        return np.unique(np.concatenate(next_keys))
+
+    def scores(self, layers: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        :return: scores of the positions of every layer, from the point of view of the player to move
+        """
+        scores = [None] * len(layers)
+        for symbols in reversed(range(len(layers))):
+            saved = self.saved(f'scores_{symbols:02d}.npy')
+            if saved is not None:
+                scores[symbols] = saved
+                continue
+
+            t_before = time.time()
+            keys = layers[symbols]
+            best = np.full(len(keys), -endgame.WIN, dtype=np.int16)
+            for square in range(self.space.size):
+                (index, child_keys, losing, filling) = self.space.children(keys, square)
+                # forming 3 in a line loses right away, filling the board is a draw
+                score = np.where(losing, -(endgame.WIN - symbols - 1), 0).astype(np.int16)
+                going_on = ~losing & ~filling
+                if going_on.any():
+                    position = np.searchsorted(layers[symbols + 1], child_keys[going_on])
+                    score[going_on] = -scores[symbols + 1][position]
+                np.maximum.at(best, index, score)
+            scores[symbols] = best
+            self.checkpoint(f'scores_{symbols:02d}.npy', best)
+            print(f'scores of layer {symbols} ({time.time() - t_before:.1f} s)')
+        return scores
+
+    def solve(self, path: str) -> int:
+        """
+        Solves every position and writes the solution
+
+        :return: number of positions in the solution
+        """
+        layers = self.layers()
+        scores = self.scores(layers)
+        keys = np.concatenate(layers)
+        values = np.concatenate(scores)
+        order = np.argsort(keys)
+        write(path, self.space.rows, self.space.cols, keys[order], values[order])
+        return len(keys)
+
+
+def write(path: str, rows: int, cols: int, keys: np.ndarray, scores: np.ndarray):
+    """
+    :param keys: sorted keys
+    """
+    # the differences between sorted keys are small numbers, they compress much better than the keys;
+    # the number of symbols when the game ends fits in a byte, its sign is the result
+    results = (np.sign(scores) * np.where(scores == 0, 0, endgame.WIN - np.abs(scores))).astype(np.int8)
+    with open(path + '.tmp', 'wb') as file:
+        np.savez_compressed(file, version=VERSION, shape=(rows, cols),
+                            key_deltas=np.diff(keys, prepend=np.uint64(0)), results=results)
+    os.replace(path + '.tmp', path)
+
+
+class Solution:
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            if int(data['version']) != VERSION:
+                raise ValueError(f'{path} is not a solution (version {VERSION})')
+            (rows, cols) = map(int, data['shape'])
+            self.keys = np.cumsum(data['key_deltas'], dtype=np.uint64)
+            results = data['results'].astype(np.int16)
+        self.scores = np.sign(results) * np.where(results == 0, 0, endgame.WIN - np.abs(results))
+        self.space = PositionSpace(rows, cols)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def score(self, own: int, other: int) -> Optional[int]:
+        """
+        :return: score of the position for the player to move, who owns own; None if it isn't solved
+        """
+        key = self.space.canonical(np.array([own], dtype=np.uint64), np.array([other], dtype=np.uint64))[0]
+        index = int(np.searchsorted(self.keys, key))
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        return int(self.scores[index])
+
+    def probe(self, matrix: np.ndarray, player) -> Optional[Tuple[str, int, Tuple[int, int], int]]:
+        """
+        :param matrix: GameBoard matrix, which must not be final
+        :param player: player to move
+        :return: (result, distance, move, score) like EndgameSolver.solve,
+        None if the board doesn't have the dimensions of the solution or the position isn't solved
+        """
+        if matrix.shape != (self.space.rows, self.space.cols):
+            return None
+        (own, other) = self.space.from_matrix(matrix, player)
+        symbols = bin(own | other).count('1')
+
+        best = None
+        for square in squares(self.space.moves(own, self.space.full & ~(own | other))):
+            new_own = own | (1 << square)
+            if self.space.loses(square, own):
+                score = -(endgame.WIN - symbols - 1)
+            elif new_own | other == self.space.full:
+                score = 0
+            else:
+                score = self.score(other, new_own)
+                if score is None:
+                    return None
+                score = -score
+            if best is None or score > best[0]:
+                best = (score, square)
+
+        if best is None:
+            return None
+        (score, square) = best
+        return endgame.RESULTS[(score > 0) - (score < 0)], endgame.distance(score, symbols), \
+            divmod(square, self.space.cols), score
+
+
+def load(rows: int, cols: int) -> Optional[Solution]:
+    """
+    :return: the solution for the given board dimensions, None if it hasn't been computed
+    """
+    path = solution_path(rows, cols)
+    return Solution(path) if os.path.exists(path) else None
+
+
+def verify(solution: Solution, samples: int, seed: int = 0) -> int:
+    """
+    Compares the scores of random positions of the solution with the exact endgame solver
+
+    :return: (checked, mismatches) - number of positions compared and of positions whose score differs
+    """
+    rng = random.Random(seed)
+    solver = endgame.EndgameSolver(solution.space.rows, solution.space.cols)
+    size = solution.space.size
+    (checked, mismatches) = (0, 0)
+    for index in rng.sample(range(len(solution)), min(samples, len(solution))):
+        key = int(solution.keys[index])
+        (own, other) = (key & solution.space.full, key >> size)
+        # the solver only needs a short search near the end of the game
+        if size - bin(own | other).count('1') > 16:
+            continue
+        (score, _) = solver.negamax(own, other, -endgame.WIN, endgame.WIN)
+        checked += 1
+        if score != solution.scores[index]:
+            mismatches += 1
+            print(f'mismatch for position {key:#x}: {solution.scores[index]} instead of {score}')
+    return checked, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve every position of a small NOT 3 in a line board')
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--cols', type=int, default=4)
+    parser.add_argument('--work-dir', default=None, help='directory of the checkpoints of the layers')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--verify', type=int, default=0, metavar='N',
+                        help='check N random positions of an existing solution with the endgame solver')
+    args = parser.parse_args()
+    path = args.output or solution_path(args.rows, args.cols)
+
+    if args.verify:
+        (checked, mismatches) = verify(Solution(path), args.verify)
+        print(f'=== {mismatches} mismatches in {checked} positions ===')
+        raise SystemExit(1 if mismatches else 0)
+
+    t_before = time.time()
+    count = Solver(args.rows, args.cols, args.work_dir).solve(path)
+    result = Solution(path).probe(np.zeros((args.rows, args.cols)), 1)
+    print(f'=== {count} positions solved in {time.time() - t_before:.1f} s, '
+          f'{os.path.getsize(path)} bytes; first player: {result[0]} in {result[1]} plies with {result[2]} ===')
+
+
+if __name__ == '__main__':
+    main()
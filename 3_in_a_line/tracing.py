@@ -0,0 +1,133 @@
+"""
+    Structured tracing for the hot paths of the game (move generation, evaluation, search)
+
+    Every category is a Channel with one boolean flag per level, so a disabled
+    trace costs a single attribute check at the call site:
+
+        if tracing.MOVEGEN.debug:
+            tracing.MOVEGEN.log(tracing.DEBUG, 'possible moves: %s', moves)
+
+    Records are kept unformatted in an in-memory ring buffer and only formatted by dump().
+    Levels can be set with the TRACE environment variable, e.g. TRACE=movegen=debug,search=info
+"""
+import os
+import sys
+import time
+from collections import deque
+
+# levels
+OFF = 0
+ERROR = 1
+INFO = 2
+DEBUG = 3
+
+LEVEL_NAMES = {'off': OFF, 'error': ERROR, 'info': INFO, 'debug': DEBUG}
+
+# number of records kept in memory, the oldest ones are dropped first
+DEFAULT_BUFFER_SIZE = 10000
+
+
+def buffer_size(value: str) -> int:
+    """
+    :param value: TRACE_BUFFER, a bad value is reported and the default size used instead
+    """
+    if not value:
+        return DEFAULT_BUFFER_SIZE
+    try:
+        size = int(value)
+        if size < 0:
+            raise ValueError(f'negative size {size}')
+        return size
+    except ValueError as error:
+        # a typo in TRACE_BUFFER doesn't stop the game
+        print(f'TRACE_BUFFER ignored, {DEFAULT_BUFFER_SIZE} records kept: {error}', file=sys.stderr)
+        return DEFAULT_BUFFER_SIZE
+
+
+BUFFER_SIZE = buffer_size(os.environ.get('TRACE_BUFFER', ''))
+
+# (timestamp, category, level, message, args)
+BUFFER = deque(maxlen=BUFFER_SIZE)
+
+
+class Channel:
+    __slots__ = ('name', 'level', 'error', 'info', 'debug')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.set_level(OFF)
+
+    def set_level(self, level: int):
+        self.level = level
+        self.error = level >= ERROR
+        self.info = level >= INFO
+        self.debug = level >= DEBUG
+
+    def log(self, level: int, message: str, *args):
+        """
+        :param message: %-style format string, formatted with args only when dumped;
+        mutable args (e.g. the game matrix) should be copied by the caller
+        """
+        BUFFER.append((time.perf_counter(), self.name, level, message, args))
+
+
+# categories
+MOVEGEN = Channel('movegen')
+EVAL = Channel('eval')
+SEARCH = Channel('search')
+UI = Channel('ui')
+
+CHANNELS = {channel.name: channel for channel in (MOVEGEN, EVAL, SEARCH, UI)}
+
+
+def set_level(level: int, *categories: str):
+    """
+    :param categories: names of the categories, all of them if none is given
+    """
+    for name in categories:
+        if name not in CHANNELS:
+            raise ValueError(f'unknown trace category {name!r}, expected one of {", ".join(CHANNELS)}')
+    for name in categories or CHANNELS:
+        CHANNELS[name].set_level(level)
+
+
+def configure(spec: str):
+    """
+    :param spec: comma separated category=level pairs, a lone level applies to every category;
+    nothing is changed if one of them is invalid (ValueError)
+    """
+    settings = []
+    for item in filter(None, spec.split(',')):
+        (name, _, level) = item.rpartition('=')
+        (name, level) = (name.strip(), level.strip().lower())
+        if level not in LEVEL_NAMES:
+            raise ValueError(f'unknown trace level {level!r} in {item!r}, expected one of {", ".join(LEVEL_NAMES)}')
+        if name and name not in CHANNELS:
+            raise ValueError(f'unknown trace category {name!r} in {item!r}, expected one of {", ".join(CHANNELS)}')
+        settings.append((LEVEL_NAMES[level], [name] if name else []))
+    for (level, categories) in settings:
+        set_level(level, *categories)
+
+
+def records():
+    """
+    :return: formatted records currently in the buffer, oldest first
+    """
+    level_names = {value: key.upper() for key, value in LEVEL_NAMES.items()}
+    for (timestamp, category, level, message, args) in list(BUFFER):
+        yield f'{timestamp:.6f} [{level_names[level]}] {category}: {message % args if args else message}'
+
+
+def dump(file=None, clear=True):
+    file = file or sys.stderr
+    for record in records():
+        print(record, file=file)
+    if clear:
+        BUFFER.clear()
+
+
+try:
+    configure(os.environ.get('TRACE', ''))
+except ValueError as error:
+    # a typo in TRACE doesn't stop the game
+    print(f'TRACE ignored: {error}', file=sys.stderr)
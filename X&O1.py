@@ -1,25 +1,70 @@
-import copy
+import sys
 import time
+from operator import itemgetter
 from typing import List, Optional
 
+import metrics
+import records
+import search
+
 MAX_DEPTH = 6
 
 
-def identical_elements(l: list):
+def identical_elements(l):
     if len(set(l)) == 1:
         return l[0] if l[0] != Game.EMPTY else False
     return False
 
 
+def line_indices(no_columns: int, win_length: int) -> List[tuple]:
+    """
+    :return: indices (in the flat game matrix) of every group of win_length
+    consecutive squares on a row, column or diagonal of a no_columns x no_columns board
+    """
+    lines = []
+    # right, down, down-right and down-left
+    for (d_line, d_column) in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        for line in range(no_columns):
+            for column in range(no_columns):
+                end_line = line + d_line * (win_length - 1)
+                end_column = column + d_column * (win_length - 1)
+                if 0 <= end_line < no_columns and 0 <= end_column < no_columns:
+                    lines.append(tuple((line + d_line * step) * no_columns + column + d_column * step
+                                       for step in range(win_length)))
+    return lines
+
+
 class Game:
     NO_COLUMNS = 3
+    # number of identical symbols on a line needed to win
+    WIN_LENGTH = 3
     MIN_P = None
     MAX_P = None
     EMPTY = '#'
 
+    # winning lines of the current (NO_COLUMNS, WIN_LENGTH) as index tuples and
+    # as itemgetters which extract a line from the game matrix in a single call
+    LINES: List[tuple] = line_indices(NO_COLUMNS, WIN_LENGTH)
+    LINE_GETTERS = [itemgetter(*line) for line in LINES]
+
+    # line tables already computed, by (NO_COLUMNS, WIN_LENGTH)
+    _LINE_TABLES = {(NO_COLUMNS, WIN_LENGTH): (LINES, LINE_GETTERS)}
+
     def __init__(self, table=None):
         self.matrix = table or [Game.EMPTY] * self.NO_COLUMNS ** 2
 
+    @classmethod
+    def init(cls, no_columns=3, win_length=3):
+        if not 1 < win_length <= no_columns:
+            raise ValueError(f'win length must be between 2 and {no_columns}')
+        cls.NO_COLUMNS = no_columns
+        cls.WIN_LENGTH = win_length
+
+        if (no_columns, win_length) not in cls._LINE_TABLES:
+            lines = line_indices(no_columns, win_length)
+            cls._LINE_TABLES[(no_columns, win_length)] = (lines, [itemgetter(*line) for line in lines])
+        (cls.LINES, cls.LINE_GETTERS) = cls._LINE_TABLES[(no_columns, win_length)]
+
     @classmethod
     def adverse_player(cls, player):
         return cls.MAX_P if player == cls.MIN_P else cls.MIN_P
@@ -34,19 +79,29 @@ class Game:
         else:
             return False
 
-    '''
-        player
-            :param the symbol of the player who moves
-    '''
+    # search.Game protocol, a move is the index of the square in the game matrix
+    def legal_moves(self, player) -> List[int]:
+        return [i for i in range(len(self.matrix)) if self.matrix[i] == Game.EMPTY]
+
+    def make(self, move: int, player):
+        self.matrix[move] = player
+
+    def unmake(self, move: int, player):
+        self.matrix[move] = Game.EMPTY
+
+    def terminal(self) -> bool:
+        return bool(self.final())
 
-    def moves(self, player) -> List:
-        l_moves = []
-        for i in range(len(self.matrix)):
-            if self.matrix[i] == Game.EMPTY:
-                copy_matrix = copy.deepcopy(self.matrix)
-                copy_matrix[i] = player
-                l_moves.append(Game(copy_matrix))
-        return l_moves
+    def evaluate(self, player, depth: int):
+        return self.estimate_score(depth)
+
+    def forced_estimation(self, player, depth: int):
+        # every move can still change the outcome
+        return None
+
+    def position_key(self, player):
+        # the estimation also depends on the winning length
+        return tuple(self.matrix), self.WIN_LENGTH, player
 
     '''
         open_line means a line which can still be used to get a win
@@ -61,14 +116,7 @@ class Game:
         return line.count(player)
 
     def n_open_lines(self, player):
-        return self.open_line(self.matrix[0:3], player) + \
-               self.open_line(self.matrix[3:6], player) + \
-               self.open_line(self.matrix[6:9], player) + \
-               self.open_line(self.matrix[0:9:3], player) + \
-               self.open_line(self.matrix[1:9:3], player) + \
-               self.open_line(self.matrix[2:9:3], player) + \
-               self.open_line(self.matrix[0:9:4], player) + \
-               self.open_line(self.matrix[2:7:2], player)
+        return sum(self.open_line(line(self.matrix), player) for line in self.LINE_GETTERS)
 
     def estimate_score(self, depth):
         t_final = self.final()
@@ -99,24 +147,19 @@ class Game:
     # see if there is any winning combination for either player
     # on the game matrix
     def winning_combination(self):
-        return identical_elements(self.matrix[0:3])   \
-            or identical_elements(self.matrix[3:6])   \
-            or identical_elements(self.matrix[6:9])   \
-            or identical_elements(self.matrix[0:9:3]) \
-            or identical_elements(self.matrix[1:9:3]) \
-            or identical_elements(self.matrix[2:9:3]) \
-            or identical_elements(self.matrix[0:9:4]) \
-            or identical_elements(self.matrix[2:8:2])
+        for line in self.LINE_GETTERS:
+            result = identical_elements(line(self.matrix))
+            if result:
+                return result
+        return False
 
 
 class GameState:
     """
-        Class used by minmax and alpha-beta algorithms;
-        one instance of this class represents a node from the minmax tree;
-        It stores the state of the game matrix
+        One node of the game: the game matrix and the player to move;
+        min_max and alpha_beta set the estimation of the node and the
+        state reached by the best move (chosen_state)
         Its condition to be run is for the Game Class to have MIN_P & MAX_P initialized
-        it also requires Game Class to implement a function called moves which
-        returns a list with the possible configurations after ones turn
     """
 
     def __init__(self, game_matrix: Game, current_player, depth: int, parent=None, estimation=None):
@@ -131,22 +174,21 @@ class GameState:
         # or of the best child move for the current player
         self.estimation = estimation
 
-        # list of possible moves
-        self.possible_moves = []
-
-        # best move for the current player chosen from the list of possible moves
+        # best move for the current player
         # of type GameState
         self.chosen_state: Optional[GameState] = None
 
-    def moves(self):
-        # list of possible moves generated from moves method
-        # from class Game
-        l_moves = self.game_matrix.moves(self.current_player)
-        adverse_player = Game.adverse_player(self.current_player)
-
-        # create a new possible game state object from each possible move
-        l_state_moves = [GameState(move, adverse_player, self.depth - 1, parent=self) for move in l_moves]
-        return l_state_moves
+    def choose(self, result: search.SearchResult):
+        """
+        Sets the estimation and the chosen state from the result of a search
+        """
+        self.estimation = result.estimation
+        if result.move is not None:
+            matrix = list(self.game_matrix.matrix)
+            matrix[result.move] = self.current_player
+            self.chosen_state = GameState(Game(matrix), Game.adverse_player(self.current_player), self.depth - 1,
+                                          parent=self, estimation=result.estimation)
+        return self
 
     def __str__(self):
         s = f'{str(self.game_matrix)} (Current player {self.current_player})\n'
@@ -154,79 +196,32 @@ class GameState:
 
 
 def min_max(state: GameState) -> GameState:
-    # if leaf level has been reached or a final state has been met
-    if state.depth == 0 or state.game_matrix.final():
-        state.estimation = state.game_matrix.estimate_score(state.depth)
-        return state
-
-    # compute all possible moves from the current state
-    state.possible_moves = state.moves()
-
-    # apply min_max algorithm on each of the possible
-    # moves in order to create every possible subtree
-    estimated_moves = [min_max(move) for move in state.possible_moves]
-
-    if state.current_player == Game.MAX_P:
-        # pick the state with the max estimation
-        # if the current player is MAX_P i.e. the player
-        # tries to maximize
-        state.chosen_state = max(estimated_moves, key=lambda x: x.estimation)
-    else:
-        # pick the state with the min estimation
-        # if the current player is MIN_P i.e. the player
-        # tries to minimize
-        state.chosen_state = min(estimated_moves, key=lambda x: x.estimation)
-
-    # set the estimation for the state accordingly
-    state.estimation = state.chosen_state.estimation
-    return state
-
-
-def alpha_beta(alpha: int, beta: int, state: GameState) -> GameState:
-    # if leaf level has been reached or a final state has been met
-    if state.depth == 0 or state.game_matrix.final():
-        state.estimation = state.game_matrix.estimate_score(state.depth)
-        return state
-
-    # if it is in a valid interval than processing is no longer needed
-    if alpha > beta:
-        return state
-
-    state.possible_moves = state.moves()
-
-    if state.current_player == Game.MAX_P:
-        current_estimation = float('-inf')
-
-        for move in state.possible_moves:
-            # compute the estimation for the new state by building the subtree
-            # subtree for the new state
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation < new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if alpha < new_state.estimation:
-                alpha = new_state.estimation
-                # invalid interval since alpha should always be less than beta
-                if alpha >= beta:
-                    break
-
-    elif state.current_player == Game.MIN_P:
-        current_estimation = float('inf')
-
-        for move in state.possible_moves:
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation > new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if beta > new_state.estimation:
-                beta = new_state.estimation
-                if alpha >= beta:
-                    break
-
-    state.estimation = state.chosen_state.estimation
-    return state
+    # MAX_P picks the move with the max estimation, MIN_P the one with the min estimation
+    return state.choose(search.min_max(state.game_matrix, state.current_player, state.depth, Game.MAX_P))
+
+
+def alpha_beta(alpha: int, beta: int, state: GameState, table: Optional[dict] = None) -> GameState:
+    """
+    :param table: optional transposition table (dict) shared between searches;
+    the root state is never answered from the table so chosen_state is always set;
+    a search.SearchTree kept for the game is continued from the search of the previous move
+    """
+    if isinstance(table, search.SearchTree):
+        ply = sum(symbol != Game.EMPTY for symbol in state.game_matrix.matrix)
+        return state.choose(search.deepening(state.game_matrix, state.current_player, state.depth, Game.MAX_P,
+                                             ply, table, alpha, beta))
+    return state.choose(search.alpha_beta(state.game_matrix, state.current_player, state.depth, Game.MAX_P,
+                                          alpha, beta, table))
+
+
+def top_moves(k: int, state: GameState, table: Optional[dict] = None) -> List[search.Variation]:
+    """
+    :return: the k best moves of the current player (at most), each with its estimation and
+    principal variation of (line, column) moves, found by a single alpha-beta search
+    """
+    variations = search.multi_pv(state.game_matrix, state.current_player, state.depth, Game.MAX_P, k, table)
+    return [search.Variation(variation.estimation, [divmod(move, Game.NO_COLUMNS) for move in variation.moves])
+            for variation in variations]
 
 
 def print_if_final(current_state: GameState):
@@ -241,7 +236,36 @@ def print_if_final(current_state: GameState):
     return False
 
 
+def save_record(writer: Optional[records.GameRecordWriter], moves: bytearray, algorithm_type: str, final):
+    """
+    Appends the finished game to the record file, if recording is enabled (see records.py)
+
+    :param moves: index of the square marked by each move
+    :param final: result of Game.final for the last board
+    """
+    if writer is None:
+        return
+    engine = records.PLAYERS.index('min_max' if algorithm_type == '1' else 'alpha_beta')
+    human = records.PLAYERS.index('human')
+    result = records.DRAW if final == 'DRAW' else 1 if final == 'X' else 2
+    writer.append(records.GameRecord(records.TIC_TAC_TOE, Game.NO_COLUMNS, Game.NO_COLUMNS, Game.WIN_LENGTH, 1,
+                                     human if Game.MIN_P == 'X' else engine, human if Game.MIN_P == 'O' else engine,
+                                     MAX_DEPTH, result, 0, bytes(moves)))
+
+
+def record_game(final):
+    """
+    :param final: result of Game.final for the last board
+    """
+    metrics.record_game(metrics.TIC_TAC_TOE, Game.NO_COLUMNS, Game.NO_COLUMNS, 'draw' if final == 'DRAW' else final)
+
+
 def main():
+    # optional board size and win length, e.g. `python X&O1.py 5 4` for 5x5 / 4 in a row
+    if len(sys.argv) > 1:
+        no_columns = int(sys.argv[1])
+        Game.init(no_columns, int(sys.argv[2]) if len(sys.argv) > 2 else min(no_columns, 3))
+
     valid_response = False
     line = -1
     column = -1
@@ -266,8 +290,16 @@ def main():
     current_board = Game()
     print(f'Current board:\n{str(current_board)}')
 
+    # the game is appended to the file named by GAME_RECORDS when it ends
+    writer = records.writer_from_env()
+    # latency of the moves and counters, for METRICS_FILE / METRICS_PORT
+    exporter = metrics.exporter_from_env()
+    moves = bytearray()
+
     # create initial state
     current_state = GameState(game_matrix=current_board, current_player='X', depth=MAX_DEPTH)
+    # the tree searched by alpha_beta is kept from one move to the next (SEARCH_TREE_MB caps it)
+    tree = search.SearchTree()
 
     while True:
         # Human player := the minimizing player
@@ -285,14 +317,17 @@ def main():
                         else:
                             print('=== :) ===')
                     else:
-                        print('Line and column are integer values between 0 and 2.')
+                        print(f'Line and column are integer values between 0 and {Game.NO_COLUMNS - 1}.')
                 except ValueError:
                     print('===INVALID INPUT===\n===TRY AGAIN===\n')
 
             current_state.game_matrix.matrix[line * Game.NO_COLUMNS + column] = Game.MIN_P
+            moves.append(line * Game.NO_COLUMNS + column)
             print(f'Current state: {str(current_state)}')
 
             if print_if_final(current_state):
+                save_record(writer, moves, algorithm_type, current_state.game_matrix.final())
+                record_game(current_state.game_matrix.final())
                 break
 
             # after a valid move the current player is changed
@@ -302,25 +337,35 @@ def main():
             # current player is the computer i.e. the maximizing player
             print(f'Now it\'s {current_state.current_player}\' turn.\n')
             start_time = time.time()
+            token = metrics.begin_move()
 
             if algorithm_type == '1':
                 actualised_state: GameState = min_max(current_state)
             else:
-                actualised_state: GameState = alpha_beta(-500, 500, current_state)
+                actualised_state: GameState = alpha_beta(-500, 500, current_state, tree)
+            metrics.record_move(metrics.end_move(token, metrics.TIC_TAC_TOE, Game.NO_COLUMNS, Game.NO_COLUMNS,
+                                                 MAX_DEPTH, 'min_max' if algorithm_type == '1' else 'alpha_beta'))
             # The current state is replaced/actualised with the one
             # which benefits the current player the most
             # in this case, the move with the biggest estimation score
+            moves.extend(index for (index, (old, new)) in enumerate(zip(current_state.game_matrix.matrix,
+                                                                        actualised_state.chosen_state.game_matrix.matrix))
+                         if old != new)
             current_state.game_matrix = actualised_state.chosen_state.game_matrix
             print(f'Current board:\n{str(current_state)}')
 
             end_time = time.time()
             print(f'===MOVE REALISED IN {end_time - start_time} seconds===')
             if print_if_final(current_state):
+                save_record(writer, moves, algorithm_type, current_state.game_matrix.final())
+                record_game(current_state.game_matrix.final())
                 break
 
             # switch the player to the adverse player
             current_state.current_player = Game.adverse_player(current_state.current_player)
 
+    metrics.close_exporter(exporter)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,200 @@
+import importlib
+import multiprocessing
+import os
+import sys
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from search import SearchTree
+
+# the engines live in scripts which can't be imported with a plain import statement
+# (X&O1.py has an '&' in its name and 3_in_a_line.py starts with a digit)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.extend(path for path in (ROOT_DIR, os.path.join(ROOT_DIR, '3_in_a_line')) if path not in sys.path)
+
+# kinds of boards accepted by best_moves
+TIC_TAC_TOE = 'X&O1'
+NOT_3_IN_A_LINE = '3_in_a_line'
+
+# depth used for the not 3 in a line boards when none is given (MEDIUM difficulty)
+DEFAULT_DEPTH = 3
+
+# transposition table shared by the positions searched by the current process, by variant
+# (game, board size and maximizer): only the table of the last variant searched is kept,
+# and SEARCH_TREE_MB caps it
+_TABLES = {}
+
+
+class BestMove(NamedTuple):
+    # position of the board in the input batch
+    index: int
+    # (line, column) of the best move, None if the position is already final
+    move: Optional[Tuple[int, int]]
+    # estimation of the position, from the point of view of the maximizing player
+    # ('X' for the 3x3 game, 1 for the not 3 in a line game)
+    estimation: float
+    # time, nodes and cutoffs of the search, recorded by best_moves in its own process
+    cost: Optional[metrics.MoveCost] = None
+    # the multi_pv best moves, as search.Variation (estimation, [(line, column), ...]),
+    # None unless best_moves was asked for more than one and the position isn't final
+    variations: Optional[List] = None
+
+
+def engine(kind: str):
+    return importlib.import_module(kind)
+
+
+def to_task(index: int, board, player, depth: Optional[int], multi_pv: int = 1):
+    """
+    :param board: Game/GameBoard instance, flat list of symbols or 2d numpy array
+    :param player: player to move, None if it should be deduced from the number of symbols
+    :return: picklable tuple describing the search which has to be done for board
+    """
+    matrix = getattr(board, 'matrix', board)
+    if isinstance(matrix, np.ndarray):
+        matrix = np.array(matrix, dtype=float)
+        if player is None:
+            player = 1 if np.count_nonzero(matrix == 1) <= np.count_nonzero(matrix == 2) else 2
+        return index, NOT_3_IN_A_LINE, matrix, player, DEFAULT_DEPTH if depth is None else depth, multi_pv
+
+    matrix = list(matrix)
+    game = engine(TIC_TAC_TOE).Game
+    if len(matrix) != game.NO_COLUMNS ** 2:
+        raise ValueError(f'board {index} is neither a {game.NO_COLUMNS}x{game.NO_COLUMNS} Game '
+                         f'nor a numpy GameBoard matrix')
+    if player is None:
+        player = 'X' if matrix.count('X') <= matrix.count('O') else 'O'
+    return index, TIC_TAC_TOE, (matrix, game.NO_COLUMNS, game.WIN_LENGTH), player, \
+        engine(TIC_TAC_TOE).MAX_DEPTH if depth is None else depth, multi_pv
+
+
+def table(variant: tuple) -> SearchTree:
+    """
+    :return: the transposition table of the positions of variant, a new one
+    (dropping the table of the previous variant) if variant changed
+    """
+    variant_table = _TABLES.get(variant)
+    if variant_table is None:
+        _TABLES.clear()
+        variant_table = _TABLES[variant] = SearchTree()
+    return variant_table
+
+
+def search(task) -> BestMove:
+    (index, kind, matrix, player, depth, multi_pv) = task
+    module = engine(kind)
+    token = metrics.begin_move()
+
+    if kind == TIC_TAC_TOE:
+        (matrix, no_columns, win_length) = matrix
+        module.Game.MAX_P, module.Game.MIN_P = 'X', 'O'
+        # the settings are sent along so worker processes play the same variant
+        if (module.Game.NO_COLUMNS, module.Game.WIN_LENGTH) != (no_columns, win_length):
+            module.Game.init(no_columns, win_length)
+        state = module.GameState(module.Game(list(matrix)), player, depth)
+        variant_table = table((kind, no_columns, win_length, module.Game.MAX_P))
+    else:
+        module.GameBoard.MAX_P, module.GameBoard.MIN_P = 1, 2
+        (module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS) = matrix.shape
+        state = module.GameState(module.GameBoard(matrix.copy()), player, depth)
+        variant_table = table((kind, *matrix.shape, module.GameBoard.MAX_P))
+
+    # the boards of a batch aren't the moves of a game, the search of one isn't continued by the next
+    variant_table.horizon = None
+
+    if multi_pv > 1:
+        # the top moves come from a single search sharing the table
+        variations = module.top_moves(multi_pv, state, variant_table)
+        # a final position has none, it's estimated below
+        if variations:
+            game = metrics.TIC_TAC_TOE if kind == TIC_TAC_TOE else metrics.NOT_3_IN_A_LINE
+            (rows, cols) = (module.Game.NO_COLUMNS,) * 2 if kind == TIC_TAC_TOE else matrix.shape
+            cost = metrics.end_move(token, game, rows, cols, depth, 'multi_pv')
+            return BestMove(index, variations[0].moves[0], variations[0].estimation, cost, variations)
+
+    state = module.alpha_beta(-500, 500, state, variant_table)
+    if kind == TIC_TAC_TOE:
+        cost = metrics.end_move(token, metrics.TIC_TAC_TOE, module.Game.NO_COLUMNS, module.Game.NO_COLUMNS, depth,
+                                'alpha_beta')
+    else:
+        cost = metrics.end_move(token, metrics.NOT_3_IN_A_LINE, *matrix.shape, depth, 'alpha_beta')
+    if state.chosen_state is None:
+        return BestMove(index, None, state.estimation, cost)
+
+    # the best move is the only square which differs between the two boards
+    if kind == TIC_TAC_TOE:
+        square = next(i for i in range(len(matrix)) if state.chosen_state.game_matrix.matrix[i] != matrix[i])
+        move = divmod(square, module.Game.NO_COLUMNS)
+    else:
+        (row, col) = np.argwhere(state.chosen_state.game_board.matrix != matrix)[0]
+        move = (int(row), int(col))
+    return BestMove(index, move, state.estimation, cost)
+
+
+def recorded(results: Iterator[BestMove]) -> Iterator[BestMove]:
+    # the searches of the worker processes are recorded in this process, with the ones made here
+    for result in results:
+        metrics.record_move(result.cost)
+        yield result
+
+
+def init_worker():
+    _TABLES.clear()
+
+
+def best_moves(boards: Iterable, players: Optional[Iterable] = None, depth: Optional[int] = None,
+               processes: Optional[int] = None, chunksize: int = 64, multi_pv: int = 1) -> Iterator[BestMove]:
+    """
+    Streams the best move of every board, in the order of the input
+
+    :param boards: iterable of Game (of the current Game.NO_COLUMNS) / GameBoard instances
+    (or their matrices);
+    a 3d numpy array is read as a batch of GameBoard matrices
+    :param players: player to move for each board, deduced from the board if not given
+    :param depth: depth of the alpha-beta search, MAX_DEPTH / DEFAULT_DEPTH if not given
+    :param processes: number of worker processes; every worker keeps its own transposition
+    table for the consecutive boards of a variant (game and board size) it receives,
+    None or 1 searches everything in this process
+    :param chunksize: number of consecutive boards sent to a worker at once
+    :param multi_pv: number of best moves of each board, with their principal variations
+    (BestMove.variations), searched at a cost close to the one of the best move alone
+    """
+    if players is None:
+        tasks = (to_task(index, board, None, depth, multi_pv) for index, board in enumerate(boards))
+    else:
+        tasks = (to_task(index, board, player, depth, multi_pv)
+                 for index, (board, player) in enumerate(zip(boards, players)))
+
+    # search() changes the class attributes of the engines, restore them when done
+    saved = {kind: save_settings(kind) for kind in (TIC_TAC_TOE, NOT_3_IN_A_LINE)}
+    try:
+        if processes is None or processes == 1:
+            yield from recorded(map(search, tasks))
+        else:
+            with multiprocessing.Pool(processes, initializer=init_worker) as pool:
+                yield from recorded(pool.imap(search, tasks, chunksize))
+    finally:
+        for kind, settings in saved.items():
+            restore_settings(kind, settings)
+
+
+def save_settings(kind: str) -> dict:
+    module = engine(kind)
+    if kind == TIC_TAC_TOE:
+        return {name: getattr(module.Game, name) for name in ('MAX_P', 'MIN_P', 'NO_COLUMNS', 'WIN_LENGTH')}
+    return {name: getattr(module.GameBoard, name) for name in ('MAX_P', 'MIN_P', 'BOARD_ROWS', 'BOARD_COLS')}
+
+
+def restore_settings(kind: str, settings: dict):
+    module = engine(kind)
+    if kind == TIC_TAC_TOE:
+        module.Game.init(settings.pop('NO_COLUMNS'), settings.pop('WIN_LENGTH'))
+    cls = module.Game if kind == TIC_TAC_TOE else module.GameBoard
+    for name, value in settings.items():
+        setattr(cls, name, value)
+
+
+def clear_table():
+    _TABLES.clear()
@@ -0,0 +1,83 @@
+"""
+    Cache for the images, fonts and static texts used by the pygame front-ends
+
+    Every image is loaded and scaled once per size; the scaled pixels are also kept on disk
+    (in CACHE_DIR, keyed by a hash of the source file and the size) so the next start, or a
+    change of the cell size to an already used one, doesn't resample the image again.
+"""
+import hashlib
+import os
+from typing import Optional, Tuple
+
+import pygame
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('ASSET_CACHE_DIR', os.path.join(ROOT_DIR, '.asset_cache'))
+
+# pygame >= 2.1.3 renamed tostring / fromstring
+_to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+_from_bytes = getattr(pygame.image, 'frombytes', None) or pygame.image.fromstring
+
+_images = {}
+_fonts = {}
+_texts = {}
+
+
+def source_hash(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()[:16]
+
+
+def image(path: str, size: Tuple[int, int]) -> pygame.Surface:
+    """
+    :param path: path of the image, relative to the root of the repository
+    :param size: (width, height) of the returned surface
+    """
+    key = (path, tuple(size))
+    if key in _images:
+        return _images[key]
+
+    source = os.path.join(ROOT_DIR, path)
+    (width, height) = size
+    cached = os.path.join(CACHE_DIR, f'{source_hash(source)}_{width}x{height}.rgba')
+
+    surface = None
+    if os.path.exists(cached):
+        with open(cached, 'rb') as file:
+            data = file.read()
+        # a truncated file (e.g. interrupted write) is simply rebuilt
+        if len(data) == width * height * 4:
+            surface = _from_bytes(data, (width, height), 'RGBA')
+
+    if surface is None:
+        surface = pygame.transform.scale(pygame.image.load(source), (width, height))
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(cached + '.tmp', 'wb') as file:
+                file.write(_to_bytes(surface, 'RGBA'))
+            os.replace(cached + '.tmp', cached)
+        except OSError:
+            # the disk cache is only an optimisation
+            pass
+
+    if pygame.display.get_surface():
+        surface = surface.convert_alpha()
+    _images[key] = surface
+    return surface
+
+
+def font(size: int, name: Optional[str] = None) -> pygame.font.Font:
+    key = (name, size)
+    if key not in _fonts:
+        _fonts[key] = pygame.font.Font(name, size)
+    return _fonts[key]
+
+
+def text(label: str, size: int, color, name: Optional[str] = None) -> pygame.Surface:
+    """
+    :return: label rendered (antialiased) once with the font (name, size) and color
+    """
+    key = (label, name, size, tuple(pygame.color.Color(color)))
+    if key not in _texts:
+        _texts[key] = font(size, name).render(label, True, color)
+    return _texts[key]
@@ -0,0 +1,243 @@
+"""
+    Export of searched positions as a training dataset for evaluation functions
+
+    Positions are written into fixed-size shards, one .npy file of RECORD_DTYPE records each,
+    which can be opened without reading them with np.load(path, mmap_mode='r'). The records
+    are collected in preallocated buffers; a full buffer is saved by a background thread
+    while the next one is filled.
+
+    Every record holds:
+        board   int8 (rows, cols), 0 for an empty square, 1 for X, 2 for O
+        player  int8, player to move (1 for X, 2 for O)
+        score   float32, estimation of the search, from the point of view of X
+        move    int16, best move found by the search (row * cols + col), -1 if none
+        result  int8, result of the game the position comes from: 1 X won, -1 O won, 0 draw
+
+    Self-play export:
+        python dataset.py --game 3_in_a_line --rows 6 --cols 6 --games 100 --depth 2 --output data
+"""
+import argparse
+import glob
+import os
+import queue
+import random
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+import analysis
+import metrics
+
+SHARD_SIZE = 1 << 16
+
+# symbols of the 3x3 game
+SYMBOLS = {'X': 1, 'O': 2}
+
+
+def record_dtype(rows: int, cols: int) -> np.dtype:
+    return np.dtype([('board', 'i1', (rows, cols)), ('player', 'i1'), ('score', '<f4'),
+                     ('move', '<i2'), ('result', 'i1')])
+
+
+def board_tensor(board, rows: int, cols: int) -> np.ndarray:
+    """
+    :param board: GameBoard / Game instance or their matrix
+    :return: int8 (rows, cols) array with 0 for empty squares, 1 for X and 2 for O
+    """
+    matrix = getattr(board, 'matrix', board)
+    if isinstance(matrix, np.ndarray):
+        return matrix.astype(np.int8).reshape(rows, cols)
+    return np.array([SYMBOLS.get(symbol, 0) for symbol in matrix], dtype=np.int8).reshape(rows, cols)
+
+
+def player_index(player) -> int:
+    return SYMBOLS.get(player, player)
+
+
+class DatasetWriter:
+    """
+    Streams positions into shards; the result of a game is only known when it ends, so a
+    full buffer is kept until the game of its last positions ends
+    """
+
+    def __init__(self, directory: str, rows: int, cols: int, shard_size: int = SHARD_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = rows
+        self.cols = cols
+        self.shard_size = shard_size
+        # numbering continues after the shards already in the directory
+        self.shard = len(shard_paths(directory))
+
+        # one buffer being filled, the ones waiting for the end of a game and one being saved
+        dtype = record_dtype(rows, cols)
+        self.free = queue.Queue()
+        for _ in range(2 + -(-rows * cols // shard_size)):
+            self.free.put(np.zeros(shard_size, dtype=dtype))
+        self.buffer = self.free.get()
+        self.count = 0
+        # full buffers holding positions of the current game
+        self.pending: List[np.ndarray] = []
+        # (buffer, position) of the first position of the current game
+        self.game_start = (self.buffer, 0)
+
+        self.saved = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self.save_shards, daemon=True)
+        self.thread.start()
+
+    def add(self, board, player, score: float, move: Optional[tuple] = None):
+        """
+        :param board: GameBoard / Game instance or their matrix
+        :param player: player to move, 1 / 2 or 'X' / 'O'
+        :param move: (row, col) of the best move
+        """
+        record = self.buffer[self.count]
+        record['board'] = board_tensor(board, self.rows, self.cols)
+        record['player'] = player_index(player)
+        record['score'] = score
+        record['move'] = -1 if move is None else move[0] * self.cols + move[1]
+        self.count += 1
+
+        if self.count == self.shard_size:
+            self.pending.append(self.buffer)
+            self.buffer = self.free.get()
+            self.count = 0
+
+    def end_game(self, winner):
+        """
+        Sets the result of every position of the game which just ended
+
+        :param winner: 1 / 2 or 'X' / 'O', None for a draw
+        """
+        result = {None: 0, 1: 1, 2: -1}[player_index(winner)]
+        (buffer, start) = self.game_start
+        for full_buffer in self.pending:
+            full_buffer['result'][start if full_buffer is buffer else 0:] = result
+        self.buffer['result'][start if self.buffer is buffer else 0:self.count] = result
+
+        for full_buffer in self.pending:
+            self.saved.put((full_buffer, self.shard_size))
+        self.pending = []
+        self.game_start = (self.buffer, self.count)
+
+    def save_shards(self):
+        while True:
+            (buffer, count) = self.saved.get()
+            if buffer is None:
+                return
+            path = os.path.join(self.directory, f'shard_{self.shard:05d}.npy')
+            # np.save adds the extension to names without it
+            np.save(path + '.tmp.npy', buffer[:count])
+            os.replace(path + '.tmp.npy', path)
+            self.shard += 1
+            self.free.put(buffer)
+
+    def close(self):
+        """
+        Saves the positions of the finished games and waits for the background thread;
+        the positions of an unfinished game are dropped
+        """
+        (buffer, start) = self.game_start
+        if start:
+            self.saved.put((buffer, start))
+        self.saved.put((None, 0))
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shard_paths(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, 'shard_*[0-9].npy')))
+
+
+def load(directory: str) -> List[np.ndarray]:
+    """
+    :return: the shards of directory, memory mapped
+    """
+    return [np.load(path, mmap_mode='r') for path in shard_paths(directory)]
+
+
+def self_play(writer: DatasetWriter, kind: str, games: int, depth: Optional[int], random_plies: int = 2):
+    """
+    Plays games between two alpha-beta engines (sharing one transposition table) and
+    exports every searched position
+
+    :param kind: analysis.TIC_TAC_TOE or analysis.NOT_3_IN_A_LINE
+    :param random_plies: the first moves of a game are random, so the games differ
+    """
+    module = analysis.engine(kind)
+    for _ in range(games):
+        if kind == analysis.TIC_TAC_TOE:
+            board = module.Game()
+            (player, other) = ('X', 'O')
+        else:
+            module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS = writer.rows, writer.cols
+            board = module.GameBoard(np.zeros((writer.rows, writer.cols)))
+            (player, other) = (1, 2)
+
+        winner = None
+        for ply in range(writer.rows * writer.cols):
+            if ply < random_plies:
+                if kind == analysis.TIC_TAC_TOE:
+                    empty = [i for i in range(len(board.matrix)) if board.matrix[i] == module.Game.EMPTY]
+                    move = divmod(random.choice(empty), writer.cols)
+                else:
+                    move = random.choice(sorted(board.available_moves(player)))
+            else:
+                best = next(analysis.best_moves([board], [player], depth))
+                move = best.move
+                writer.add(board, player, best.estimation, move)
+
+            if kind == analysis.TIC_TAC_TOE:
+                board.matrix[move[0] * writer.cols + move[1]] = player
+                final = board.final()
+                if final:
+                    winner = None if final == 'DRAW' else final
+                    break
+            else:
+                board.mark_square(*move, player)
+                # forming 3 in a line loses
+                if board.check_loss_condition(*move):
+                    winner = other
+                    break
+            (player, other) = (other, player)
+        writer.end_game(winner)
+        metrics.record_game(metrics.TIC_TAC_TOE if kind == analysis.TIC_TAC_TOE else metrics.NOT_3_IN_A_LINE,
+                            writer.rows, writer.cols, 'draw' if winner is None else 'XO'[player_index(winner) - 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export self-play positions as .npy shards')
+    parser.add_argument('--game', choices=[analysis.TIC_TAC_TOE, analysis.NOT_3_IN_A_LINE],
+                        default=analysis.NOT_3_IN_A_LINE)
+    parser.add_argument('--rows', type=int, default=6, help='rows (and columns) of the tic-tac-toe board')
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=None)
+    parser.add_argument('--random-plies', type=int, default=2)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--output', default='dataset')
+    args = parser.parse_args()
+
+    if args.game == analysis.TIC_TAC_TOE:
+        analysis.engine(analysis.TIC_TAC_TOE).Game.init(args.rows, min(args.rows, 3))
+        args.cols = args.rows
+
+    t_before = time.time()
+    # latency of the moves and counters, for METRICS_FILE / METRICS_PORT
+    exporter = metrics.exporter_from_env()
+    with DatasetWriter(args.output, args.rows, args.cols, args.shard_size) as writer:
+        self_play(writer, args.game, args.games, args.depth, args.random_plies)
+    metrics.close_exporter(exporter)
+    positions = sum(len(shard) for shard in load(args.output))
+    print(f'=== {positions} positions in {args.output} after {time.time() - t_before:.1f} s ===')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+    Performance overlay of the pygame front-ends
+
+    Shows, for the last move of the computer: the time it took, the nodes searched per
+    second, the depth reached and the hit rate of the transposition table, the time of
+    the last frame and a sparkline of the latency of the last moves. It's toggled with
+    KEY; the text is rendered into a cached surface only when the numbers change, and a
+    hidden overlay isn't rendered at all.
+
+        hud = PerformanceHud()
+        hud.begin_move()
+        ... search ...
+        hud.end_move(depth)
+        hud.draw(canvas)    # after every redraw of the board
+"""
+import time
+from collections import deque
+from typing import Optional
+
+import pygame
+
+import assets
+import search
+
+KEY = pygame.K_F3
+
+# number of moves in the sparkline
+HISTORY = 40
+# the frame time is only refreshed this often (in seconds), every other number when it changes
+FRAME_REFRESH = 0.5
+
+WIDTH = 190
+FONT_SIZE = 18
+LINE_HEIGHT = 16
+SPARKLINE_HEIGHT = 24
+MARGIN = 4
+
+BG_COLOR = pygame.color.Color(20, 20, 20)
+TEXT_COLOR = pygame.color.Color(230, 230, 230)
+SPARKLINE_COLOR = pygame.color.Color(90, 200, 120)
+
+
+class PerformanceHud:
+    def __init__(self, position=(0, 0)):
+        self.position = position
+        self.visible = False
+
+        self.latencies = deque(maxlen=HISTORY)
+        self.nodes_per_second = 0.0
+        self.depth = None
+        self.hit_rate = None
+        self.frame_time = 0.0
+
+        # (time, nodes, table probes, table hits) when the current move started
+        self.move_start = None
+        self.surface: Optional[pygame.Surface] = None
+        self.dirty = True
+        self.rendered_at = 0.0
+
+    def toggle(self) -> bool:
+        """
+        :return: if the overlay is visible now; the caller redraws the board when it's hidden
+        """
+        self.visible = not self.visible
+        self.dirty = True
+        return self.visible
+
+    def begin_move(self):
+        stats = search.STATS
+        self.move_start = (time.perf_counter(), stats.nodes, stats.table_probes, stats.table_hits)
+        stats.lowest_depth = search.INF
+
+    def end_move(self, depth: int):
+        """
+        :param depth: depth of the search, the depth reached may be less if the game ends sooner
+        """
+        (started, nodes, probes, hits) = self.move_start
+        latency = time.perf_counter() - started
+        stats = search.STATS
+        (nodes, probes, hits) = (stats.nodes - nodes, stats.table_probes - probes, stats.table_hits - hits)
+
+        self.latencies.append(latency)
+        self.nodes_per_second = nodes / latency if latency else 0.0
+        # moves of the book or of the solvers don't go through search
+        self.depth = depth - stats.lowest_depth if nodes and stats.lowest_depth != search.INF else None
+        self.hit_rate = hits / probes if probes else None
+        self.dirty = True
+
+    def record_frame(self, seconds: float):
+        self.frame_time = seconds
+        if time.perf_counter() - self.rendered_at > FRAME_REFRESH:
+            self.dirty = True
+
+    def render(self):
+        latency = self.latencies[-1] if self.latencies else 0.0
+        lines = [f'move {latency * 1000:.1f} ms',
+                 f'{self.nodes_per_second:,.0f} nodes/s',
+                 f'depth {"-" if self.depth is None else self.depth}',
+                 f'cache hits {"-" if self.hit_rate is None else f"{self.hit_rate:.0%}"}',
+                 f'frame {self.frame_time * 1000:.1f} ms']
+
+        height = 2 * MARGIN + len(lines) * LINE_HEIGHT + SPARKLINE_HEIGHT
+        if self.surface is None or self.surface.get_height() != height:
+            self.surface = pygame.Surface((WIDTH, height))
+        self.surface.fill(BG_COLOR)
+        font = assets.font(FONT_SIZE)
+        for (index, line) in enumerate(lines):
+            self.surface.blit(font.render(line, True, TEXT_COLOR), (MARGIN, MARGIN + index * LINE_HEIGHT))
+
+        if len(self.latencies) > 1:
+            top = MARGIN + len(lines) * LINE_HEIGHT
+            highest = max(self.latencies) or 1.0
+            step = (WIDTH - 2 * MARGIN) / (HISTORY - 1)
+            # the last move is on the right
+            first = HISTORY - len(self.latencies)
+            points = [(MARGIN + (first + index) * step, top + (SPARKLINE_HEIGHT - 2) * (1 - value / highest))
+                      for (index, value) in enumerate(self.latencies)]
+            pygame.draw.lines(self.surface, SPARKLINE_COLOR, False, points)
+
+        self.dirty = False
+        self.rendered_at = time.perf_counter()
+
+    def draw(self, canvas: pygame.Surface) -> Optional[pygame.Rect]:
+        """
+        Draws the overlay over the canvas, which isn't pushed to the screen
+
+        :return: the area drawn, None if the overlay is hidden
+        """
+        if not self.visible:
+            return None
+        if self.dirty:
+            self.render()
+        return canvas.blit(self.surface, self.position)
@@ -0,0 +1,309 @@
+"""
+    Latency histograms and counters of the engines, exported in the Prometheus text format
+
+    Every move of an engine is recorded in a log-linear histogram (SUB_BUCKETS buckets for
+    each power of two of microseconds, so the quantiles are within 1 / SUB_BUCKETS of the
+    real value) by game, board size, depth and algorithm, and adds the nodes searched and
+    the beta cutoffs to monotonic counters; finished games are counted by result.
+
+    Each thread records into its own shard, which no other thread writes, so recording
+    only takes a lock the first time a thread records something. The exporter merges the
+    shards when it formats them.
+
+    Exporting is enabled with environment variables:
+        METRICS_FILE=metrics.prom    the file is rewritten every METRICS_INTERVAL seconds (10)
+        METRICS_PORT=9100            served on http://127.0.0.1:9100/metrics
+"""
+import http.server
+import math
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import search
+
+# values of the game label
+TIC_TAC_TOE = 'tic_tac_toe'
+NOT_3_IN_A_LINE = 'not_3_in_a_line'
+
+SUB_BUCKETS = 16
+# the last bucket holds every move longer than 2 ** MAX_EXPONENT microseconds (about 12 days)
+MAX_EXPONENT = 40
+BUCKETS = (MAX_EXPONENT + 1) * SUB_BUCKETS
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+DEFAULT_INTERVAL = 10.0
+
+# ((name, value), ...) pairs, in the order they are exported
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MoveCost(NamedTuple):
+    game: str
+    rows: int
+    cols: int
+    depth: int
+    algorithm: str
+    seconds: float
+    nodes: int
+    cutoffs: int
+
+
+def bucket(seconds: float) -> int:
+    micros = seconds * 1e6
+    if micros < 1:
+        return 0
+    # micros = mantissa * 2 ** exponent, with mantissa in [0.5, 1)
+    (mantissa, exponent) = math.frexp(micros)
+    if exponent > MAX_EXPONENT:
+        return BUCKETS - 1
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def bucket_limit(index: int) -> float:
+    """
+    :return: upper bound of the bucket, in seconds
+    """
+    (exponent, sub_bucket) = divmod(index, SUB_BUCKETS)
+    if not exponent:
+        return 1e-6
+    return (0.5 + (sub_bucket + 1) / (2 * SUB_BUCKETS)) * 2.0 ** exponent / 1e6
+
+
+class Shard:
+    """
+    Metrics recorded by one thread
+    """
+
+    def __init__(self):
+        # labels -> (counts by bucket, [count, sum, max])
+        self.histograms = {}
+        # (name, labels) -> value
+        self.counters = {}
+
+
+class Registry:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def shard(self) -> Shard:
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = Shard()
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def observe(self, labels: Labels, seconds: float):
+        histograms = self.shard().histograms
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = ([0] * BUCKETS, [0, 0.0, 0.0])
+        (counts, totals) = histogram
+        counts[bucket(seconds)] += 1
+        totals[0] += 1
+        totals[1] += seconds
+        if seconds > totals[2]:
+            totals[2] = seconds
+
+    def increment(self, name: str, labels: Labels, amount: int = 1):
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def merged(self):
+        """
+        :return: (histograms, counters) summed over the shards
+        """
+        histograms: Dict[Labels, tuple] = {}
+        counters: Dict[tuple, int] = {}
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            # list() copies the dicts at once, the threads may add entries meanwhile
+            for (labels, (counts, totals)) in list(shard.histograms.items()):
+                (merged_counts, merged_totals) = histograms.setdefault(labels, ([0] * BUCKETS, [0, 0.0, 0.0]))
+                for (index, count) in enumerate(list(counts)):
+                    merged_counts[index] += count
+                (count, total, highest) = totals
+                merged_totals[0] += count
+                merged_totals[1] += total
+                merged_totals[2] = max(merged_totals[2], highest)
+            for (key, value) in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def exposition(self) -> str:
+        """
+        :return: the metrics in the Prometheus text format
+        """
+        (histograms, counters) = self.merged()
+        lines = ['# HELP engine_move_seconds Time taken by an engine to choose a move',
+                 '# TYPE engine_move_seconds summary']
+        for (labels, (counts, (count, total, highest))) in sorted(histograms.items()):
+            for q in QUANTILES:
+                # the bound of the last bucket can be above the longest move
+                lines.append(f'engine_move_seconds{format_labels(labels + (("quantile", str(q)),))} '
+                             f'{min(quantile(counts, count, q), highest):.6g}')
+            lines.append(f'engine_move_seconds_sum{format_labels(labels)} {total:.6g}')
+            lines.append(f'engine_move_seconds_count{format_labels(labels)} {count}')
+
+        lines += ['# HELP engine_move_seconds_max Longest time taken by an engine to choose a move',
+                  '# TYPE engine_move_seconds_max gauge']
+        for (labels, (_, (_, _, highest))) in sorted(histograms.items()):
+            lines.append(f'engine_move_seconds_max{format_labels(labels)} {highest:.6g}')
+
+        for (name, description) in COUNTERS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for ((counter, labels), value) in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+COUNTERS = {'engine_nodes_total': 'Positions visited by the searches',
+            'engine_cutoffs_total': 'Beta cutoffs of the alpha-beta searches',
+            'engine_games_total': 'Games finished'}
+
+
+def format_labels(labels: Labels) -> str:
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for (_, value) in labels)
+    return '{' + ','.join(f'{name}="{value}"' for ((name, _), value) in zip(labels, escaped)) + '}'
+
+
+def quantile(counts, count: int, q: float) -> float:
+    """
+    :return: upper bound of the bucket of the q-quantile
+    """
+    rank = max(1, math.ceil(q * count))
+    seen = 0
+    for (index, bucket_count) in enumerate(counts):
+        seen += bucket_count
+        if seen >= rank:
+            return bucket_limit(index)
+    return 0.0
+
+
+# metrics of the process
+REGISTRY = Registry()
+
+
+def board_labels(game: str, rows: int, cols: int) -> Labels:
+    return ('game', game), ('board', f'{rows}x{cols}')
+
+
+def begin_move() -> tuple:
+    """
+    :return: token given to end_move once the move is chosen
+    """
+    return time.perf_counter(), search.STATS.nodes, search.STATS.cutoffs
+
+
+def end_move(token: tuple, game: str, rows: int, cols: int, depth: int, algorithm: str) -> MoveCost:
+    """
+    :return: the cost of the move since begin_move, nodes and cutoffs are the ones counted by search
+    """
+    (started, nodes, cutoffs) = token
+    return MoveCost(game, rows, cols, depth, algorithm, time.perf_counter() - started,
+                    search.STATS.nodes - nodes, search.STATS.cutoffs - cutoffs)
+
+
+def record_move(cost: MoveCost):
+    labels = board_labels(cost.game, cost.rows, cost.cols) + (('depth', str(cost.depth)),
+                                                              ('algorithm', cost.algorithm))
+    REGISTRY.observe(labels, cost.seconds)
+    counter_labels = board_labels(cost.game, cost.rows, cost.cols) + (('algorithm', cost.algorithm),)
+    if cost.nodes:
+        REGISTRY.increment('engine_nodes_total', counter_labels, cost.nodes)
+    if cost.cutoffs:
+        REGISTRY.increment('engine_cutoffs_total', counter_labels, cost.cutoffs)
+
+
+def record_game(game: str, rows: int, cols: int, result: str):
+    """
+    :param result: e.g. 'X', 'O' (the winner) or 'draw'
+    """
+    REGISTRY.increment('engine_games_total', board_labels(game, rows, cols) + (('result', str(result)),))
+
+
+class Exporter:
+    def __init__(self, path: Optional[str] = None, port: Optional[int] = None,
+                 interval: float = DEFAULT_INTERVAL, registry: Registry = REGISTRY):
+        """
+        :param path: file rewritten every interval seconds and by close
+        :param port: port of the endpoint, only bound to localhost
+        """
+        self.path = path
+        self.registry = registry
+        self.stopped = threading.Event()
+        self.threads = []
+        self.server = None
+
+        if path:
+            self.threads.append(threading.Thread(target=self.write_periodically, args=(interval,), daemon=True))
+        if port is not None:
+            self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+            self.threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def handler(self):
+        registry = self.registry
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return MetricsHandler
+
+    def write(self):
+        # scrapers never read a half written file
+        with open(self.path + '.tmp', 'w') as file:
+            file.write(self.registry.exposition())
+        os.replace(self.path + '.tmp', self.path)
+
+    def write_periodically(self, interval: float):
+        while not self.stopped.wait(interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+        if self.path:
+            self.write()
+
+
+def exporter_from_env() -> Optional[Exporter]:
+    """
+    :return: an exporter for METRICS_FILE / METRICS_PORT, None if neither is set
+    """
+    path = os.environ.get('METRICS_FILE')
+    port = os.environ.get('METRICS_PORT')
+    if not path and not port:
+        return None
+    return Exporter(path or None, int(port) if port else None,
+                    float(os.environ.get('METRICS_INTERVAL', DEFAULT_INTERVAL)))
+
+
+def close_exporter(exporter: Optional[Exporter]):
+    if exporter is not None:
+        exporter.close()
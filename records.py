@@ -0,0 +1,261 @@
+"""
+    Compact binary records of played games, for both games of the repository
+
+    A record file starts with a small header and is followed by one frame per game, appended
+    when the game ends:
+        sync (2 bytes) | payload length (u16) | crc32 of the payload (u32) | payload
+    The payload is a fixed header (game, board size, players, depth, result, seed) followed by
+    one byte per move, the index (row * cols + col) of the marked square.
+
+    A frame which was only partly written (e.g. the program was killed) fails its checksum,
+    the reader skips it and resynchronizes on the next sync marker.
+
+    Recording is enabled with the GAME_RECORDS environment variable, e.g.
+        GAME_RECORDS=games.bin python 3_in_a_line/3_in_a_line.py
+    and the records are summarized with
+        python records.py games.bin [--game ID]
+"""
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+
+# magic, version
+FILE_HEADER = struct.Struct('<4sH')
+MAGIC = b'GREC'
+VERSION = 1
+
+# sync, payload length, crc32
+FRAME = struct.Struct('<2sHI')
+SYNC = b'\xa5\x5a'
+
+# game, rows, cols, win length, first player, X player, O player, depth, result, seed
+RECORD_HEADER = struct.Struct('<BBBBBBBbbQ')
+
+TIC_TAC_TOE = 0
+NOT_3_IN_A_LINE = 1
+GAMES = ['tic-tac-toe', 'NOT 3 in a line']
+
+# who played each symbol
+PLAYERS = ['human', 'min_max', 'alpha_beta', 'mcts', 'random']
+
+# results, otherwise the player who won (1 for X, 2 for O)
+UNFINISHED = -1
+DRAW = 0
+
+
+class GameRecord(NamedTuple):
+    game: int
+    rows: int
+    cols: int
+    # number of symbols in a line which ends the game
+    win_length: int
+    # 1 if X moved first, 2 if O did
+    first_player: int
+    # index in PLAYERS of the player of X and of the player of O
+    x_player: int
+    o_player: int
+    # search depth of the engine, -1 if it isn't limited
+    depth: int
+    result: int
+    seed: int
+    # one byte per move, the index of the marked square
+    moves: bytes
+
+    def squares(self) -> Iterator[tuple]:
+        """
+        :return: (player, row, col) of every move, in the order they were played
+        """
+        player = self.first_player
+        for square in self.moves:
+            yield (player, *divmod(square, self.cols))
+            player = 3 - player
+
+
+def encode(record: GameRecord) -> bytes:
+    if record.rows * record.cols > 256:
+        raise ValueError('only boards with at most 256 squares can be recorded')
+    payload = RECORD_HEADER.pack(*record[:-1]) + bytes(record.moves)
+    return FRAME.pack(SYNC, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(payload) -> GameRecord:
+    return GameRecord(*RECORD_HEADER.unpack_from(payload), bytes(payload[RECORD_HEADER.size:]))
+
+
+class GameRecordWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.file.flush()
+        else:
+            check_header(path)
+
+    def append(self, record: GameRecord):
+        """
+        Appends one game, it is on disk when the call returns
+        """
+        self.file.write(encode(record))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_header(path: str):
+    with open(path, 'rb') as file:
+        header = file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header) != (MAGIC, VERSION):
+        raise ValueError(f'{path} is not a game record file (version {VERSION})')
+
+
+def writer_from_env() -> Optional[GameRecordWriter]:
+    """
+    :return: a writer for the file named by GAME_RECORDS, None if recording is disabled
+    """
+    path = os.environ.get('GAME_RECORDS')
+    return GameRecordWriter(path) if path else None
+
+
+class GameRecordReader:
+    """
+    Memory maps a record file (as it is when the reader is created); games are decoded
+    one at a time while iterating, and by game id through the index
+    """
+
+    def __init__(self, path: str):
+        check_header(path)
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = None
+
+    def frame_end(self, offset: int) -> Optional[int]:
+        """
+        :return: offset of the end of the frame at offset, None if it isn't a valid frame
+        """
+        if offset + FRAME.size > len(self.data):
+            return None
+        (sync, length, crc) = FRAME.unpack_from(self.data, offset)
+        end = offset + FRAME.size + length
+        if sync != SYNC or length < RECORD_HEADER.size or end > len(self.data) \
+                or zlib.crc32(self.data[offset + FRAME.size:end]) != crc:
+            return None
+        return end
+
+    def frames(self, offset: int = FILE_HEADER.size) -> Iterator[int]:
+        """
+        :return: offsets of the valid frames from offset on
+        """
+        while offset + FRAME.size <= len(self.data):
+            end = self.frame_end(offset)
+            if end is not None:
+                yield offset
+                offset = end
+            else:
+                # torn frame, continue from the next sync marker
+                offset = self.data.find(SYNC, offset + 1)
+                if offset == -1:
+                    return
+
+    def record_at(self, offset: int) -> GameRecord:
+        (_, length, _) = FRAME.unpack_from(self.data, offset)
+        return decode(self.data[offset + FRAME.size:offset + FRAME.size + length])
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for offset in self.frames():
+            yield self.record_at(offset)
+
+    def index(self) -> np.ndarray:
+        """
+        Offsets of the games by game id (their order in the file). The index is saved next
+        to the record file and only the games appended since it was saved are scanned.
+        """
+        if self.offsets is not None:
+            return self.offsets
+
+        index_path = self.path + '.idx.npy'
+        offsets = np.zeros(0, dtype=np.uint64)
+        start = FILE_HEADER.size
+        saved = -1
+        if os.path.exists(index_path):
+            offsets = np.load(index_path)
+            saved = len(offsets)
+            # drop the games which aren't valid anymore, e.g. the index belongs to another file
+            while len(offsets) and self.frame_end(int(offsets[-1])) is None:
+                offsets = offsets[:-1]
+            if len(offsets):
+                start = self.frame_end(int(offsets[-1]))
+
+        new_offsets = np.fromiter(self.frames(start), dtype=np.uint64)
+        if len(new_offsets) or len(offsets) != saved:
+            offsets = np.concatenate([offsets, new_offsets])
+            np.save(index_path + '.tmp.npy', offsets)
+            os.replace(index_path + '.tmp.npy', index_path)
+        self.offsets = offsets
+        return offsets
+
+    def __len__(self):
+        return len(self.index())
+
+    def __getitem__(self, game_id: int) -> GameRecord:
+        return self.record_at(int(self.index()[game_id]))
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def result_name(result: int) -> str:
+    if result == DRAW:
+        return 'draw'
+    return 'unfinished' if result == UNFINISHED else f'{"XO"[result - 1]} won'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a game record file')
+    parser.add_argument('path')
+    parser.add_argument('--game', type=int, default=None, help='print the moves of one game')
+    args = parser.parse_args()
+
+    with GameRecordReader(args.path) as reader:
+        if args.game is not None:
+            record = reader[args.game]
+            print(f'{GAMES[record.game]} {record.rows}x{record.cols}, X: {PLAYERS[record.x_player]}, '
+                  f'O: {PLAYERS[record.o_player]}, depth {record.depth}, seed {record.seed}, {result_name(record.result)}')
+            for (player, row, col) in record.squares():
+                print(f'{"XO"[player - 1]} {row} {col}')
+            return
+
+        results = Counter()
+        lengths = Counter()
+        for record in reader:
+            results[(GAMES[record.game], record.rows, record.cols, record.result)] += 1
+            lengths[(GAMES[record.game], record.rows, record.cols)] += len(record.moves)
+        for ((game, rows, cols, result), count) in sorted(results.items()):
+            print(f'{game} {rows}x{cols} {result_name(result)}: {count}')
+        for ((game, rows, cols), total) in sorted(lengths.items()):
+            games = sum(count for (key, count) in results.items() if key[:3] == (game, rows, cols))
+            print(f'{game} {rows}x{cols} mean length: {total / games:.2f}')
+
+
+if __name__ == '__main__':
+    main()
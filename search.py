@@ -0,0 +1,440 @@
+"""
+    Search algorithms shared by the games of the repository
+
+    The algorithms only talk to a position through the Game protocol below and play the
+    moves in place (make / unmake), so no board is copied during a search. Estimations are
+    always from the point of view of the maximizing player, given to every search.
+
+    The transposition table maps the key of a position to (depth, flag, estimation, best move)
+    of its last search. An entry answers a search of the same depth; an entry of any other
+    depth still gives the move searched first. A table kept from one move of the game to the
+    next (SearchTree) holds the tree searched under the actual reply of the opponent, which
+    deepening() continues: first at the depth which ends at the horizon of the last search,
+    where the kept entries answer the search, then one ply deeper at a time.
+
+    alpha_beta searches full width unless it's given a Selectivity: late moves are then
+    searched at a reduced depth first, and hopeless moves before the horizon are pruned.
+"""
+import itertools
+import math
+import os
+import time
+import zlib
+from typing import Hashable, List, NamedTuple, Optional, Protocol, Tuple
+
+INF = float('inf')
+
+# flags for the entries of the transposition table, an estimation computed
+# inside the (alpha, beta) window is exact, otherwise it is only a bound
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class Game(Protocol):
+    def legal_moves(self, player) -> List:
+        """
+        :return: moves of player, in the order they should be searched
+        """
+
+    def make(self, move, player):
+        ...
+
+    def unmake(self, move, player):
+        """
+        Takes back move, which must be the last move made
+        """
+
+    def terminal(self) -> bool:
+        ...
+
+    def evaluate(self, player, depth: int) -> float:
+        """
+        :param player: player to move
+        :param depth: depth left, final states reached earlier can be worth more
+        :return: estimation of the position, also called for final states
+        """
+
+    def forced_estimation(self, player, depth: int) -> Optional[float]:
+        """
+        :return: estimation of a position which isn't final but where every move of player
+        ends the game the same way, so none of them is searched (except at the root, which
+        has to give a move); None for the other positions
+        """
+
+    def position_key(self, player) -> Hashable:
+        """
+        :return: key of the position with player to move in the transposition tables
+        """
+
+    def adverse_player(self, player):
+        ...
+
+
+class SearchResult(NamedTuple):
+    estimation: float
+    # best move, None if the position is final or the depth is 0
+    move: Optional[object]
+
+
+class Variation(NamedTuple):
+    estimation: float
+    # principal variation, starting with the move of the root it's the estimation of
+    moves: List
+
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0
+        self.table_probes = 0
+        self.table_hits = 0
+        # moves not searched because of a beta cutoff
+        self.cutoffs = 0
+        # moves searched at a reduced depth, searched again at full depth, and pruned before the horizon
+        self.reductions = 0
+        self.re_searches = 0
+        self.futility_prunes = 0
+        # smallest depth left at a leaf, i.e. the deepest level reached
+        self.lowest_depth = INF
+
+    def reset(self):
+        self.__init__()
+
+
+# statistics of the searches, until they are reset
+STATS = SearchStats()
+
+
+class Selectivity(NamedTuple):
+    """
+    Settings of the selective search of alpha_beta
+
+    The moves after the first full_depth_moves are searched with a null window at the
+    depth reduced by reduction(), and again at full depth only if that search fails high,
+    i.e. if the move may be better than the best one so far.
+
+    Futility pruning is experimental and off by default: with futility_margin, the moves
+    one ply before the horizon which don't end the game are pruned when the estimation of
+    the position is worse than the window by more than the margin. On this game it never
+    saved time (the static estimation costs about as much as the leaves it spares), see
+    3_in_a_line/selective.py --margin.
+    """
+    # plies removed by depth left and by number of the move (from 0, in the order of the
+    # search); the last row / column holds for the depths / moves past the end of the table
+    reductions: Tuple[Tuple[int, ...], ...]
+    full_depth_moves: int = 3
+    # no move is reduced with less depth left than this
+    min_reduction_depth: int = 3
+    # None (the default, used by every engine) doesn't prune
+    futility_margin: Optional[float] = None
+
+    def reduction(self, depth: int, number: int) -> int:
+        row = self.reductions[min(depth, len(self.reductions) - 1)]
+        # the reduced search still goes one ply deep
+        return min(row[min(number, len(row) - 1)], depth - 2)
+
+    def variant(self) -> str:
+        """
+        :return: short name of the settings, for the tables which must not mix the
+        estimations of different searches (e.g. a persistent one)
+        """
+        return f'selective {zlib.crc32(repr(tuple(self)).encode()):08x}'
+
+
+def reduction_table(base: float = 0.5, divisor: float = 2.0, depths: int = 32, moves: int = 64):
+    """
+    :return: reductions of base + ln(depth) * ln(number + 1) / divisor plies, rounded down
+    (for Selectivity): deep searches and late moves are reduced the most
+    """
+    return tuple(tuple(int(base + math.log(max(depth, 1)) * math.log(number + 1) / divisor)
+                       for number in range(moves)) for depth in range(depths))
+
+
+DEFAULT_TREE_MB = 64
+# rough size of an entry of a SearchTree (key, tuple and dict slot), in bytes
+ENTRY_BYTES = 300
+# deepening() expects a search one ply deeper to take at least this many times longer
+DEEPENING_GROWTH = 3.0
+
+
+class SearchTree(dict):
+    """
+    Transposition table kept for a whole game, with a memory cap: the entries stored or
+    used the least recently, i.e. the ones of positions the game moved away from, are
+    dropped first
+    """
+
+    def __init__(self, max_mb: Optional[float] = None):
+        """
+        :param max_mb: memory cap, SEARCH_TREE_MB (or DEFAULT_TREE_MB) if not given
+        """
+        super().__init__()
+        if max_mb is None:
+            max_mb = float(os.environ.get('SEARCH_TREE_MB', DEFAULT_TREE_MB))
+        self.max_entries = max(1, int(max_mb * (1 << 20)) // ENTRY_BYTES)
+        # ply (number of moves of the game) where the last search of deepening() stopped,
+        # None before the first one
+        self.horizon = None
+
+    def get(self, key, default=None):
+        entry = super().pop(key, None)
+        if entry is None:
+            return default
+        # the entry moves to the end of the dict, with the most recent ones
+        super().__setitem__(key, entry)
+        return entry
+
+    def __setitem__(self, key, value):
+        super().pop(key, None)
+        super().__setitem__(key, value)
+        if len(self) > self.max_entries:
+            self.prune(self.max_entries * 7 // 8)
+
+    def prune(self, entries: int):
+        """
+        Keeps the most recent entries, at most entries of them
+        """
+        for key in list(itertools.islice(iter(self), max(0, len(self) - entries))):
+            del self[key]
+
+
+def min_max(game: Game, player, depth: int, maximizer, root: bool = True) -> SearchResult:
+    """
+    :param player: player to move
+    :param maximizer: the player who maximizes the estimation, the other one minimizes it
+    """
+    STATS.nodes += 1
+    if depth == 0 or game.terminal():
+        if depth < STATS.lowest_depth:
+            STATS.lowest_depth = depth
+        return SearchResult(game.evaluate(player, depth), None)
+    if not root:
+        forced = game.forced_estimation(player, depth)
+        if forced is not None:
+            return SearchResult(forced, None)
+
+    maximize = player == maximizer
+    best = SearchResult(-INF if maximize else INF, None)
+    for move in game.legal_moves(player):
+        game.make(move, player)
+        estimation = min_max(game, game.adverse_player(player), depth - 1, maximizer, False).estimation
+        game.unmake(move, player)
+
+        if estimation > best.estimation if maximize else estimation < best.estimation:
+            best = SearchResult(estimation, move)
+    return best
+
+
+def alpha_beta(game: Game, player, depth: int, maximizer, alpha: float = -INF, beta: float = INF,
+               table: Optional[dict] = None, root: bool = True,
+               selectivity: Optional[Selectivity] = None) -> SearchResult:
+    """
+    :param table: optional transposition table (dict, e.g. a SearchTree) shared between
+    searches; the root is never answered from the table so the best move is always found
+    :param selectivity: late move reductions and futility pruning, None for a full width search
+    """
+    STATS.nodes += 1
+    if depth == 0 or game.terminal():
+        if depth < STATS.lowest_depth:
+            STATS.lowest_depth = depth
+        return SearchResult(game.evaluate(player, depth), None)
+    if not root:
+        forced = game.forced_estimation(player, depth)
+        if forced is not None:
+            return SearchResult(forced, None)
+
+    key = None
+    table_move = None
+    (original_alpha, original_beta) = (alpha, beta)
+    if table is not None:
+        key = game.position_key(player)
+        entry = table.get(key)
+        STATS.table_probes += 1
+        if entry is not None:
+            (entry_depth, flag, estimation, table_move) = entry
+            STATS.table_hits += 1
+            # the estimations depend on the depth, other entries only order the moves
+            if not root and entry_depth == depth:
+                if flag == EXACT:
+                    return SearchResult(estimation, table_move)
+                elif flag == LOWER_BOUND:
+                    alpha = max(alpha, estimation)
+                else:
+                    beta = min(beta, estimation)
+                if alpha >= beta:
+                    return SearchResult(estimation, table_move)
+
+    moves = game.legal_moves(player)
+    # the best move of an earlier search is searched first
+    if table_move is not None and table_move in moves:
+        moves.remove(table_move)
+        moves.insert(0, table_move)
+
+    maximize = player == maximizer
+    # one ply before the horizon, only the moves which end the game can bring a position
+    # far enough out of the window back into it; the others are worth at most futile
+    futile = None
+    if selectivity is not None and selectivity.futility_margin is not None and depth == 1 and not root:
+        static = game.evaluate(player, depth)
+        if maximize and static + selectivity.futility_margin <= alpha:
+            futile = static + selectivity.futility_margin
+        elif not maximize and static - selectivity.futility_margin >= beta:
+            futile = static - selectivity.futility_margin
+
+    best = SearchResult(-INF if maximize else INF, None)
+    adverse_player = game.adverse_player(player)
+    for (number, move) in enumerate(moves):
+        game.make(move, player)
+        reduction = 0
+        if selectivity is not None and number >= selectivity.full_depth_moves \
+                and depth >= selectivity.min_reduction_depth:
+            reduction = selectivity.reduction(depth, number)
+
+        if futile is not None and not game.terminal():
+            STATS.futility_prunes += 1
+            estimation = futile
+        elif reduction > 0:
+            # null window: the search only tells if the move is better than the best one so far
+            STATS.reductions += 1
+            (low, high) = (alpha, math.nextafter(alpha, INF)) if maximize else (math.nextafter(beta, -INF), beta)
+            estimation = alpha_beta(game, adverse_player, depth - 1 - reduction, maximizer, low, high, table,
+                                    False, selectivity).estimation
+            if estimation > alpha if maximize else estimation < beta:
+                STATS.re_searches += 1
+                estimation = alpha_beta(game, adverse_player, depth - 1, maximizer, alpha, beta, table, False,
+                                        selectivity).estimation
+        else:
+            estimation = alpha_beta(game, adverse_player, depth - 1, maximizer, alpha, beta, table, False,
+                                    selectivity).estimation
+        game.unmake(move, player)
+
+        if maximize:
+            if estimation > best.estimation:
+                best = SearchResult(estimation, move)
+            alpha = max(alpha, estimation)
+        else:
+            if estimation < best.estimation:
+                best = SearchResult(estimation, move)
+            beta = min(beta, estimation)
+        if alpha >= beta:
+            STATS.cutoffs += 1
+            break
+
+    if key is not None:
+        if best.estimation <= original_alpha:
+            table[key] = (depth, UPPER_BOUND, best.estimation, best.move)
+        elif best.estimation >= original_beta:
+            table[key] = (depth, LOWER_BOUND, best.estimation, best.move)
+        else:
+            table[key] = (depth, EXACT, best.estimation, best.move)
+    return best
+
+
+def deepening(game: Game, player, depth: int, maximizer, ply: int, tree: SearchTree, alpha: float = -INF,
+              beta: float = INF, selectivity: Optional[Selectivity] = None, deepest: Optional[int] = None,
+              seconds: Optional[float] = None) -> SearchResult:
+    """
+    alpha_beta to depth continuing the search of the previous move kept in tree: the entries
+    only answer a search of their own depth, so the position is first searched to the horizon
+    of that search (answered from tree below the root), then one ply deeper at a time up to
+    depth, each search ordering the next one
+
+    :param ply: number of moves played before the position, the horizon of the search is ply + depth
+    :param deepest: keep deepening past depth up to deepest, while the next search is expected
+    to end within seconds of the start (it takes DEEPENING_GROWTH times the time of the last one,
+    or more if the last one grew faster); tree.horizon - ply is the depth reached
+    """
+    deepest = depth if deepest is None else max(depth, deepest)
+    first = depth if tree.horizon is None else min(deepest, max(1, tree.horizon - ply))
+    start = time.perf_counter()
+    (iteration_depth, last, previous) = (first, 0.0, 0.0)
+    while True:
+        t_before = time.perf_counter()
+        result = alpha_beta(game, player, iteration_depth, maximizer, alpha, beta, tree, True, selectivity)
+        (last, previous) = (time.perf_counter() - t_before, last)
+        if iteration_depth >= deepest:
+            break
+        if iteration_depth >= depth:
+            growth = max(DEEPENING_GROWTH, last / previous) if previous > 0 else DEEPENING_GROWTH
+            if seconds is None or time.perf_counter() - start + last * growth > seconds:
+                break
+        iteration_depth += 1
+    tree.horizon = ply + iteration_depth
+    return result
+
+
+def multi_pv(game: Game, player, depth: int, maximizer, k: int, table: Optional[dict] = None) -> List[Variation]:
+    """
+    The k best moves of player with their estimations and principal variations, in a single
+    search: the window of the root is bounded by the k-th best estimation found so far
+    instead of the best one, so only the moves which enter the top k get an exact estimation
+
+    :param table: transposition table shared with the other searches, it orders the moves
+    and gives the variations; without one the variations only hold their first move
+    :return: at most k variations, the best one first
+    """
+    if k < 1:
+        raise ValueError(f'multi_pv needs at least one variation, got k={k}')
+    STATS.nodes += 1
+    if depth == 0 or game.terminal():
+        return []
+
+    local_table = {} if table is None else table
+    key = game.position_key(player)
+    entry = local_table.get(key)
+    STATS.table_probes += 1
+    moves = game.legal_moves(player)
+    if entry is not None:
+        STATS.table_hits += 1
+        if entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+
+    maximize = player == maximizer
+    # (estimation, move), the best one first
+    top = []
+    for move in moves:
+        (alpha, beta) = (-INF, INF)
+        if len(top) == k:
+            if maximize:
+                alpha = top[-1][0]
+            else:
+                beta = top[-1][0]
+        game.make(move, player)
+        estimation = alpha_beta(game, game.adverse_player(player), depth - 1, maximizer, alpha, beta, local_table,
+                                False).estimation
+        game.unmake(move, player)
+
+        # an estimation outside of the window is only a bound, the move isn't in the top k
+        if alpha < estimation < beta:
+            top.append((estimation, move))
+            top.sort(key=lambda pair: -pair[0] if maximize else pair[0])
+            del top[k:]
+
+    if top:
+        local_table[key] = (depth, EXACT, *top[0])
+    variations = []
+    for (estimation, move) in top:
+        game.make(move, player)
+        line = principal_variation(game, game.adverse_player(player), depth - 1, local_table)
+        game.unmake(move, player)
+        variations.append(Variation(estimation, [move] + line))
+    return variations
+
+
+def principal_variation(game: Game, player, depth: int, table: dict) -> List:
+    """
+    :return: the best moves stored in the table from the position, at most depth of them
+    """
+    played = []
+    while len(played) < depth and not game.terminal():
+        entry = table.get(game.position_key(player))
+        if entry is None or entry[3] not in game.legal_moves(player):
+            break
+        game.make(entry[3], player)
+        played.append((entry[3], player))
+        player = game.adverse_player(player)
+
+    for (move, mover) in reversed(played):
+        game.unmake(move, mover)
+    return [move for (move, _) in played]
@@ -0,0 +1,299 @@
+"""
+    Test positions with known best moves, to measure how fast each engine finds them
+
+    A suite file has one position per line: the game (X&O1 or 3_in_a_line), the board in
+    the notation of perft.py (rows separated by '/', '.' for an empty square, then the
+    player to move) and operations separated by ';':
+        bm    every move which keeps the best result (win, draw or loss), as row,col
+        win   number of symbols in a line needed to win the X&O1 game, min(size, 3) if not given
+        id    name of the position
+    the other operations (e.g. result) are only read by people.
+    e.g.
+        X&O1 XX./OO./... X; bm 0,2; id "x3-win"
+        3_in_a_line XO../.X../..../.... O; bm 2,0 3,3; id "n4-01"
+
+    Every engine searches every position for at most --time seconds, one ply deeper at a
+    time (twice as many playouts at a time for mcts, a single search for the endgame
+    solver); a search which doesn't finish in time is dropped. A position is solved when the
+    last search which finished plays a best move, its solve time is when the engine found a
+    best move and kept it through every later search. The positions run in parallel, one
+    per worker process, so the times are only comparable between runs with the same
+    number of processes.
+
+        python suite.py
+        python suite.py --time 2 --engines alpha_beta endgame --processes 4
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import signal
+import time
+from typing import Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import analysis
+import search
+
+# the modules of 3_in_a_line/ are importable once analysis is
+import endgame  # noqa: E402
+import mcts  # noqa: E402
+import perft  # noqa: E402
+
+DEFAULT_SUITE = os.path.join(analysis.ROOT_DIR, 'suite.txt')
+DEFAULT_TIME = 1.0
+
+# engines which can play each game, in the order of the columns
+ENGINES = {analysis.TIC_TAC_TOE: ('min_max', 'alpha_beta'),
+           analysis.NOT_3_IN_A_LINE: ('min_max', 'alpha_beta', 'selective', 'mcts', 'endgame')}
+ALL_ENGINES = ('min_max', 'alpha_beta', 'selective', 'mcts', 'endgame')
+
+# playouts of the first mcts search
+MCTS_PLAYOUTS = 256
+
+
+class Position(NamedTuple):
+    kind: str
+    name: str
+    # board and player in the notation of perft.py
+    notation: str
+    best_moves: FrozenSet[Tuple[int, int]]
+    win_length: Optional[int] = None
+
+
+class Outcome(NamedTuple):
+    # index of the position in the suite
+    position: int
+    engine: str
+    # move of the last search which finished in time, None if none did
+    move: Optional[Tuple[int, int]]
+    # depth of the search which solved the position (of the last search which finished if
+    # it isn't solved), None for the engines without a depth
+    depth: Optional[int]
+    # None if the position isn't solved
+    solve_time: Optional[float]
+    # positions searched (playouts for mcts) by the searches which finished in time
+    nodes: int
+
+
+class TimeUp(Exception):
+    pass
+
+
+def parse_line(line: str, number: int) -> Position:
+    (position, *operations) = [part.strip() for part in line.split(';')]
+    try:
+        (kind, board, player) = position.split()
+    except ValueError:
+        raise ValueError(f'line {number}: expected "<game> <board> <player>", got {position!r}') from None
+    if kind not in ENGINES:
+        raise ValueError(f'line {number}: unknown game {kind!r}')
+
+    fields = {}
+    for operation in operations:
+        if operation:
+            (opcode, _, operand) = operation.partition(' ')
+            fields[opcode] = operand.strip()
+    if 'bm' not in fields:
+        raise ValueError(f'line {number}: no best move')
+    best_moves = frozenset(tuple(int(coordinate) for coordinate in move.split(',')) for move in fields['bm'].split())
+    win_length = int(fields['win']) if 'win' in fields else None
+    return Position(kind, fields.get('id', f'line {number}').strip('"'), f'{board} {player}', best_moves, win_length)
+
+
+def load(path: str = DEFAULT_SUITE) -> List[Position]:
+    """
+    :return: the positions of a suite file, blank lines and the lines starting with '#' are skipped
+    """
+    with open(path) as file:
+        return [parse_line(line, number) for (number, line) in enumerate(file, 1)
+                if line.strip() and not line.lstrip().startswith('#')]
+
+
+def setup(position: Position):
+    """
+    Sets the class attributes of the engine for the position, the player to move maximizes
+
+    :return: (board implementing search.Game, player to move, number of columns)
+    """
+    (board, player) = position.notation.split()
+    module = analysis.engine(position.kind)
+    if position.kind == analysis.TIC_TAC_TOE:
+        rows = board.split('/')
+        game = module.Game
+        game.init(len(rows), position.win_length or min(len(rows), 3))
+        (game.MAX_P, game.MIN_P) = (player, 'O' if player == 'X' else 'X')
+        return game([game.EMPTY if symbol == '.' else symbol for row in rows for symbol in row]), player, len(rows)
+
+    (matrix, player) = perft.parse(position.notation)
+    game_board = module.GameBoard
+    (game_board.BOARD_ROWS, game_board.BOARD_COLS) = matrix.shape
+    (game_board.MAX_P, game_board.MIN_P) = (player, 2 if player == 1 else 1)
+    board = game_board(matrix)
+    board.begin_search()
+    return board, player, matrix.shape[1]
+
+
+def searches(position: Position, engine: str) -> Iterator[Tuple[Optional[int], Tuple[int, int], int]]:
+    """
+    :return: (depth, move, nodes so far) of each search of engine, from the fastest one
+    """
+    (board, player, cols) = setup(position)
+    if engine in ('min_max', 'alpha_beta', 'selective'):
+        # the table is kept from one depth to the next, like in a game
+        table = search.SearchTree()
+        # alpha_beta with the late move reductions of SELECTIVE_DEPTH
+        selectivity = analysis.engine(position.kind).GameBoard.SELECTIVITY if engine == 'selective' else None
+        nodes = search.STATS.nodes
+        empty = len(board.legal_moves(player)) if position.kind == analysis.TIC_TAC_TOE \
+            else int(np.count_nonzero(board.matrix == 0))
+        for depth in range(1, empty + 1):
+            if engine == 'min_max':
+                result = search.min_max(board, player, depth, player)
+            else:
+                result = search.alpha_beta(board, player, depth, player, table=table, selectivity=selectivity)
+            move = divmod(result.move, cols) if position.kind == analysis.TIC_TAC_TOE else result.move
+            yield depth, move, search.STATS.nodes - nodes
+    elif engine == 'mcts':
+        (playouts, done) = (MCTS_PLAYOUTS, 0)
+        while True:
+            (move, _, iterations) = mcts.search(board.matrix, player, playouts)
+            done += iterations
+            yield None, move, done
+            playouts *= 2
+    else:
+        solver = endgame.EndgameSolver(*board.matrix.shape)
+        (_, _, move, _) = solver.solve(board.matrix, player)
+        yield None, move, solver.nodes
+
+
+def time_up(signum, frame):
+    raise TimeUp()
+
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """
+    Interrupts the searches with TimeUp after seconds; without interval timers (Windows)
+    the current search always finishes
+    """
+    if not hasattr(signal, 'setitimer'):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, time_up)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def solved_by(finished: List[tuple], best_moves: FrozenSet[Tuple[int, int]]) -> Optional[tuple]:
+    """
+    :param finished: (time, depth, move, nodes) of the searches which finished in time
+    :return: the first search after which every search played a best move, None if the last one didn't
+    """
+    solving = None
+    for search_done in finished:
+        if search_done[2] not in best_moves:
+            solving = None
+        elif solving is None:
+            solving = search_done
+    return solving
+
+
+def run(task) -> Outcome:
+    (index, position, engine, time_limit) = task
+    finished = []
+    started = time.perf_counter()
+    try:
+        with deadline(time_limit):
+            for (depth, move, nodes) in searches(position, engine):
+                elapsed = time.perf_counter() - started
+                if elapsed > time_limit:
+                    break
+                finished.append((elapsed, depth, move, nodes))
+    except TimeUp:
+        pass
+
+    if not finished:
+        return Outcome(index, engine, None, None, None, 0)
+    (_, depth, move, nodes) = finished[-1]
+    solving = solved_by(finished, position.best_moves)
+    if solving is None:
+        return Outcome(index, engine, move, depth, None, nodes)
+    return Outcome(index, engine, move, solving[1], solving[0], nodes)
+
+
+def run_suite(positions: List[Position], engines=ALL_ENGINES, time_limit: float = DEFAULT_TIME,
+              processes: Optional[int] = None) -> Dict[Tuple[int, str], Outcome]:
+    """
+    :param processes: number of worker processes, None for one per CPU and 1 to run in this process
+    :return: outcomes by (index of the position, engine)
+    """
+    tasks = [(index, position, engine, time_limit) for (index, position) in enumerate(positions)
+             for engine in engines if engine in ENGINES[position.kind]]
+    if processes == 1:
+        outcomes = map(run, tasks)
+        return {(outcome.position, outcome.engine): outcome for outcome in outcomes}
+    with multiprocessing.Pool(processes) as pool:
+        return {(outcome.position, outcome.engine): outcome for outcome in pool.imap_unordered(run, tasks)}
+
+
+def table(positions: List[Position], outcomes: Dict[Tuple[int, str], Outcome], engines, time_limit: float) -> str:
+    """
+    :return: the solve time (and depth) of every position by engine, with the totals of every engine;
+    an unsolved position counts as time_limit in the total time
+    """
+    width = max([len('position')] + [len(position.name) for position in positions]) + 2
+    lines = ['position'.ljust(width) + ''.join(engine.rjust(16) for engine in engines)]
+    for (index, position) in enumerate(positions):
+        cells = []
+        for engine in engines:
+            outcome = outcomes.get((index, engine))
+            if outcome is None:
+                cells.append('')
+            elif outcome.solve_time is None:
+                cells.append('-')
+            else:
+                depth = '' if outcome.depth is None else f' d{outcome.depth}'
+                cells.append(f'{outcome.solve_time:.3f}{depth}')
+        lines.append(position.name.ljust(width) + ''.join(cell.rjust(16) for cell in cells))
+
+    (solved, times, nodes) = ([], [], [])
+    for engine in engines:
+        played = [outcome for ((_, name), outcome) in outcomes.items() if name == engine]
+        solved.append(f'{sum(outcome.solve_time is not None for outcome in played)}/{len(played)}')
+        times.append(f'{sum(time_limit if outcome.solve_time is None else outcome.solve_time for outcome in played):.2f} s')
+        nodes.append(f'{sum(outcome.nodes for outcome in played):,}')
+    lines.append('')
+    lines.append('solved'.ljust(width) + ''.join(cell.rjust(16) for cell in solved))
+    lines.append('time'.ljust(width) + ''.join(cell.rjust(16) for cell in times))
+    lines.append('nodes'.ljust(width) + ''.join(cell.rjust(16) for cell in nodes))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the engines to the best move of known positions')
+    parser.add_argument('suite', nargs='?', default=DEFAULT_SUITE, help='suite file, suite.txt if not given')
+    parser.add_argument('--time', type=float, default=DEFAULT_TIME, help='time limit of a position in seconds')
+    parser.add_argument('--engines', nargs='+', choices=ALL_ENGINES, default=ALL_ENGINES)
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, one per CPU by default')
+    parser.add_argument('--filter', default=None, help='only the positions whose id contains this')
+    args = parser.parse_args()
+
+    positions = load(args.suite)
+    if args.filter:
+        positions = [position for position in positions if args.filter in position.name]
+    engines = [engine for engine in ALL_ENGINES if engine in args.engines]
+
+    t_before = time.perf_counter()
+    outcomes = run_suite(positions, engines, args.time, args.processes)
+    print(table(positions, outcomes, engines, args.time))
+    print(f'=== {len(positions)} positions in {time.perf_counter() - t_before:.1f} s ===')
+
+
+if __name__ == '__main__':
+    main()
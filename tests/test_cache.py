@@ -0,0 +1,125 @@
+import os
+import struct
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+# the engines live in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+import cache  # noqa: E402
+import perft  # noqa: E402
+import search  # noqa: E402
+
+# a few buckets, so that keys can be chosen to share one
+SIZE_MB = 0.001
+
+
+def opened(path: str, size_mb: float = SIZE_MB) -> cache.TranspositionCache:
+    return cache.TranspositionCache(str(path), size_mb)
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = tmp_path / 'tt.bin'
+    disk = opened(path)
+    disk.store(12345, 6, search.EXACT, -0.25)
+    disk.store(67890, 3, search.LOWER_BOUND, 101.0)
+    generation = disk.generation
+    disk.close()
+
+    disk = opened(path)
+    assert disk.generation == generation + 1
+    assert disk.probe(12345) == (6, search.EXACT, -0.25)
+    assert disk.probe(67890) == (3, search.LOWER_BOUND, 101.0)
+    assert disk.probe(11111) is None
+    disk.close()
+
+
+def test_corrupted_slot_is_ignored(tmp_path):
+    path = tmp_path / 'tt.bin'
+    disk = opened(path)
+    # the first slot of its bucket, which was empty
+    disk.store(12345, 6, search.EXACT, -0.25)
+    bucket = 12345 % disk.buckets
+    disk.close()
+
+    with open(path, 'r+b') as file:
+        # the score of the entry, covered by its checksum
+        file.seek(cache.HEADER.size + bucket * cache.SLOTS * cache.SLOT_DTYPE.itemsize + 8)
+        file.write(struct.pack('<d', 0.75))
+    disk = opened(path)
+    assert disk.probe(12345) is None
+    disk.close()
+
+
+def test_deeper_entry_is_kept_and_shallowest_replaced(tmp_path):
+    disk = opened(tmp_path / 'tt.bin')
+    # keys of the same bucket
+    keys = [1 + disk.buckets * index for index in range(cache.SLOTS + 1)]
+    for (depth, key) in enumerate(keys[:cache.SLOTS], 3):
+        disk.store(key, depth, search.EXACT, float(depth))
+    # a shallower result doesn't replace a deeper one of the same key
+    disk.store(keys[1], 2, search.EXACT, -1.0)
+    assert disk.probe(keys[1]) == (4, search.EXACT, 4.0)
+
+    # the bucket is full: the shallowest entry (depth 3) makes room
+    disk.store(keys[-1], 9, search.EXACT, 9.0)
+    assert disk.probe(keys[0]) is None
+    assert [disk.probe(key)[0] for key in keys[1:]] == [4, 5, 6, 9]
+    disk.close()
+
+
+def test_old_generations_expire(tmp_path):
+    path = tmp_path / 'tt.bin'
+    disk = opened(path)
+    disk.store(12345, 6, search.EXACT, 0.5)
+    disk.close()
+    for _ in range(cache.MAX_AGE - 1):
+        opened(path).close()
+    disk = opened(path)
+    assert disk.probe(12345) is None
+    disk.close()
+
+
+def test_file_is_recreated_for_another_size_or_version(tmp_path):
+    path = tmp_path / 'tt.bin'
+    disk = opened(path)
+    disk.store(12345, 6, search.EXACT, 0.5)
+    disk.close()
+
+    disk = opened(path, 2 * SIZE_MB)
+    assert disk.probe(12345) is None
+    disk.store(12345, 6, search.EXACT, 0.5)
+    disk.close()
+
+    with open(path, 'r+b') as file:
+        file.seek(len(cache.MAGIC))
+        file.write(struct.pack('<H', cache.VERSION - 1))
+    disk = opened(path, 2 * SIZE_MB)
+    assert (disk.generation, disk.probe(12345)) == (1, None)
+    disk.close()
+
+
+def test_selective_and_full_width_searches_never_share_entries(tmp_path, monkeypatch):
+    monkeypatch.setenv('TT_CACHE', str(tmp_path / 'tt.bin'))
+    module = analysis.engine(analysis.NOT_3_IN_A_LINE)
+    (matrix, player) = perft.parse('X..../.O.../..X../...../..... O')
+    (module.GameBoard.BOARD_ROWS, module.GameBoard.BOARD_COLS) = matrix.shape
+    (module.GameBoard.MAX_P, module.GameBoard.MIN_P) = (1, 2)
+    selectivity = search.Selectivity(search.reduction_table(1.5, 1.0), 1, 2)
+
+    def searched(table, settings):
+        board = module.GameBoard(matrix.copy())
+        board.begin_search()
+        return search.alpha_beta(board, player, 5, 1, -500, 500, table, selectivity=settings)
+
+    selective = cache.open_table(module.cache_variant(selectivity))
+    reductions = search.STATS.reductions
+    searched(selective, selectivity)
+    assert search.STATS.reductions > reductions
+    assert cache.close_table(selective)
+
+    full_width = cache.open_table(module.cache_variant())
+    assert all(full_width.disk.probe(full_width.disk_key(key)) is None for key in selective)
+    assert searched(full_width, None) == searched(search.SearchTree(), None)
+    cache.close_table(full_width)
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the record format lives in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records  # noqa: E402
+
+
+def game(seed: int, moves: bytes = b'\x00\x07\x0e\x15') -> records.GameRecord:
+    return records.GameRecord(records.NOT_3_IN_A_LINE, 6, 6, 3, 1, records.PLAYERS.index('human'),
+                              records.PLAYERS.index('alpha_beta'), 8, 2, seed, moves)
+
+
+def write(path: str, games) -> str:
+    with records.GameRecordWriter(path) as writer:
+        for record in games:
+            writer.append(record)
+    return path
+
+
+def read(path: str):
+    with records.GameRecordReader(path) as reader:
+        return list(reader)
+
+
+def test_encode_decode_roundtrip():
+    record = game((1 << 64) - 1)
+    frame = records.encode(record)
+    assert frame[:2] == records.SYNC
+    assert records.decode(frame[records.FRAME.size:]) == record
+
+
+def test_too_large_board_is_rejected():
+    with pytest.raises(ValueError):
+        records.encode(game(0)._replace(rows=17, cols=16))
+
+
+def test_file_roundtrip_and_index(tmp_path):
+    games = [game(seed, bytes(range(seed))) for seed in range(5)]
+    path = write(str(tmp_path / 'games.bin'), games)
+    assert read(path) == games
+    with records.GameRecordReader(path) as reader:
+        assert len(reader) == 5
+        assert reader[3] == games[3]
+    assert os.path.exists(path + '.idx.npy')
+
+
+def test_corrupted_frame_is_skipped(tmp_path):
+    games = [game(seed) for seed in range(3)]
+    path = write(str(tmp_path / 'games.bin'), games)
+    frame_size = len(records.encode(games[0]))
+    with open(path, 'r+b') as file:
+        # last move of the second game, covered by its crc32
+        file.seek(records.FILE_HEADER.size + 2 * frame_size - 1)
+        file.write(b'\xff')
+    assert read(path) == [games[0], games[2]]
+
+
+def test_torn_frame_is_resynchronized(tmp_path):
+    path = write(str(tmp_path / 'games.bin'), [game(0)])
+    with open(path, 'ab') as file:
+        # a game cut short by a crash
+        file.write(records.encode(game(1))[:-3])
+    write(path, [game(2)])
+    assert read(path) == [game(0), game(2)]
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'games.bin')
+    write(path, [game(seed, bytes(range(10))) for seed in range(4)])
+    with records.GameRecordReader(path) as reader:
+        assert len(reader) == 4
+
+    # another file under the same name, its frames don't start where the saved ones did
+    os.remove(path)
+    other = [game(seed, bytes(range(3))) for seed in range(10, 16)]
+    write(path, other)
+    with records.GameRecordReader(path) as reader:
+        assert len(reader) == 6
+        assert [reader[game_id] for game_id in range(6)] == other
+    assert len(np.load(path + '.idx.npy')) == 6
+
+    # the games appended later are added to the saved index
+    write(path, [game(20)])
+    with records.GameRecordReader(path) as reader:
+        assert len(reader) == 7
+        assert reader[6] == game(20)
+
+
+def test_other_file_is_rejected(tmp_path):
+    path = tmp_path / 'games.bin'
+    path.write_bytes(b'not a record file')
+    with pytest.raises(ValueError):
+        records.GameRecordReader(str(path))
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+# the engines live in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+import perft  # noqa: E402
+import search  # noqa: E402
+
+# X to move, each of the 3 empty squares forms 3 X in a line
+ALL_LOSING = 'XX../XOXX/OXOO/.OO. X'
+
+
+def board(position: str):
+    (matrix, player) = perft.parse(position)
+    game_board = analysis.engine(analysis.NOT_3_IN_A_LINE).GameBoard
+    (game_board.BOARD_ROWS, game_board.BOARD_COLS) = matrix.shape
+    (game_board.MAX_P, game_board.MIN_P) = (1, 2)
+    result = game_board(matrix)
+    result.begin_search()
+    return result, player
+
+
+def test_all_losing_position_is_not_expanded():
+    (game_board, player) = board(ALL_LOSING)
+    # the position of the opponent after the move of the parent
+    for searched in (lambda: search.alpha_beta(game_board, player, 3, 1, table=search.SearchTree(), root=False),
+                     lambda: search.min_max(game_board, player, 3, 1, root=False)):
+        nodes = search.STATS.nodes
+        result = searched()
+        assert search.STATS.nodes - nodes == 1
+        assert result == search.SearchResult(game_board.final_estimation(2, 2), None)
+
+
+def test_all_losing_root_plays_one_losing_move():
+    (game_board, player) = board(ALL_LOSING)
+    nodes = search.STATS.nodes
+    result = search.alpha_beta(game_board, player, 3, 1)
+    assert search.STATS.nodes - nodes == 2
+    assert result.estimation == game_board.final_estimation(2, 2)
+    assert result.move in game_board.classified_moves(player)[1]
+
+
+def test_multi_pv_needs_one_variation():
+    (game_board, player) = board('X.../.O../..../.... X')
+    with pytest.raises(ValueError):
+        search.multi_pv(game_board, player, 3, 1, 0)
+    variations = search.multi_pv(game_board, player, 3, 1, 1, search.SearchTree())
+    assert len(variations) == 1
+    assert variations[0].estimation == search.alpha_beta(game_board, player, 3, 1).estimation
+
+
+def test_deepening_goes_deeper_only_within_its_time():
+    (game_board, player) = board('X.../.O../..../.... X')
+    # no time budget, or no time at all: to depth only
+    for seconds in (None, 0.0):
+        tree = search.SearchTree()
+        search.deepening(game_board, player, 2, 1, 2, tree, deepest=4, seconds=seconds)
+        assert tree.horizon == 2 + 2
+    tree = search.SearchTree()
+    result = search.deepening(game_board, player, 2, 1, 2, tree, deepest=4, seconds=1000.0)
+    assert tree.horizon == 2 + 4
+    assert result.estimation == search.alpha_beta(game_board, player, 4, 1).estimation
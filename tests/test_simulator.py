@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+
+# the engines live in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402,F401
+import records  # noqa: E402
+import simulator  # noqa: E402
+
+
+def test_recorded_game_is_replayed_from_its_seed(tmp_path):
+    path = str(tmp_path / 'games.bin')
+    assert simulator.record(path, 50, 5, 5, seed=3, batch_size=16) == 50
+    games = list(records.GameRecordReader(path))
+    assert len({game.seed for game in games}) == 50
+    for game in games:
+        replay = simulator.simulate(1, 5, 5, seeds=np.array([game.seed], dtype=np.uint64))
+        assert bytes(replay.moves[0, :replay.lengths[0]].astype(np.uint8)) == game.moves
+        assert int(replay.outcomes[0]) == game.result
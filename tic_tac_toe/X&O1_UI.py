@@ -1,10 +1,17 @@
-import copy
+import os
 import sys
 
 import pygame
 import time
 from typing import List, Optional
 
+# modules shared by the front-ends live in the root of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import assets  # noqa: E402
+import hud  # noqa: E402
+import metrics  # noqa: E402
+import search  # noqa: E402
+
 MAX_DEPTH = 6
 
 
@@ -20,6 +27,14 @@ class Game:
     zero_img = None
     cell_grid = []
     cell_size: int
+    # (symbol, selected) currently drawn in each cell of the grid
+    shown = []
+    # performance overlay, toggled with hud.KEY
+    performance_hud = hud.PerformanceHud()
+
+    # cell colors
+    CELL_COLOR = pygame.color.Color(255, 255, 255)  # WHITE
+    SELECTED_COLOR = pygame.color.Color(255, 0, 0)  # RED
     NO_COLUMNS = 3
     MIN_P = None
     MAX_P = None
@@ -35,52 +50,75 @@ class Game:
         # and the cell size (in pixels)
         cls.cell_size = cell_size
 
-        # <load and resize de images for X and O>
-        cls.x_img = pygame.image.load('tic_tac_toe/x_img.png')
-        cls.x_img = pygame.transform.scale(cls.x_img, (cell_size, cell_size))
-        cls.zero_img = pygame.image.load('tic_tac_toe/o_img.png')
-        cls.zero_img = pygame.transform.scale(cls.zero_img, (cell_size, cell_size))
-        # </load and resize the images for X and O>
+        # images for X and O, scaled to the cell size (cached in memory and on disk)
+        cls.x_img = assets.image('tic_tac_toe/x_img.png', (cell_size, cell_size))
+        cls.zero_img = assets.image('tic_tac_toe/o_img.png', (cell_size, cell_size))
 
         # build the actual grid via a list
         for line in range(no_columns):
             for column in range(no_columns):
                 cell = pygame.Rect(column * (cell_size + 1), line * (cell_size + 1), cell_size, cell_size)
                 cls.cell_grid.append(cell)
+        # nothing has been drawn yet
+        cls.shown = [None] * len(cls.cell_grid)
 
     @classmethod
     def adverse_player(cls, player):
         return cls.MAX_P if player == cls.MIN_P else cls.MIN_P
 
     def draw_grid(self, mark=None):
+        """
+        Draws the cells which changed since the last call into the back buffer
+        and presents them with a single display update
+
+        :param mark: index of the cell selected by the player, if any
+        """
+        cls = self.__class__
+        dirty_rects = []
         # for each index in the list of elements
         for index in range(len(self.matrix)):
-            # get the line of the element
-            line = index // 3
-            column = index % 3
-
-            if mark == index:
-                # if the line is marked i.e. selected by the player
-                # it will be marked by coloring it with red
-                color = pygame.color.Color(255, 0, 0)  # RED
-            else:
-                color = pygame.color.Color(255, 255, 255)  # WHITE
+            # what the cell should look like; skip it if it's already on screen
+            cell = (self.matrix[index], mark == index)
+            if cls.shown[index] == cell:
+                continue
+            cls.shown[index] = cell
+
+            # if the line is marked i.e. selected by the player
+            # it will be marked by coloring it with red
+            color = cls.SELECTED_COLOR if mark == index else cls.CELL_COLOR
             # draw each tile by line/index pair
-            pygame.draw.rect(self.__class__.display, color, self.__class__.cell_grid[index])
-            # pygame.draw.rect(canvas, color, element)
-            (x, y) = (column * (self.__class__.cell_size + 1), line * (self.__class__.cell_size + 1))
+            pygame.draw.rect(cls.display, color, cls.cell_grid[index])
             if self.matrix[index] == 'X':
-                self.__class__.display.blit(self.__class__.x_img, (x, y))
+                cls.display.blit(cls.x_img, cls.cell_grid[index])
             elif self.matrix[index] == 'O':
-                self.__class__.display.blit(self.__class__.zero_img, (x, y))
-            pygame.display.flip()
-            # pygame.display.flip()   := This will update the contents of the entire display
-            # pygame.display.update() := This functions is like an optimized version of pygame.flip()
-            # for software displays. It allows only a portion of the screen to be updated, instead of
-            # the entire area. If no argument is passed it updates the entire Surface like pygame.display.flip(_
-            # pygame.display.blit()
-            # TODO - research more about blit-ing
-            #  @ https://www.pygame.org/docs/ref/display.html?highlight=display#module-pygame.display
+                cls.display.blit(cls.zero_img, cls.cell_grid[index])
+            dirty_rects.append(cls.cell_grid[index])
+
+        # pygame.display.flip()   := This will update the contents of the entire display
+        # pygame.display.update() := This functions is like an optimized version of pygame.flip()
+        # for software displays. It allows only a portion of the screen to be updated, instead of
+        # the entire area.
+        if dirty_rects:
+            t_before = time.perf_counter()
+            hud_rect = cls.performance_hud.draw(cls.display)
+            if hud_rect:
+                dirty_rects.append(hud_rect)
+            pygame.display.update(dirty_rects)
+            cls.performance_hud.record_frame(time.perf_counter() - t_before)
+
+    def toggle_hud(self, mark=None):
+        """
+        :param mark: index of the cell selected by the player, if any
+        """
+        cls = self.__class__
+        if cls.performance_hud.toggle():
+            cls.performance_hud.draw(cls.display)
+        else:
+            # draw the cells, and the lines between them, under the overlay again
+            cls.display.fill((0, 0, 0))
+            cls.shown = [None] * len(cls.cell_grid)
+            self.draw_grid(mark)
+        pygame.display.flip()
 
     def final(self):
         result = self.winning_combination()
@@ -92,19 +130,28 @@ class Game:
         else:
             return False
 
-    '''
-        player
-            :param the symbol of the player who moves
-    '''
+    # search.Game protocol, a move is the index of the cell in the game matrix
+    def legal_moves(self, player) -> List[int]:
+        return [i for i in range(len(self.matrix)) if self.matrix[i] == Game.EMPTY]
+
+    def make(self, move: int, player):
+        self.matrix[move] = player
+
+    def unmake(self, move: int, player):
+        self.matrix[move] = Game.EMPTY
+
+    def terminal(self) -> bool:
+        return bool(self.final())
 
-    def moves(self, player) -> List:
-        l_moves = []
-        for i in range(len(self.matrix)):
-            if self.matrix[i] == Game.EMPTY:
-                copy_matrix = copy.deepcopy(self.matrix)
-                copy_matrix[i] = player
-                l_moves.append(Game(copy_matrix))
-        return l_moves
+    def evaluate(self, player, depth: int):
+        return self.estimate_score(depth)
+
+    def forced_estimation(self, player, depth: int):
+        # every move can still change the outcome
+        return None
+
+    def position_key(self, player):
+        return tuple(self.matrix), player
 
     '''
         open_line means a line which can still be used to get a win
@@ -168,12 +215,10 @@ class Game:
 
 class GameState:
     """
-        Class used by minmax and alpha-beta algorithms;
-        one instance of this class represents a node from the minmax tree;
-        It stores the state of the game matrix
+        One node of the game: the game matrix and the player to move;
+        min_max and alpha_beta set the estimation of the node and the
+        state reached by the best move (chosen_state)
         Its condition to be run is for the Game Class to have MIN_P & MAX_P initialized
-        it also requires Game Class to implement a function called moves which
-        returns a list with the possible configurations after ones turn
     """
 
     def __init__(self, game_matrix: Game, current_player, depth: int, parent=None, estimation=None):
@@ -188,22 +233,21 @@ class GameState:
         # or of the best child move for the current player
         self.estimation = estimation
 
-        # list of possible moves
-        self.possible_moves = []
-
-        # best move for the current player chosen from the list of possible moves
+        # best move for the current player
         # of type GameState
         self.chosen_state: Optional[GameState] = None
 
-    def moves(self):
-        # list of possible moves generated from moves method
-        # from class Game
-        l_moves = self.game_matrix.moves(self.current_player)
-        adverse_player = Game.adverse_player(self.current_player)
-
-        # create a new possible game state object from each possible move
-        l_state_moves = [GameState(move, adverse_player, self.depth - 1, parent=self) for move in l_moves]
-        return l_state_moves
+    def choose(self, result: search.SearchResult):
+        """
+        Sets the estimation and the chosen state from the result of a search
+        """
+        self.estimation = result.estimation
+        if result.move is not None:
+            matrix = list(self.game_matrix.matrix)
+            matrix[result.move] = self.current_player
+            self.chosen_state = GameState(Game(matrix), Game.adverse_player(self.current_player), self.depth - 1,
+                                          parent=self, estimation=result.estimation)
+        return self
 
     def __str__(self):
         s = f'{str(self.game_matrix)} (Current player {self.current_player})\n'
@@ -211,79 +255,31 @@ class GameState:
 
 
 def min_max(state: GameState) -> GameState:
-    # if leaf level has been reached or a final state has been met
-    if state.depth == 0 or state.game_matrix.final():
-        state.estimation = state.game_matrix.estimate_score(state.depth)
-        return state
-
-    # compute all possible moves from the current state
-    state.possible_moves = state.moves()
-
-    # apply min_max algorithm on each of the possible
-    # moves in order to create every possible subtree
-    estimated_moves = [min_max(move) for move in state.possible_moves]
-
-    if state.current_player == Game.MAX_P:
-        # pick the state with the max estimation
-        # if the current player is MAX_P i.e. the player
-        # tries to maximize
-        state.chosen_state = max(estimated_moves, key=lambda x: x.estimation)
-    else:
-        # pick the state with the min estimation
-        # if the current player is MIN_P i.e. the player
-        # tries to minimize
-        state.chosen_state = min(estimated_moves, key=lambda x: x.estimation)
-
-    # set the estimation for the state accordingly
-    state.estimation = state.chosen_state.estimation
-    return state
-
-
-def alpha_beta(alpha: int, beta: int, state: GameState) -> GameState:
-    # if leaf level has been reached or a final state has been met
-    if state.depth == 0 or state.game_matrix.final():
-        state.estimation = state.game_matrix.estimate_score(state.depth)
-        return state
-
-    # if it is in a valid interval than processing is no longer needed
-    if alpha > beta:
-        return state
-
-    state.possible_moves = state.moves()
-
-    if state.current_player == Game.MAX_P:
-        current_estimation = float('-inf')
-
-        for move in state.possible_moves:
-            # compute the estimation for the new state by building the subtree
-            # subtree for the new state
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation < new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if alpha < new_state.estimation:
-                alpha = new_state.estimation
-                # invalid interval since alpha should always be less than beta
-                if alpha >= beta:
-                    break
-
-    elif state.current_player == Game.MIN_P:
-        current_estimation = float('inf')
-
-        for move in state.possible_moves:
-            new_state = alpha_beta(alpha, beta, move)
-
-            if current_estimation > new_state.estimation:
-                state.chosen_state = new_state
-                current_estimation = new_state.estimation
-            if beta > new_state.estimation:
-                beta = new_state.estimation
-                if alpha >= beta:
-                    break
-
-    state.estimation = state.chosen_state.estimation
-    return state
+    # MAX_P picks the move with the max estimation, MIN_P the one with the min estimation
+    return state.choose(search.min_max(state.game_matrix, state.current_player, state.depth, Game.MAX_P))
+
+
+def alpha_beta(alpha: int, beta: int, state: GameState, table: Optional[dict] = None) -> GameState:
+    """
+    :param table: optional transposition table (dict) shared between searches; a
+    search.SearchTree kept for the game is continued from the search of the previous move
+    """
+    if isinstance(table, search.SearchTree):
+        ply = sum(symbol != Game.EMPTY for symbol in state.game_matrix.matrix)
+        return state.choose(search.deepening(state.game_matrix, state.current_player, state.depth, Game.MAX_P,
+                                             ply, table, alpha, beta))
+    return state.choose(search.alpha_beta(state.game_matrix, state.current_player, state.depth, Game.MAX_P,
+                                          alpha, beta, table))
+
+
+def top_moves(k: int, state: GameState, table: Optional[dict] = None) -> List[search.Variation]:
+    """
+    :return: the k best moves of the current player (at most), each with its estimation and
+    principal variation of (line, column) moves, found by a single alpha-beta search
+    """
+    variations = search.multi_pv(state.game_matrix, state.current_player, state.depth, Game.MAX_P, k, table)
+    return [search.Variation(variation.estimation, [divmod(move, Game.NO_COLUMNS) for move in variation.moves])
+            for variation in variations]
 
 
 def print_if_final(current_state: GameState):
@@ -298,6 +294,23 @@ def print_if_final(current_state: GameState):
     return False
 
 
+def record_game(current_state: GameState):
+    final = current_state.game_matrix.final()
+    metrics.record_game(metrics.TIC_TAC_TOE, Game.NO_COLUMNS, Game.NO_COLUMNS, 'draw' if final == 'DRAW' else final)
+
+
+def wait_events(timeout: int = 0) -> list:
+    """
+    Blocks (without using the CPU) until an event arrives or timeout milliseconds pass
+
+    :param timeout: 0 to wait forever
+    :return: all the pending events
+    """
+    event = pygame.event.wait(timeout)
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
+
+
 def main():
     valid_response = False
     line = -1
@@ -325,6 +338,11 @@ def main():
 
     # create initial state
     current_state = GameState(game_matrix=current_board, current_player='X', depth=MAX_DEPTH)
+    # the tree searched by alpha_beta is kept from one move to the next (SEARCH_TREE_MB caps it)
+    tree = search.SearchTree()
+
+    # latency of the moves and counters, for METRICS_FILE / METRICS_PORT
+    exporter = metrics.exporter_from_env()
 
     # pygame functionality initialized
     pygame.init()
@@ -332,14 +350,20 @@ def main():
     # two more pixels for each line
     canvas = pygame.display.set_mode(size=(302, 302))
     Game.init(canvas)
+    current_state.game_matrix.draw_grid()
 
     to_move = [-1, -1]
     while True:
         if current_state.current_player == Game.MIN_P:
-            for event in pygame.event.get():
+            # sleep until the player does something
+            for event in wait_events():
                 if event.type == pygame.QUIT:
+                    metrics.close_exporter(exporter)
                     pygame.quit()
                     sys.exit()
+                # F3 shows / hides the performance overlay
+                elif event.type == pygame.KEYDOWN and event.key == hud.KEY:
+                    current_state.game_matrix.toggle_hud(None if to_move == [-1, -1] else to_move[0] * 3 + to_move[1])
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     # get the position of the click
                     cursor_pos = pygame.mouse.get_pos()
@@ -373,6 +397,7 @@ def main():
                             current_state.game_matrix.draw_grid()
                             # test if the move has ended the game
                             if print_if_final(current_state):
+                                record_game(current_state)
                                 break
 
                             # switch the player with the other
@@ -380,26 +405,34 @@ def main():
         # MAX_P player, i.e. the computer
         else:
             t_before = time.time()
+            Game.performance_hud.begin_move()
+            token = metrics.begin_move()
             if algorithm_type == '1':
                 actualised_state = min_max(current_state)
             else:
-                actualised_state = alpha_beta(-500, 500, current_state)
+                actualised_state = alpha_beta(-500, 500, current_state, tree)
+            metrics.record_move(metrics.end_move(token, metrics.TIC_TAC_TOE, Game.NO_COLUMNS, Game.NO_COLUMNS,
+                                                 current_state.depth,
+                                                 'min_max' if algorithm_type == '1' else 'alpha_beta'))
+            Game.performance_hud.end_move(current_state.depth)
             current_state.game_matrix = actualised_state.chosen_state.game_matrix
 
             current_state.game_matrix.draw_grid()
             t_after = time.time()
             print(f'=== Computing took: {t_after - t_before} ===')
             if print_if_final(current_state):
+                record_game(current_state)
                 break
 
             current_state.current_player = Game.adverse_player(current_state.current_player)
 
+    metrics.close_exporter(exporter)
+
 
 if __name__ == '__main__':
     main()
     while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+        if pygame.event.wait().type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
 